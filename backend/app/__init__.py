@@ -1,17 +1,60 @@
 # app/__init__.py
-from flask import Flask
+import logging
+import re
+import time
+import uuid
+
+from flask import Flask, g, request
 from flask_cors import CORS
-from backend.utils.config import API_HOST, API_PORT
+from backend.utils.config import (API_HOST, API_PORT, LOG_LEVEL, LOG_FORMAT,
+                                  LOG_DEBUG_SAMPLE_RATE, LOG_QUEUE_SIZE)
+from backend.utils.logging_setup import setup_logging, set_request_id, reset_request_id
+
+logger = logging.getLogger("backend.access")
+
+# Client-supplied request ids are echoed back, so only accept plain tokens
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
 
 def create_app():
     """
     Create and configure the Flask application
     """
+    # Before the routes import, so model loading is logged the same way
+    setup_logging(LOG_LEVEL, json_format=LOG_FORMAT != "text",
+                  debug_sample_rate=LOG_DEBUG_SAMPLE_RATE, queue_size=LOG_QUEUE_SIZE)
+    
     app = Flask(__name__)
     
-    CORS(app)
+    CORS(app, expose_headers=["X-Request-ID"])
+    
+    @app.before_request
+    def assign_request_id():
+        request_id = request.headers.get("X-Request-ID", "")
+        if not REQUEST_ID_PATTERN.match(request_id):
+            request_id = uuid.uuid4().hex
+        g.request_id = request_id
+        g.request_start = time.perf_counter()
+        g.request_id_token = set_request_id(request_id)
+    
+    @app.after_request
+    def log_request(response):
+        response.headers["X-Request-ID"] = g.get("request_id", "")
+        if "request_start" in g:
+            logger.info(f"{request.method} {request.path} {response.status_code}", extra={
+                "method": request.method,
+                "path": request.path,
+                "status": response.status_code,
+                "duration_ms": round((time.perf_counter() - g.request_start) * 1000, 2)
+            })
+        return response
+    
+    @app.teardown_request
+    def clear_request_id(exc):
+        token = g.pop("request_id_token", None)
+        if token is not None:
+            reset_request_id(token)
     
     from backend.app.routes import api
     app.register_blueprint(api)
     
-    return app 
\ No newline at end of file
+    return app
@@ -1,18 +1,22 @@
 # model.py
-import timm
 import torch
 import torch.nn.functional as F
-from torchvision import transforms
-from PIL import Image
-import google.generativeai as genai
 import tempfile
+import logging
 import os
+import time
 from pathlib import Path
 from datetime import datetime
 
-from backend.utils.config import MODEL_PATH, GEMINI_API_KEY, TEMP_DIR
+from backend.utils.config import (MODEL_PATH, MODEL_ARCH, MODEL_VERSION, TEMP_DIR, INFERENCE_PROFILE,
+                                  INFERENCE_THREADS, INFERENCE_WARMUP_RUNS, KNOWLEDGE_BASE_PATH,
+                                  RECOMMENDATION_PROVIDER, RECOMMENDATION_CACHE_PATH)
 from backend.utils.report_generator import generate_report
+from backend.app.recommendations import create_provider
 
+logger = logging.getLogger(__name__)
+
+# Classes of the cassava model; other crops list theirs in CROP_MODELS_PATH
 class_names = {
     0: "Cassava Bacterial Blight (CBB)",
     1: "Cassava Brown Streak Disease (CBSD)",
@@ -21,27 +25,84 @@ class_names = {
     4: "Healthy"
 }
 
+# CPU inference profiles selectable with INFERENCE_PROFILE. All of them run
+# under torch.inference_mode and are warmed up at load.
+#   channels_last: NHWC weights and inputs, the layout oneDNN convolutions prefer
+#   compile: torch.compile the forward pass (fuses ops into generated kernels)
+#   bf16: bfloat16 autocast, used only on CPUs with native bf16 support
+INFERENCE_PROFILES = {
+    "standard": {},
+    "channels_last": {"channels_last": True},
+    "compiled": {"channels_last": True, "compile": True},
+    "bf16": {"channels_last": True, "bf16": True},
+    "compiled-bf16": {"channels_last": True, "compile": True, "bf16": True},
+}
+
+def cpu_supports_bf16():
+    """True if the CPU has native bfloat16 instructions (AVX512-BF16 or AMX)"""
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return torch.backends.mkldnn.is_available() and ("avx512_bf16" in flags or "amx_bf16" in flags)
+
 class CropDiseaseModel:
-    def __init__(self):
+    def __init__(self, model_path=None, enable_gemini=True, profile=None, crop="cassava", classes=None,
+                 arch=None, knowledge_base=KNOWLEDGE_BASE_PATH, recommendation_cache=RECOMMENDATION_CACHE_PATH):
+        """
+        Args:
+            model_path (str): Checkpoint; None searches the MODEL_PATH locations
+            enable_gemini (bool): False consults only the local knowledge base
+            profile (str): Name from INFERENCE_PROFILES (default: INFERENCE_PROFILE)
+            crop (str): Crop the model diagnoses
+            classes (list): Class names in output order (default: the cassava classes)
+            arch (str): timm architecture, overriding the checkpoint metadata and MODEL_ARCH
+            knowledge_base (str): Knowledge base JSON for this crop, or None
+            recommendation_cache (str): File for the crop's fetched Gemini texts
+        """
         self.model = None
         self.transform = None
+        self.model_path = model_path
+        self.model_version = None
+        self.crop = crop
+        self.class_names = dict(enumerate(classes)) if classes else dict(class_names)
+        self.class_indexes = {name: index for index, name in self.class_names.items()}
+        self.arch = arch
+        self.embedding_dim = None
+        self.profile = profile or INFERENCE_PROFILE
         self.initialize_model()
-        self.initialize_gemini()
+        self.configure_inference(self.profile)
+        # Without Gemini only the local knowledge base is consulted
+        self.recommendations = create_provider(RECOMMENDATION_PROVIDER if enable_gemini else "local", crop=crop,
+                                               knowledge_base=knowledge_base, cache_path=recommendation_cache)
         
     def initialize_model(self):
         """Initialize the PyTorch model"""
-        self.model = timm.create_model("rexnet_150", 
-                                     pretrained=False, 
-                                     num_classes=len(class_names))
+        # timm and torchvision take seconds to import; tools that only need
+        # class_names or INFERENCE_PROFILES from this module skip them
+        import timm
+        from torchvision import transforms
         
         model_file = self._find_model_file()
+        self.arch = self.arch or self._model_arch(model_file)
+        self.model = timm.create_model(self.arch, 
+                                     pretrained=False, 
+                                     num_classes=len(self.class_names))
         
         try:
-            checkpoint = torch.load(model_file, map_location=torch.device('cpu'))
-            state_dict = {k.replace("module.", ""): v for k, v in checkpoint.items()}
-            self.model.load_state_dict(state_dict)
+            start = time.perf_counter()
+            state_dict, mapped = self._load_state_dict(model_file)
+            # assign=True keeps the memory-mapped tensors instead of copying them
+            # into freshly allocated parameters, so workers share the page cache
+            self.model.load_state_dict(state_dict, assign=mapped)
             self.model.eval()
-            print(f"Model loaded successfully from {model_file}")
+            # Width of the pooled features returned with each prediction; some
+            # timm heads widen them past num_features before the classifier
+            self.embedding_dim = getattr(self.model, "head_hidden_size", None) or self.model.num_features
+            self.model_version = MODEL_VERSION or os.path.splitext(os.path.basename(model_file))[0]
+            elapsed = time.perf_counter() - start
+            logger.info(f"Model ({self.arch}) loaded successfully from {model_file} in {elapsed:.2f}s")
         except Exception as e:
             raise RuntimeError(f"Failed to load model: {str(e)}")
             
@@ -52,10 +113,115 @@ class CropDiseaseModel:
                                 std=[0.229, 0.224, 0.225])
         ])
     
+    def configure_inference(self, profile):
+        """
+        Apply a CPU inference profile and warm the model up.
+        
+        Args:
+            profile (str): Name from INFERENCE_PROFILES
+        """
+        if profile not in INFERENCE_PROFILES:
+            raise ValueError(f"Unknown inference profile {profile!r}; "
+                             f"choose one of {', '.join(INFERENCE_PROFILES)}")
+        options = INFERENCE_PROFILES[profile]
+        
+        if INFERENCE_THREADS > 0:
+            torch.set_num_threads(INFERENCE_THREADS)
+        
+        self._channels_last = options.get("channels_last", False)
+        if self._channels_last:
+            # Conv weights are copied into NHWC layout, so they no longer
+            # share the memory-mapped checkpoint pages
+            self.model = self.model.to(memory_format=torch.channels_last)
+        
+        self._bf16 = options.get("bf16", False)
+        if self._bf16 and not cpu_supports_bf16():
+            logger.warning("This CPU has no native bfloat16 support; running in float32")
+            self._bf16 = False
+        
+        self._model_fn = self._run_model
+        if options.get("compile", False):
+            self._model_fn = torch.compile(self._run_model)
+        
+        start = time.perf_counter()
+        try:
+            self.warmup()
+        except Exception as e:
+            if self._model_fn is self._run_model:
+                raise
+            logger.warning(f"torch.compile failed, falling back to eager mode: {str(e)}")
+            self._model_fn = self._run_model
+            self.warmup()
+        logger.info(f"Inference profile '{profile}' ready ({torch.get_num_threads()} threads, "
+                    f"warmup {time.perf_counter() - start:.2f}s)")
+    
+    def warmup(self, runs=INFERENCE_WARMUP_RUNS):
+        """Run dummy batches so lazy initialization and compilation happen before the first request"""
+        dummy = torch.zeros(1, 3, 224, 224)
+        for _ in range(max(1, runs)):
+            self._forward(dummy)
+    
+    def _model_arch(self, model_file):
+        """Architecture recorded in a safetensors file's metadata, else MODEL_ARCH"""
+        if model_file.endswith(".safetensors"):
+            from safetensors import safe_open
+            with safe_open(model_file, framework="pt") as f:
+                metadata = f.metadata() or {}
+            if metadata.get("arch"):
+                return metadata["arch"]
+        return MODEL_ARCH
+
+    def _load_state_dict(self, model_file):
+        """Load a state dict, memory-mapping it when the file is in safetensors format"""
+        if model_file.endswith(".safetensors"):
+            from safetensors.torch import load_file
+            # Keys were already normalized by backend.tools.convert_checkpoint
+            return load_file(model_file, device="cpu"), True
+
+        checkpoint = torch.load(model_file, map_location=torch.device('cpu'))
+        return {k.replace("module.", ""): v for k, v in checkpoint.items()}, False
+
+    def _prefer_safetensors(self, path):
+        """Return the converted safetensors sibling of a checkpoint if it was converted from this checkpoint"""
+        path = str(path)
+        if path.endswith(".safetensors"):
+            return path
+        converted = os.path.splitext(path)[0] + ".safetensors"
+        if not os.path.exists(converted):
+            return path
+        if self._converted_from(converted, path):
+            return converted
+        logger.warning(f"{converted} was not converted from the current {path}; loading the checkpoint instead. "
+                       f"Re-run backend.tools.convert_checkpoint to serve it memory-mapped again")
+        return path
+
+    @staticmethod
+    def _converted_from(converted, source):
+        """Whether a safetensors file was converted from the source checkpoint as it is now"""
+        from safetensors import safe_open
+        with safe_open(converted, framework="pt") as f:
+            metadata = f.metadata() or {}
+        stat = os.stat(source)
+        if "source_sha256" not in metadata:
+            # Converted before the source was recorded: only the file times can tell
+            return os.path.getmtime(converted) >= stat.st_mtime
+        if metadata.get("source_size") != str(stat.st_size):
+            return False
+        if metadata.get("source_mtime_ns") == str(stat.st_mtime_ns):
+            return True
+        # Copies and checkouts change the time but not the content
+        from backend.tools.convert_checkpoint import file_sha256
+        return file_sha256(source) == metadata["source_sha256"]
+
     def _find_model_file(self):
         """Search for the model file in multiple possible locations"""
+        if self.model_path:
+            if not os.path.exists(self.model_path):
+                raise FileNotFoundError(f"Model file not found: {self.model_path}")
+            return self._prefer_safetensors(self.model_path)
+
         if os.path.exists(MODEL_PATH):
-            return MODEL_PATH
+            return self._prefer_safetensors(MODEL_PATH)
             
         base_dir = Path(__file__).parent.parent
         possible_paths = [
@@ -67,107 +233,144 @@ class CropDiseaseModel:
         
         for path in possible_paths:
             if path.exists():
-                return str(path)
+                return self._prefer_safetensors(path)
              
-        print(f"ERROR: Model file not found. Searched in these locations:")
-        print(f"- {MODEL_PATH}")
-        for path in possible_paths:
-            print(f"- {path}")
-        print("Please place the model file in one of these locations or update MODEL_PATH in .env")
+        searched = "\n".join(f"- {path}" for path in [MODEL_PATH, *possible_paths])
+        logger.error(f"Model file not found. Searched in these locations:\n{searched}\n"
+                     "Please place the model file in one of these locations or update MODEL_PATH in .env")
                 
         raise FileNotFoundError("Could not find model file. Please check MODEL_PATH setting.")
     
-    def initialize_gemini(self):
-        """Initialize Google Gemini API connection"""
-        if not GEMINI_API_KEY:
-            print("Warning: No Gemini API key provided. Recommendations will use fallback mechanism.")
-            self.gemini_model = None
-            return
-        
-        try:
-            genai.configure(api_key=GEMINI_API_KEY)
-            self.gemini_model = genai.GenerativeModel('gemini-1.5-pro')
-            test_response = self.gemini_model.generate_content("Hello")
-            print("Gemini API initialized successfully")
-        except Exception as e:
-            print(f"Warning: Failed to initialize Gemini API: {str(e)}")
-            print("Recommendations will use fallback mechanism")
-            self.gemini_model = None
-    
     def preprocess_image(self, image):
         """Preprocess image for model input"""
         return image.convert("RGB")
         
-    def predict(self, image):
-        """Predict disease from image"""
+    def _run_model(self, img_tensors):
+        features = self.model.forward_features(img_tensors)
+        embeddings = self.model.forward_head(features, pre_logits=True)
+        outputs = self.model.get_classifier()(embeddings)
+        return outputs, embeddings, features
+    
+    def _forward(self, img_tensors, return_features=False):
+        """
+        Run the model once, returning class probabilities and pooled features
+        
+        With return_features=True the final-stage activation map (N x C x h x w,
+        float32) is returned as well, for Grad-CAM without a second forward pass.
+        """
+        with torch.inference_mode():
+            if self._channels_last:
+                img_tensors = img_tensors.contiguous(memory_format=torch.channels_last)
+            with torch.autocast("cpu", dtype=torch.bfloat16, enabled=self._bf16):
+                outputs, embeddings, features = self._model_fn(img_tensors)
+            probabilities = F.softmax(outputs.float(), dim=1)
+        if return_features:
+            return probabilities, embeddings.float(), features.float()
+        return probabilities, embeddings.float()
+
+    def predict(self, image, return_embedding=False, return_activations=False):
+        """
+        Predict disease from image
+
+        With return_embedding=True the penultimate-layer feature vector from
+        the same forward pass is returned as a third element (float32 numpy array).
+        With return_activations=True the final-stage activation map of that pass
+        (1 x C x h x w tensor) is appended as well, for a later grad_cam call.
+        """
         try:
             rgb_image = self.preprocess_image(image)
             
             img_tensor = self.transform(rgb_image).unsqueeze(0)
 
-            with torch.no_grad():
-                outputs = self.model(img_tensor)
-                probabilities = F.softmax(outputs, dim=1)
+            probabilities, embeddings, features = self._forward(img_tensor, return_features=True)
             
             confidence, pred_idx = torch.max(probabilities, 1)
-            return class_names[pred_idx.item()], confidence.item() * 100
+            result = (self.class_names[pred_idx.item()], confidence.item() * 100)
+            if return_embedding:
+                result += (embeddings[0].numpy(),)
+            if return_activations:
+                result += (features,)
+            return result
             
         except Exception as e:
             raise RuntimeError(f"Prediction failed: {str(e)}")
-    
-    def get_recommendation(self, disease_name):
-        """Get treatment recommendations from Gemini AI"""
-        if not self.gemini_model:
-            if disease_name == "Healthy":
-                return """- Maintain proper watering schedule (not too wet or dry)
-- Apply balanced NPK fertilizer as recommended for cassava
-- Keep the area around plants free of weeds
-- Inspect plants weekly for early signs of pests or disease
-- Ensure proper spacing between plants for good air circulation
-
-Monitor for:
-- Yellow discoloration of leaves
-- Unusual spots or lesions
-- Presence of insects or mites"""
-            else:
-                return f"""For {disease_name}:
-- Immediately remove and destroy severely affected plants
-- Apply copper-based fungicide (2g/liter) for bacterial diseases or appropriate fungicide for fungal diseases
-- Ensure proper field drainage
-- Use clean, disease-free planting material for new plantings
-- Maintain proper spacing between plants for good air circulation
-- Consider crop rotation if disease is persistent"""
-        
-        if disease_name == "Healthy":
-            prompt = """As a cassava agricultural expert, list:
-            - 5 essential maintenance practices for healthy cassava
-            - 3 early signs of disease to monitor
-            - Ideal soil/weather conditions
-            Format as bullet points without markdown."""
-        else:
-            prompt = f"""As a cassava disease specialist, create a treatment plan for {disease_name}:
-            - First emergency steps
-            - Approved chemical treatments (specify dosage)
-            - Organic alternatives
-            - Cultural control methods
-            Use bullet points, avoid technical jargon."""
 
+    def predict_batch(self, img_tensors, return_embeddings=False):
+        """Predict diseases for a batch of images already passed through self.transform"""
         try:
-            response = self.gemini_model.generate_content(
-                prompt,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=0.3 
-                )
-            )
-            return response.text.replace("•", "-")
+            probabilities, embeddings = self._forward(img_tensors)
+
+            confidences, pred_idxs = torch.max(probabilities, 1)
+            results = [(self.class_names[idx], conf * 100)
+                       for idx, conf in zip(pred_idxs.tolist(), confidences.tolist())]
+            if return_embeddings:
+                return results, embeddings.numpy()
+            return results
+
+        except Exception as e:
+            raise RuntimeError(f"Batch prediction failed: {str(e)}")
+    
+    def predict_probabilities(self, images):
+        """
+        Class probabilities for several images, run as one batch
+        
+        Args:
+            images: PIL images, or an N x 3 x H x W tensor already passed through self.transform
+        
+        Returns:
+            numpy.ndarray: N x num_classes float32 array, rows in the order of ``images``
+        """
+        try:
+            if isinstance(images, torch.Tensor):
+                img_tensors = images
+            else:
+                img_tensors = torch.stack([self.transform(self.preprocess_image(image)) for image in images])
+            probabilities, _ = self._forward(img_tensors)
+            return probabilities.numpy()
         except Exception as e:
-            print(f"Error generating advice with Gemini: {str(e)}")
-            return self.get_recommendation(None)
+            raise RuntimeError(f"Batch prediction failed: {str(e)}")
     
-    def generate_full_report(self, image, disease, confidence, recommendation):
-        """Generate a complete PDF report"""
+    def grad_cam(self, activations, class_index):
+        """
+        Grad-CAM heatmap from activations retained by predict
+        
+        Only the classifier head runs again (pooling and the final layer), with
+        one backward pass to get the gradient of the class score with respect
+        to the activation map; the convolutional trunk is not re-run.
+        
+        Args:
+            activations (torch.Tensor): 1 x C x h x w map from predict(..., return_activations=True)
+            class_index (int): Class whose evidence is shown, normally the predicted one
+            
+        Returns:
+            numpy.ndarray: h x w heatmap scaled to [0, 1]
+        """
+        with torch.enable_grad():
+            # A clone outside inference mode is an ordinary tensor autograd can track
+            features = activations.clone().requires_grad_(True)
+            score = self.model.forward_head(features)[0, class_index]
+            gradients, = torch.autograd.grad(score, features)
+        weights = gradients.mean(dim=(2, 3), keepdim=True)
+        cam = F.relu((weights * features.detach()).sum(dim=1))[0]
+        peak = cam.max()
+        if peak > 0:
+            cam = cam / peak
+        return cam.numpy()
+    
+    def memory_bytes(self):
+        """Bytes held by the weights and buffers, the model's share of a memory budget"""
+        tensors = list(self.model.parameters()) + list(self.model.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+    
+    def get_recommendation(self, disease_name):
+        """Get treatment recommendations from the configured provider"""
+        return self.recommendations.get_recommendation(disease_name)
+    
+    def generate_full_report(self, image, disease, confidence, recommendation, overlay=None, report_date=None):
+        """Generate a complete PDF report, with an optional Grad-CAM overlay image and fixed diagnosis date"""
         try:
             temp_file = None
+            overlay_file = None
             
             recommendation_copy = recommendation
             
@@ -179,36 +382,52 @@ Monitor for:
                     temp_file = tmp.name
                     image.save(temp_file, "JPEG", quality=95)
                     
-                print(f"Saved image to temporary file: {temp_file}")
-                print(f"Starting PDF generation process...")
+                logger.debug(f"Saved image to temporary file: {temp_file}")
+                
+                if overlay is not None:
+                    with tempfile.NamedTemporaryFile(delete=False, suffix=f"_{timestamp}_cam.jpg",
+                                                     dir=TEMP_DIR) as tmp:
+                        overlay_file = tmp.name
+                        overlay.convert("RGB").save(overlay_file, "JPEG", quality=90)
                 
                 pdf_base64 = generate_report(
                     temp_file,
                     disease,
                     confidence,
-                    recommendation_copy
+                    recommendation_copy,
+                    overlay_path=overlay_file,
+                    report_date=report_date
                 )
                 
                 return pdf_base64
                 
             except Exception as e:
-                print(f"Error in report generation: {str(e)}")
-                import traceback
-                print(traceback.format_exc())
+                logger.error(f"Error in report generation: {str(e)}", exc_info=True)
                 raise RuntimeError(f"Failed to generate report: {str(e)}")
                 
             finally:
-                if temp_file and os.path.exists(temp_file):
-                    try:
-                        os.unlink(temp_file)
-                        print(f"Cleaned up temporary file: {temp_file}")
-                    except Exception as e:
-                        print(f"Warning: Could not clean up temporary file {temp_file}: {str(e)}")
+                for path in (temp_file, overlay_file):
+                    if path and os.path.exists(path):
+                        try:
+                            os.unlink(path)
+                            logger.debug(f"Cleaned up temporary file: {path}")
+                        except Exception as e:
+                            logger.warning(f"Could not clean up temporary file {path}: {str(e)}")
                         
         except Exception as e:
-            print(f"Error in report generation process: {str(e)}")
-            import traceback
-            print(traceback.format_exc())
+            # Already logged with its traceback above
             raise RuntimeError(f"Report generation failed: {str(e)}")
 
-model_instance = CropDiseaseModel() 
\ No newline at end of file
+def get_model_instance():
+    """Return the default crop's model from the shared model pool, loading it on first use"""
+    from backend.app.model_pool import get_model_pool
+    pool = get_model_pool()
+    return pool.get(pool.default_crop)
+
+def __getattr__(name):
+    # Build the shared instance lazily so tools can import CropDiseaseModel
+    # without loading weights or contacting Gemini at import time
+    if name == "model_instance":
+        return get_model_instance()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+ 
\ No newline at end of file
@@ -0,0 +1,306 @@
+# model_pool.py
+"""
+Pool of crop-specific disease models.
+
+Each crop the API serves (cassava, maize, tomato, ...) has its own
+checkpoint, class list and knowledge base, listed in the JSON file named by
+CROP_MODELS_PATH:
+
+    {
+      "default": "cassava",
+      "crops": {
+        "cassava": {"model_path": "crop_best_model.safetensors"},
+        "maize": {"model_path": "maize.safetensors",
+                  "classes": ["Common Rust", "Gray Leaf Spot", "Northern Leaf Blight", "Healthy"]}
+      }
+    }
+
+Optional keys per crop: ``arch`` (timm architecture, when the checkpoint does
+not record one), ``classes`` (in output order; default: the cassava classes),
+``knowledge_base`` (default: ``<crop>.json`` next to KNOWLEDGE_BASE_PATH, if
+it exists), ``profile`` (inference profile) and ``pinned`` (never evicted;
+default: true for the default crop only). Relative paths are relative to the
+JSON file. Without CROP_MODELS_PATH, MODEL_PATH is served as the only crop,
+DEFAULT_CROP.
+
+Models load on first use. While the loaded models exceed
+MODEL_POOL_MEMORY_MB, the least recently used one that is neither pinned nor
+serving a request is dropped, and loads again when its crop is next asked for.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+from backend.app.model import CropDiseaseModel, class_names
+from backend.utils.config import (CROP_MODELS_PATH, DEFAULT_CROP, MODEL_POOL_MEMORY_MB,
+                                  KNOWLEDGE_BASE_PATH, RECOMMENDATION_CACHE_PATH)
+
+logger = logging.getLogger(__name__)
+
+
+def load_crop_specs(path=CROP_MODELS_PATH, default_crop=DEFAULT_CROP):
+    """
+    Read the crop model configuration.
+
+    Args:
+        path (str): JSON file described in the module docstring, or "" for MODEL_PATH alone
+        default_crop (str): Crop used when the file names none, or the name of the single crop
+
+    Returns:
+        tuple: (specs, default crop), where specs maps each crop to its model settings
+
+    Raises:
+        ValueError: If the file lists no crops, a crop has no model_path or the default is not listed
+    """
+    if not path:
+        return {default_crop: {
+            "model_path": None,
+            "arch": None,
+            "classes": None,
+            "profile": None,
+            "knowledge_base": KNOWLEDGE_BASE_PATH,
+            "recommendation_cache": RECOMMENDATION_CACHE_PATH,
+            "pinned": True,
+        }}, default_crop
+
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(path))
+    crops = data.get("crops") or {}
+    if not crops:
+        raise ValueError(f"No crops listed in {path}")
+    default = str(data.get("default", default_crop)).strip().lower()
+
+    def resolve(value):
+        return value if value is None or os.path.isabs(value) else os.path.join(base_dir, value)
+
+    specs = {}
+    for name, entry in crops.items():
+        crop = name.strip().lower()
+        if not entry.get("model_path"):
+            raise ValueError(f"Crop {crop!r} in {path} has no model_path")
+
+        knowledge_base = resolve(entry.get("knowledge_base"))
+        if knowledge_base is None:
+            candidate = os.path.join(os.path.dirname(KNOWLEDGE_BASE_PATH), f"{crop}.json")
+            if os.path.exists(candidate):
+                knowledge_base = candidate
+            elif crop == default:
+                knowledge_base = KNOWLEDGE_BASE_PATH
+        # The default crop keeps the file fetched texts were saved to before crops existed
+        stem, ext = os.path.splitext(RECOMMENDATION_CACHE_PATH)
+        recommendation_cache = RECOMMENDATION_CACHE_PATH if crop == default else f"{stem}-{crop}{ext}"
+
+        specs[crop] = {
+            "model_path": resolve(entry["model_path"]),
+            "arch": entry.get("arch"),
+            "classes": list(entry["classes"]) if entry.get("classes") else None,
+            "profile": entry.get("profile"),
+            "knowledge_base": knowledge_base,
+            "recommendation_cache": recommendation_cache,
+            "pinned": bool(entry.get("pinned", crop == default)),
+        }
+    if default not in specs:
+        raise ValueError(f"Default crop {default!r} is not listed in {path}")
+    return specs, default
+
+
+def _build_model(crop, spec):
+    return CropDiseaseModel(model_path=spec["model_path"], profile=spec["profile"], crop=crop,
+                            classes=spec["classes"], arch=spec["arch"], knowledge_base=spec["knowledge_base"],
+                            recommendation_cache=spec["recommendation_cache"])
+
+
+class ModelPool:
+    """Crop models loaded on first use and evicted least recently used first under a memory budget"""
+
+    def __init__(self, specs, default_crop, memory_budget_mb=0, factory=_build_model):
+        """
+        Args:
+            specs (dict): Crop to model settings, from ``load_crop_specs``
+            default_crop (str): Crop of requests that do not name one
+            memory_budget_mb (float): Budget for the loaded models' weights (0: no limit)
+            factory (callable): ``factory(crop, spec)`` returns a loaded ``CropDiseaseModel``
+        """
+        self.specs = specs
+        self.default_crop = default_crop
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self._factory = factory
+        self._lock = threading.Lock()
+        # One loader per crop at a time; other crops load in parallel
+        self._load_locks = {crop: threading.Lock() for crop in specs}
+        # crop -> {"model", "bytes", "in_use", "last_used"}, least recently used first
+        self._models = OrderedDict()
+        self._ever_loaded = set()
+        self._load_seconds = {}
+        self._evictions_by_crop = Counter()
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.reloads = 0
+        self.load_failures = 0
+        self.evictions = 0
+
+    @property
+    def crops(self):
+        return sorted(self.specs)
+
+    def classes(self, crop):
+        """Class names of a crop's model, without loading it"""
+        return self.specs[crop]["classes"] or [class_names[i] for i in range(len(class_names))]
+
+    @contextmanager
+    def acquire(self, crop):
+        """
+        Use a crop's model, loading it if needed; it cannot be evicted until the block exits.
+
+        Raises:
+            ValueError: If the crop is not configured
+        """
+        slot = self._checkout(crop)
+        try:
+            yield slot["model"]
+        finally:
+            with self._lock:
+                slot["in_use"] -= 1
+                slot["last_used"] = time.monotonic()
+                # Models that could not be evicted while in use may go now
+                self._evict()
+
+    def get(self, crop):
+        """A crop's model, loading it if needed; it may be evicted once no request uses it"""
+        with self.acquire(crop) as model:
+            return model
+
+    def loaded(self, crop):
+        """A crop's model if it is loaded, else None; never loads"""
+        with self._lock:
+            slot = self._models.get(crop)
+            return slot["model"] if slot is not None else None
+
+    def _checkout(self, crop):
+        if crop not in self.specs:
+            raise ValueError(f"Unknown crop: {crop}")
+        with self._lock:
+            slot = self._hit(crop)
+        if slot is not None:
+            return slot
+
+        with self._load_locks[crop]:
+            with self._lock:
+                slot = self._hit(crop)
+                if slot is not None:
+                    return slot
+                self.misses += 1
+                # Make room first, with the checkpoint size as the estimate
+                self._evict(reserve=self._estimated_bytes(crop))
+
+            start = time.perf_counter()
+            try:
+                model = self._factory(crop, self.specs[crop])
+            except Exception:
+                with self._lock:
+                    self.load_failures += 1
+                raise
+            elapsed = time.perf_counter() - start
+
+            slot = {"model": model, "bytes": model.memory_bytes(), "in_use": 1, "last_used": time.monotonic()}
+            with self._lock:
+                self._models[crop] = slot
+                self.loads += 1
+                reload = crop in self._ever_loaded
+                if reload:
+                    self.reloads += 1
+                self._ever_loaded.add(crop)
+                timing = self._load_seconds.setdefault(crop, {"count": 0, "total": 0.0, "last": 0.0})
+                timing["count"] += 1
+                timing["total"] += elapsed
+                timing["last"] = elapsed
+                self._evict()
+            logger.info(f"Loaded {crop} model in {elapsed:.2f}s", extra={
+                "crop": crop, "load_s": round(elapsed, 3), "size_mb": round(slot["bytes"] / 2 ** 20, 1),
+                "reload": reload
+            })
+            return slot
+
+    def _hit(self, crop):
+        """Check out a loaded model; call with the lock held"""
+        slot = self._models.get(crop)
+        if slot is not None:
+            slot["in_use"] += 1
+            self._models.move_to_end(crop)
+            self.hits += 1
+        return slot
+
+    def _estimated_bytes(self, crop):
+        try:
+            return os.path.getsize(self.specs[crop]["model_path"])
+        except (OSError, TypeError):
+            return 0
+
+    def _evict(self, reserve=0):
+        """Drop idle, unpinned models, least recently used first, until the budget holds; call with the lock held"""
+        if self.memory_budget <= 0:
+            return
+        used = sum(slot["bytes"] for slot in self._models.values())
+        for crop in list(self._models):
+            if used + reserve <= self.memory_budget:
+                break
+            slot = self._models[crop]
+            if slot["in_use"] or self.specs[crop]["pinned"]:
+                continue
+            del self._models[crop]
+            used -= slot["bytes"]
+            self.evictions += 1
+            self._evictions_by_crop[crop] += 1
+            logger.info(f"Evicted idle {crop} model", extra={
+                "crop": crop, "size_mb": round(slot["bytes"] / 2 ** 20, 1),
+                "idle_s": round(time.monotonic() - slot["last_used"], 1)
+            })
+
+    def stats(self):
+        """Loaded models, load times and eviction churn for /stats"""
+        now = time.monotonic()
+        with self._lock:
+            resident = sum(slot["bytes"] for slot in self._models.values())
+            return {
+                "crops": self.crops,
+                "default_crop": self.default_crop,
+                "budget_mb": round(self.memory_budget / 2 ** 20, 1) if self.memory_budget else None,
+                "resident_mb": round(resident / 2 ** 20, 1),
+                "loaded": [
+                    {"crop": crop, "size_mb": round(slot["bytes"] / 2 ** 20, 1), "in_use": slot["in_use"],
+                     "pinned": self.specs[crop]["pinned"], "idle_s": round(now - slot["last_used"], 1)}
+                    for crop, slot in self._models.items()
+                ],
+                "hits": self.hits,
+                "misses": self.misses,
+                "loads": self.loads,
+                # Loads of a crop that had been evicted: high values mean the budget is too small
+                "reloads": self.reloads,
+                "load_failures": self.load_failures,
+                "evictions": self.evictions,
+                "evictions_by_crop": dict(self._evictions_by_crop),
+                "load_seconds": {crop: {"count": t["count"], "last": round(t["last"], 3),
+                                        "mean": round(t["total"] / t["count"], 3)}
+                                 for crop, t in self._load_seconds.items()},
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_model_pool():
+    """Return the shared pool built from CROP_MODELS_PATH; no model is loaded until asked for"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            specs, default_crop = load_crop_specs()
+            _pool = ModelPool(specs, default_crop, MODEL_POOL_MEMORY_MB)
+        return _pool
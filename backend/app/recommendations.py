@@ -0,0 +1,318 @@
+# recommendations.py
+"""
+Treatment recommendation providers.
+
+A provider turns a predicted class name into advice text:
+
+- GeminiProvider asks the Gemini API on every call
+- LocalKnowledgeBaseProvider serves curated advice from a versioned JSON file
+  that is loaded once and kept in memory
+- TieredProvider answers from memory immediately, with the newest Gemini text
+  if one has been fetched and the local knowledge base otherwise, and
+  refreshes the Gemini text on a background thread
+
+RECOMMENDATION_PROVIDER selects one of "tiered" (default), "local" or "gemini".
+The Gemini client library is imported only when a GeminiProvider connects.
+Each crop served by the model pool has its own provider, knowledge base and
+Gemini prompts.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.utils.config import (GEMINI_API_KEY, GEMINI_API_ENDPOINT, GEMINI_TIMEOUT,
+                                  KNOWLEDGE_BASE_PATH, RECOMMENDATION_PROVIDER,
+                                  RECOMMENDATION_REFRESH_SECONDS, RECOMMENDATION_CACHE_PATH)
+
+logger = logging.getLogger(__name__)
+
+
+class RecommendationProvider:
+    """Base class: return advice text for a class name"""
+
+    name = "base"
+
+    def get_recommendation(self, disease_name):
+        """
+        Args:
+            disease_name (str): Predicted class name
+
+        Returns:
+            str: Advice formatted as plain "-" bullet points
+        """
+        raise NotImplementedError
+
+    def describe(self):
+        """Short status used by /health"""
+        return {"provider": self.name}
+
+
+class LocalKnowledgeBaseProvider(RecommendationProvider):
+    """Curated per-disease advice, read from disk once and served from memory"""
+
+    name = "local"
+
+    def __init__(self, path=KNOWLEDGE_BASE_PATH):
+        """
+        Args:
+            path (str): Knowledge base JSON with ``version``, ``diseases``
+                (class name to list of lines) and a ``default`` entry, or None
+                for a crop without curated advice
+        """
+        data = {"version": "none", "default": ["Consult your local agricultural extension service."]}
+        if path is not None:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        self.path = path
+        self.version = str(data.get("version", "unversioned"))
+        self._advice = {name: self._join(lines) for name, lines in data.get("diseases", {}).items()}
+        self._default = self._join(data.get("default", []))
+        if path is not None:
+            logger.info(f"Loaded knowledge base {os.path.basename(path)} version {self.version} "
+                        f"({len(self._advice)} entries)")
+
+    @staticmethod
+    def _join(lines):
+        return "\n".join(lines) if isinstance(lines, list) else str(lines)
+
+    def get_recommendation(self, disease_name):
+        advice = self._advice.get(disease_name)
+        if advice is not None:
+            return advice
+        return f"For {disease_name}:\n{self._default}"
+
+    def describe(self):
+        return {"provider": self.name, "knowledge_base_version": self.version}
+
+
+class GeminiProvider(RecommendationProvider):
+    """Live Gemini API calls; ``fallback`` answers when the API is unavailable"""
+
+    name = "gemini"
+
+    def __init__(self, fallback, api_key=GEMINI_API_KEY, endpoint=GEMINI_API_ENDPOINT, timeout=GEMINI_TIMEOUT,
+                 crop="cassava"):
+        """
+        Configure the API and check that it answers.
+
+        Args:
+            fallback (RecommendationProvider): Used when Gemini is not configured or a call fails
+            api_key (str): Gemini API key
+            endpoint (str): Alternative REST endpoint, e.g. a local fake
+            timeout (float): Seconds allowed per call, retries included
+            crop (str): Crop named in the prompts
+        """
+        self.fallback = fallback
+        self.crop = crop
+        self.timeout = timeout
+        self.gemini_model = None
+        self._genai = None
+
+        if not api_key:
+            logger.warning("No Gemini API key provided. Recommendations will use fallback mechanism.")
+            return
+
+        try:
+            # Imported here: it is slow to import and only needed with an API key
+            import google.generativeai as genai
+            self._genai = genai
+            if endpoint:
+                genai.configure(api_key=api_key, transport="rest", client_options={"api_endpoint": endpoint})
+            else:
+                genai.configure(api_key=api_key)
+            self.gemini_model = genai.GenerativeModel('gemini-1.5-pro')
+            self.gemini_model.generate_content("Hello", request_options=self._request_options())
+            logger.info("Gemini API initialized successfully")
+        except Exception as e:
+            logger.warning(f"Failed to initialize Gemini API: {str(e)}; "
+                           "recommendations will use fallback mechanism")
+            self.gemini_model = None
+
+    @property
+    def available(self):
+        return self.gemini_model is not None
+
+    def _request_options(self):
+        """Bound the time spent on one call, including the client's own retries"""
+        from google.api_core import retry
+        return {
+            "timeout": self.timeout,
+            "retry": retry.Retry(initial=0.5, maximum=self.timeout / 2, timeout=self.timeout)
+        }
+
+    def generate(self, disease_name):
+        """
+        Ask Gemini for advice.
+
+        Returns:
+            str: Advice text
+
+        Raises:
+            RuntimeError: If Gemini is not configured
+            Exception: Whatever the API client raises
+        """
+        if not self.available:
+            raise RuntimeError("Gemini API is not configured")
+
+        if disease_name == "Healthy":
+            prompt = f"""As a {self.crop} agricultural expert, list:
+            - 5 essential maintenance practices for healthy {self.crop}
+            - 3 early signs of disease to monitor
+            - Ideal soil/weather conditions
+            Format as bullet points without markdown."""
+        else:
+            prompt = f"""As a {self.crop} disease specialist, create a treatment plan for {disease_name}:
+            - First emergency steps
+            - Approved chemical treatments (specify dosage)
+            - Organic alternatives
+            - Cultural control methods
+            Use bullet points, avoid technical jargon."""
+
+        response = self.gemini_model.generate_content(
+            prompt,
+            generation_config=self._genai.types.GenerationConfig(
+                temperature=0.3
+            ),
+            request_options=self._request_options()
+        )
+        return response.text.replace("•", "-")
+
+    def get_recommendation(self, disease_name):
+        if not self.available:
+            return self.fallback.get_recommendation(disease_name)
+        try:
+            return self.generate(disease_name)
+        except Exception as e:
+            logger.error(f"Error generating advice with Gemini: {str(e)}")
+            return self.fallback.get_recommendation(disease_name)
+
+    def describe(self):
+        return {"provider": self.name, "gemini_available": self.available}
+
+
+class TieredProvider(RecommendationProvider):
+    """
+    Local-first advice, refreshed from Gemini in the background.
+
+    Calls never wait on the network. A class whose Gemini text is missing or
+    older than ``refresh_seconds`` is queued for one background refresh, and
+    the next call gets the new text. Fetched texts are saved to
+    ``cache_path`` so they survive restarts.
+    """
+
+    name = "tiered"
+
+    def __init__(self, local, remote_factory, refresh_seconds=RECOMMENDATION_REFRESH_SECONDS,
+                 cache_path=RECOMMENDATION_CACHE_PATH):
+        """
+        Args:
+            local (LocalKnowledgeBaseProvider): Answers until Gemini text is available
+            remote_factory (callable): Returns a GeminiProvider; called on the
+                refresh thread so connecting never delays startup
+            refresh_seconds (float): Age after which Gemini text is fetched again
+            cache_path (str): JSON file for fetched texts, or None to keep them in memory only
+        """
+        self.local = local
+        self.refresh_seconds = refresh_seconds
+        self.cache_path = cache_path
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self._remote_factory = remote_factory
+        self._remote = None
+        self._lock = threading.Lock()
+        self._pending = set()
+        # class name -> (text, fetched_at)
+        self._fetched = self._load_cache()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="recommendation-refresh")
+
+    def _load_cache(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                return {name: (entry["text"], entry["fetched_at"]) for name, entry in json.load(f).items()}
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable recommendation cache {self.cache_path}: {str(e)}")
+            return {}
+
+    def _save_cache(self):
+        if not self.cache_path:
+            return
+        with self._lock:
+            data = {name: {"text": text, "fetched_at": fetched_at}
+                    for name, (text, fetched_at) in self._fetched.items()}
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.cache_path)
+
+    def get_recommendation(self, disease_name):
+        with self._lock:
+            fetched = self._fetched.get(disease_name)
+            stale = fetched is None or time.time() - fetched[1] > self.refresh_seconds
+            remote_down = self._remote is not None and not self._remote.available
+            if stale and not remote_down and disease_name not in self._pending:
+                self._pending.add(disease_name)
+                self._executor.submit(self._refresh, disease_name)
+        if fetched is not None:
+            return fetched[0]
+        return self.local.get_recommendation(disease_name)
+
+    def _refresh(self, disease_name):
+        try:
+            if self._remote is None:
+                self._remote = self._remote_factory()
+            if not self._remote.available:
+                return
+            text = self._remote.generate(disease_name)
+            with self._lock:
+                self._fetched[disease_name] = (text, time.time())
+                self.refreshes += 1
+            self._save_cache()
+        except Exception as e:
+            self.refresh_errors += 1
+            logger.warning(f"Background refresh of advice for {disease_name} failed: {str(e)}")
+        finally:
+            with self._lock:
+                self._pending.discard(disease_name)
+
+    def describe(self):
+        with self._lock:
+            fetched = len(self._fetched)
+        return {
+            "provider": self.name,
+            "knowledge_base_version": self.local.version,
+            "gemini_available": None if self._remote is None else self._remote.available,
+            "llm_entries": fetched,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors
+        }
+
+
+def create_provider(name=RECOMMENDATION_PROVIDER, crop="cassava", knowledge_base=KNOWLEDGE_BASE_PATH,
+                    cache_path=RECOMMENDATION_CACHE_PATH):
+    """
+    Build the configured provider.
+
+    Args:
+        name (str): "tiered", "local" or "gemini"
+        crop (str): Crop the advice is for
+        knowledge_base (str): Knowledge base JSON, or None if the crop has none
+        cache_path (str): Where the tiered provider keeps fetched Gemini texts
+
+    Returns:
+        RecommendationProvider: The provider
+    """
+    local = LocalKnowledgeBaseProvider(knowledge_base)
+    if name == "local":
+        return local
+    if name == "gemini":
+        return GeminiProvider(fallback=local, crop=crop)
+    if name == "tiered":
+        return TieredProvider(local, lambda: GeminiProvider(fallback=local, crop=crop), cache_path=cache_path)
+    raise ValueError(f"Unknown recommendation provider: {name}")
@@ -1,65 +1,935 @@
 # routes.py
-from flask import request, jsonify, Blueprint
-from PIL import Image
+from flask import request, jsonify, Blueprint, Response, send_file
+from werkzeug.exceptions import RequestEntityTooLarge
+from PIL import Image, ImageOps
+from datetime import datetime
+from functools import wraps
+import base64
+import hashlib
 import io
+import logging
 import os
-from backend.app.model import model_instance
+import time
+import uuid
+from backend.app.model_pool import get_model_pool
+from backend.utils.config import (
+    SIMILARITY_INDEX_DIR, SIMILARITY_INDEX_ENABLED, SIMILARITY_NPROBE,
+    HISTORY_ENABLED, HISTORY_DB_PATH, ANALYTICS_ENABLED, ANALYTICS_DB_PATH,
+    ANALYTICS_REGIONS, ANALYTICS_MAX_REGIONS,
+    DEDUP_ENABLED, DEDUP_MAX_DISTANCE, DEDUP_CAPACITY,
+    ADMISSION_ENABLED, ADMISSION_MAX_CONCURRENCY, ADMISSION_BULK_MAX_CONCURRENCY,
+    ADMISSION_QUEUE_INTERACTIVE, ADMISSION_QUEUE_BULK, ADMISSION_MAX_WAIT,
+    JOBS_ENABLED, JOBS_DB_PATH, JOBS_WORKERS, JOBS_MAX_PENDING, JOBS_RETENTION_SECONDS, JOBS_LEASE_SECONDS,
+    EXPLAIN_ENABLED, EXPLAIN_CACHE_SIZE, EXPLAIN_TTL_SECONDS,
+    VIDEO_SAMPLE_INTERVAL, VIDEO_SCENE_THRESHOLD, VIDEO_SEGMENT_SECONDS, VIDEO_MAX_SECONDS,
+    VIDEO_MAX_FRAMES, VIDEO_BATCH_SIZE, VIDEO_MAX_UPLOAD_MB, VIDEO_MAX_UPLOAD_FRAMES,
+    REPORT_STORE_ENABLED, REPORT_STORE_DIR, REPORT_STORE_QUOTA_MB
+)
+from backend.utils.admission import AdmissionController, Overloaded, LANES
+from backend.utils.analytics import AnalyticsRollups, GRANULARITIES, normalize_region
+from backend.utils.artifact_store import ArtifactStore, KEY_PATTERN, artifact_key
+from backend.utils.embedding_index import EmbeddingIndex, index_dir
+from backend.utils.explain import ExplanationCache, encode_png, render_overlay
+from backend.utils.history import HistoryStore
+from backend.utils.jobs import JobQueue, IdempotencyConflict, QueueFull, RetryLater
+from backend.utils.logging_setup import logging_stats
+from backend.utils.phash import NearDuplicateCache, dhash, format_hash
+from backend.utils.report_generator import TEMPLATE_VERSION
+from backend.utils.video import (FrameSampler, SegmentAggregator, VideoUnavailable,
+                                 image_frames, video_frames)
+
+logger = logging.getLogger(__name__)
 
 api = Blueprint('api', __name__)
 
+model_pool = get_model_pool()
+# Load the default crop's model now so a broken checkpoint fails at startup.
+# The similarity index and near-duplicate cache only hold default-crop cases.
+default_model = model_pool.get(model_pool.default_crop)
+
+similarity_index = None
+if SIMILARITY_INDEX_ENABLED:
+    if os.path.exists(os.path.join(SIMILARITY_INDEX_DIR, "vectors.npy")):
+        logger.warning(f"Ignoring the index stored directly in {SIMILARITY_INDEX_DIR}: indexes now live in "
+                       f"one subdirectory per model version; move it into the one of the model that built it")
+    try:
+        similarity_index = EmbeddingIndex(index_dir(SIMILARITY_INDEX_DIR, default_model.model_version),
+                                          default_model.embedding_dim)
+    except ValueError as e:
+        # e.g. MODEL_VERSION reused for a model with another feature width
+        logger.warning(f"Similar-case search disabled: {str(e)}")
+
+history_store = HistoryStore(HISTORY_DB_PATH, legacy_crop=model_pool.default_crop) if HISTORY_ENABLED else None
+
+explanations = ExplanationCache(EXPLAIN_CACHE_SIZE, EXPLAIN_TTL_SECONDS) if EXPLAIN_ENABLED else None
+
+analytics = AnalyticsRollups(ANALYTICS_DB_PATH, legacy_crop=model_pool.default_crop, regions=ANALYTICS_REGIONS,
+                             max_regions=ANALYTICS_MAX_REGIONS) if ANALYTICS_ENABLED else None
+
+report_store = None
+if REPORT_STORE_ENABLED:
+    report_store = ArtifactStore(REPORT_STORE_DIR, int(REPORT_STORE_QUOTA_MB * 1024 * 1024), suffix=".pdf")
+
+admission = None
+if ADMISSION_ENABLED:
+    admission = AdmissionController(
+        max_concurrency=ADMISSION_MAX_CONCURRENCY,
+        queue_limits={"interactive": ADMISSION_QUEUE_INTERACTIVE, "bulk": ADMISSION_QUEUE_BULK},
+        bulk_max_concurrency=ADMISSION_BULK_MAX_CONCURRENCY,
+        max_wait=ADMISSION_MAX_WAIT
+    )
+
+duplicate_cache = None
+if DEDUP_ENABLED:
+    duplicate_cache = NearDuplicateCache(DEDUP_MAX_DISTANCE, DEDUP_CAPACITY)
+    if history_store is not None:
+        # Warm the cache with recent results of the current model
+        for phash, case_id, disease, confidence in history_store.recent_phashes(
+                DEDUP_CAPACITY, model_version=default_model.model_version):
+            # Older rows may hold the all-zero hash of a flat image, which matches any other
+            if int(phash, 16):
+                duplicate_cache.add(int(phash, 16), {"case_id": case_id, "disease": disease,
+                                                     "confidence": confidence})
+
+# Not kept: an unpinned default model must be free to be evicted
+del default_model
+
+def _open_uploaded_image():
+    """
+    Read, open and verify the uploaded 'image' file
+    
+    Returns:
+        - (image, raw bytes, None) on success, or (None, None, error response) on failure
+    """
+    if 'image' not in request.files:
+        return None, None, (jsonify({"error": "No image uploaded"}), 400)
+    
+    image_bytes = request.files['image'].read()
+    try:
+        image = _decode_image(image_bytes)
+    except Exception as e:
+        return None, None, (jsonify({"error": f"Invalid image file: {str(e)}"}), 400)
+    return image, image_bytes, None
+
+def _decode_image(image_bytes):
+    """
+    Open and verify an encoded image; raises if it is not a readable image.
+
+    The EXIF orientation is applied here, so the model, the report and the
+    explanation overlay all see the photo upright however it was uploaded.
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    image.verify()
+    image = Image.open(io.BytesIO(image_bytes))
+    ImageOps.exif_transpose(image, in_place=True)
+    return image
+
+def _request_region():
+    """Optional 'region' label for analytics, normalized as the rollups store it"""
+    return normalize_region(request.values.get('region'))
+
+def _request_lane():
+    """Priority lane from the X-Priority header or a 'priority' parameter; interactive by default"""
+    lane = request.headers.get('X-Priority') or request.args.get('priority') or request.form.get('priority')
+    lane = (lane or "").strip().lower()
+    return lane if lane in LANES else "interactive"
+
+def _request_crop():
+    """
+    Optional 'crop' parameter selecting the crop model; the default crop when absent
+    
+    Returns:
+        - (crop, None), or (None, error response) for an unknown crop
+    """
+    crop = (request.values.get('crop') or "").strip().lower() or model_pool.default_crop
+    if crop not in model_pool.specs:
+        return None, (jsonify({"error": f"Unknown crop: {crop}; choose one of {', '.join(model_pool.crops)}"}), 400)
+    return crop, None
+
+def _request_explain():
+    """
+    Optional 'explain' parameter: "true" keeps the activations for /explain/<case_id>,
+    "pdf" also adds the Grad-CAM overlay to the PDF report
+    """
+    if explanations is None:
+        return None
+    value = (request.values.get('explain') or "").strip().lower()
+    if value == "pdf":
+        return "pdf"
+    return "true" if value in ("1", "true", "yes") else None
+
+def _request_report():
+    """
+    Optional 'report' parameter: "url" leaves the base64 PDF out of the response
+    in favour of report_url; anything else embeds it
+    """
+    value = (request.values.get('report') or "").strip().lower()
+    return "url" if value == "url" and report_store is not None else "inline"
+
+def admission_controlled(view):
+    """Run the view only after the admission controller grants a slot, else answer 429"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if admission is None:
+            return view(*args, **kwargs)
+        try:
+            with admission.slot(_request_lane()):
+                return view(*args, **kwargs)
+        except Overloaded as e:
+            response = jsonify({"error": f"Server busy: {str(e)}", "retry_after": e.retry_after})
+            response.status_code = 429
+            response.headers["Retry-After"] = str(e.retry_after)
+            return response
+    return wrapper
+
+def upload_limited(max_bytes, max_parts):
+    """
+    Limit the size and multipart part count of a view's request body, answering 413 beyond them
+
+    The parser enforces the limits while it reads, so an oversized body is
+    never held in full; apply it outside decorators that read the form.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            request.max_content_length = max_bytes
+            request.max_form_parts = max_parts
+            try:
+                request.files
+            except RequestEntityTooLarge:
+                return jsonify({"error": f"Upload too large: at most {max_bytes / 2 ** 20:g} MB "
+                                         f"in {max_parts} parts"}), 413
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def _elapsed_ms(start):
+    return round((time.perf_counter() - start) * 1000, 2)
+
+def _index_case(case_id, embedding, disease, confidence):
+    """Store the embedding of a diagnosed image for /similar lookups"""
+    if similarity_index is None:
+        return
+    try:
+        similarity_index.add(embedding, {
+            "id": case_id,
+            "disease": disease,
+            "confidence": round(confidence, 2),
+            "timestamp": datetime.now().isoformat(timespec="seconds")
+        })
+    except Exception as e:
+        logger.warning(f"Failed to index case {case_id}: {str(e)}")
+
+def _explanation(case_id):
+    """
+    Grad-CAM heatmap for a recent case, computed on first use
+    
+    Returns:
+        tuple: (cache entry, heatmap array), or (None, None) if the case is unknown or expired
+    """
+    entry = explanations.get(case_id) if explanations is not None else None
+    if entry is None:
+        return None, None
+    heatmap = entry["heatmap"]
+    if heatmap is None:
+        with model_pool.acquire(entry["crop"]) as model:
+            heatmap = model.grad_cam(entry["activations"], entry["class_index"])
+        explanations.set_heatmap(case_id, heatmap)
+    return entry, heatmap
+
+def _report(model, image, image_hash, disease, confidence, recommendation, overlay=None, inline=True):
+    """
+    PDF report of a diagnosis, rendered only if the same report is not stored yet
+    
+    The key covers everything the PDF shows: template version, diagnosis
+    date, image, disease, confidence as printed, recommendation and Grad-CAM
+    overlay. Stored reports print the date rather than the time they were
+    rendered, so one served again later on the same day is still accurate.
+    
+    Returns:
+        dict: "pdf" (base64, or None when not inline) and, with the report
+            store enabled, "report_url" and "report_cached"
+    """
+    if report_store is None:
+        return {"pdf": model.generate_full_report(image, disease, confidence, recommendation, overlay=overlay)}
+    
+    overlay_hash = hashlib.sha256(overlay.tobytes()).hexdigest() if overlay is not None else ""
+    report_date = datetime.now().date().isoformat()
+    key = artifact_key(TEMPLATE_VERSION, report_date, image_hash, disease, f"{confidence:.1f}", recommendation,
+                       overlay_hash)
+    path = report_store.get(key)
+    pdf = None
+    if path is not None and inline:
+        try:
+            with open(path, "rb") as f:
+                pdf = base64.b64encode(f.read()).decode("ascii")
+        except FileNotFoundError:
+            # Evicted since the lookup
+            path = None
+    
+    result = {"report_cached": path is not None}
+    if path is None:
+        pdf = model.generate_full_report(image, disease, confidence, recommendation, overlay=overlay,
+                                         report_date=report_date)
+        try:
+            report_store.put(key, base64.b64decode(pdf))
+        except OSError as e:
+            logger.warning(f"Could not store report {key}: {str(e)}")
+            return {"pdf": pdf, "report_cached": False}
+    result["pdf"] = pdf if inline else None
+    result["report_url"] = f"/reports/{key}"
+    return result
+
+def _diagnose(image, image_bytes, region=None, timings=None, explain=None, crop=None, report="inline"):
+    """
+    Run the diagnosis pipeline on a decoded upload with the crop's model
+    
+    Args:
+        image (PIL.Image.Image): Decoded image
+        image_bytes (bytes): Encoded upload, used for hashing
+        region (str): Region label for analytics
+        timings (dict): Stage timings recorded so far, extended in place
+        explain (str): "true" to keep activations for /explain, "pdf" to also
+            put the Grad-CAM overlay in the report; either skips near-duplicate reuse
+        crop (str): Configured crop (default: the pool's default crop)
+        report (str): "inline" embeds the base64 PDF, "url" only links to it
+        
+    Returns:
+        dict: The /predict response body
+    """
+    crop = crop or model_pool.default_crop
+    with model_pool.acquire(crop) as model:
+        return _diagnose_with(model, image, image_bytes, region, {} if timings is None else timings, explain,
+                              report)
+
+def _diagnose_with(model, image, image_bytes, region, timings, explain, report):
+    """
+    Near-duplicate lookup, inference, recommendation, PDF report and
+    bookkeeping for ``_diagnose``; the pool keeps ``model`` loaded meanwhile
+    """
+    case_id = uuid.uuid4().hex
+    # Hashes and embeddings are only comparable between cases of one model
+    default_crop = model.crop == model_pool.default_crop
+    phash, duplicate, distance = None, None, None
+    if duplicate_cache is not None and default_crop:
+        stage_start = time.perf_counter()
+        try:
+            phash = dhash(image_bytes)
+            # None for images too flat to hash reliably: those always run the model
+            if phash is not None and not explain:
+                duplicate, distance = duplicate_cache.lookup(phash)
+        except Exception as e:
+            logger.warning(f"Perceptual hashing failed: {str(e)}")
+        timings["dedup_ms"] = _elapsed_ms(stage_start)
+    
+    if duplicate is not None:
+        # Same photo as an earlier upload: reuse its diagnosis instead of running the model
+        disease, confidence = duplicate["disease"], duplicate["confidence"]
+    else:
+        stage_start = time.perf_counter()
+        if explain:
+            disease, confidence, embedding, activations = model.predict(
+                image, return_embedding=True, return_activations=True)
+            explanations.put(case_id, activations, model.class_indexes[disease], disease, confidence, image,
+                             crop=model.crop)
+        else:
+            disease, confidence, embedding = model.predict(image, return_embedding=True)
+        timings["inference_ms"] = _elapsed_ms(stage_start)
+        
+        if default_crop:
+            _index_case(case_id, embedding, disease, confidence)
+        if phash is not None:
+            duplicate_cache.add(phash, {"case_id": case_id, "disease": disease, "confidence": confidence})
+    if analytics is not None:
+        analytics.record(disease, confidence, region=region, crop=model.crop)
+    
+    stage_start = time.perf_counter()
+    recommendation = model.get_recommendation(disease)
+    timings["recommendation_ms"] = _elapsed_ms(stage_start)
+    
+    response = {
+        "case_id": case_id,
+        "crop": model.crop,
+        "disease": disease,
+        "confidence": confidence,
+        "recommendation": recommendation
+    }
+    if duplicate is not None:
+        response["duplicate_of"] = duplicate["case_id"]
+        response["hash_distance"] = distance
+    
+    overlay = None
+    if explain:
+        response["explain_url"] = f"/explain/{case_id}"
+    if explain == "pdf":
+        stage_start = time.perf_counter()
+        try:
+            entry, heatmap = _explanation(case_id)
+            overlay = render_overlay(entry["image"], heatmap)
+        except Exception as e:
+            logger.warning(f"Grad-CAM overlay failed: {str(e)}")
+        timings["explain_ms"] = _elapsed_ms(stage_start)
+    
+    stage_start = time.perf_counter()
+    image_hash = hashlib.sha256(image_bytes).hexdigest()
+    try:
+        response.update(_report(model, image, image_hash, disease, confidence, recommendation, overlay,
+                                inline=report != "url"))
+    except Exception as e:
+        logger.warning(f"PDF generation failed: {str(e)}")
+        response["pdf"] = None
+        response["pdf_error"] = f"Could not generate PDF: {str(e)}"
+    timings["report_ms"] = _elapsed_ms(stage_start)
+    
+    if history_store is not None:
+        history_store.record(
+            disease, confidence,
+            image_hash=image_hash,
+            model_version=model.model_version,
+            timings=timings,
+            case_id=case_id,
+            phash=format_hash(phash) if phash is not None else None,
+            crop=model.crop
+        )
+    
+    response["timings"] = timings
+    logger.info("Diagnosis complete", extra={
+        "case_id": case_id,
+        "crop": model.crop,
+        "disease": disease,
+        "confidence": round(confidence, 2),
+        "duplicate_of": response.get("duplicate_of"),
+        "timings": timings
+    })
+    return response
+
 @api.route('/predict', methods=['POST'])
+@admission_controlled
 def predict():
     """
     Endpoint for disease prediction
     
     Expects: 
         - An image file with field name 'image'
+        - Optional 'crop' naming the crop model to use (default: DEFAULT_CROP)
+        - Optional 'region' label used for analytics
+        - Optional 'X-Priority: bulk' header (or 'priority' field) for batch clients
+        - Optional 'explain' field: "true" to allow GET /explain/<case_id>,
+          "pdf" to also embed the Grad-CAM overlay in the report
+        - Optional 'report' field: "url" to receive only report_url instead
+          of the base64 PDF
         
     Returns:
-        - JSON with disease, confidence, recommendation, and PDF report
+        - JSON with case id, crop, disease, confidence, recommendation, PDF report
+          and per-stage timings in milliseconds; near-duplicates of an earlier
+          upload also carry duplicate_of (that case id) and hash_distance;
+          explained cases carry explain_url; with the report store enabled,
+          report_url links to the stored PDF
     """
-    if 'image' not in request.files:
-        return jsonify({"error": "No image uploaded"}), 400
+    try:
+        timings = {}
+        stage_start = time.perf_counter()
+        
+        crop, error = _request_crop()
+        if error:
+            return error
+        image, image_bytes, error = _open_uploaded_image()
+        if error:
+            return error
+        timings["decode_ms"] = _elapsed_ms(stage_start)
+        
+        return jsonify(_diagnose(image, image_bytes, _request_region(), timings, _request_explain(), crop,
+                                 _request_report()))
+    except Exception as e:
+        logger.exception(f"Prediction error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+def _diagnose_video(model, frames, sampler, region=None):
+    """
+    Sample frames, classify them in batches and aggregate per segment
+    
+    Only the current batch of sampled frames is held in memory, and at most
+    VIDEO_MAX_FRAMES frames are classified.
+    
+    Args:
+        model (CropDiseaseModel): Model of the requested crop
+        frames (iterator): Frame objects from ``video_frames`` or ``image_frames``
+        sampler (FrameSampler): Chooses the frames to classify
+        region (str): Region label for analytics
+        
+    Returns:
+        dict: The /predict/video response body, or None if no frame was classified
+    """
+    start = time.perf_counter()
+    aggregator = SegmentAggregator(model.class_names)
+    batch, batch_info = [], []
+    decoded, truncated, inference_s = 0, False, 0.0
+    
+    def classify_batch():
+        nonlocal inference_s
+        batch_start = time.perf_counter()
+        for (segment, frame_time), probabilities in zip(batch_info, model.predict_probabilities(batch)):
+            aggregator.add(segment, frame_time, probabilities)
+        inference_s += time.perf_counter() - batch_start
+        batch.clear()
+        batch_info.clear()
     
-    image_file = request.files['image']
     try:
-        try:
-            image = Image.open(image_file.stream)
-            image.verify()
-            image_file.stream.seek(0)
-            image = Image.open(image_file.stream)
-        except Exception as e:
-            return jsonify({"error": f"Invalid image file: {str(e)}"}), 400
+        for frame in frames:
+            decoded += 1
+            keep, segment = sampler.sample(frame)
+            if not keep:
+                continue
+            if aggregator.frames + len(batch) >= VIDEO_MAX_FRAMES:
+                truncated = True
+                break
+            batch.append(frame.image())
+            batch_info.append((segment, frame.time))
+            if len(batch) >= VIDEO_BATCH_SIZE:
+                classify_batch()
+        if batch:
+            classify_batch()
+    finally:
+        # Closes the video container now rather than when the generator is collected
+        frames.close()
+    
+    overall = aggregator.overall()
+    if overall is None:
+        return None
+    timings = {"decode_ms": round((time.perf_counter() - start - inference_s) * 1000, 2),
+               "inference_ms": round(inference_s * 1000, 2)}
+    
+    stage_start = time.perf_counter()
+    recommendation = model.get_recommendation(overall["disease"])
+    timings["recommendation_ms"] = _elapsed_ms(stage_start)
+    
+    case_id = uuid.uuid4().hex
+    if analytics is not None:
+        analytics.record(overall["disease"], overall["confidence"], region=region, crop=model.crop)
+    if history_store is not None:
+        history_store.record(overall["disease"], overall["confidence"], model_version=model.model_version,
+                             timings=timings, case_id=case_id, crop=model.crop)
+    
+    segments = aggregator.segments()
+    logger.info("Video diagnosis complete", extra={
+        "case_id": case_id,
+        "crop": model.crop,
+        "disease": overall["disease"],
+        "confidence": round(overall["confidence"], 2),
+        "frames_decoded": decoded,
+        "frames_classified": aggregator.frames,
+        "segments": len(segments),
+        "timings": timings
+    })
+    return {
+        "case_id": case_id,
+        "crop": model.crop,
+        "disease": overall["disease"],
+        "confidence": overall["confidence"],
+        "recommendation": recommendation,
+        "segments": segments,
+        "sampling": sampler.mode,
+        "frames_decoded": decoded,
+        "frames_classified": aggregator.frames,
+        "truncated": truncated,
+        "timings": timings
+    }
+
+def _float_param(name, default):
+    """Positive number from a request parameter; raises ValueError otherwise"""
+    value = float(request.values.get(name, default))
+    if not value > 0:
+        raise ValueError(f"{name} must be positive")
+    return value
+
+# Form fields /predict/video accepts besides the uploads, counted towards its part limit
+_VIDEO_FORM_FIELDS = 16
+
+@api.route('/predict/video', methods=['POST'])
+@upload_limited(int(VIDEO_MAX_UPLOAD_MB * 1024 * 1024), VIDEO_MAX_UPLOAD_FRAMES + _VIDEO_FORM_FIELDS)
+@admission_controlled
+def predict_video():
+    """
+    Endpoint for diagnosing a walk-through video or a sequence of frames
+    
+    Expects:
+        - A video file with field name 'video' (needs the optional PyAV
+          package), or one or more images with field name 'frames', in
+          recording order
+        - Optional 'sampling': "interval" (default) or "scene"
+        - Optional 'interval': seconds between sampled frames (default VIDEO_SAMPLE_INTERVAL)
+        - Optional 'scene_threshold': picture change that starts a new scene,
+          0 to 1 (default VIDEO_SCENE_THRESHOLD)
+        - Optional 'segment_seconds': segment length in interval mode, longest
+          stretch without a sampled frame in scene mode (default VIDEO_SEGMENT_SECONDS)
+        - Optional 'fps': capture rate of 'frames' images (default 1)
+        - Optional 'crop' and 'region', as for /predict
         
-        disease, confidence = model_instance.predict(image)
+    Returns:
+        - JSON with the overall disease, confidence and recommendation, and
+          per-segment verdicts (start and end time, frames, disease, mean
+          confidence, per-class frame votes); 'truncated' is true when the
+          VIDEO_MAX_FRAMES limit stopped sampling early
+        - 413 for bodies over VIDEO_MAX_UPLOAD_MB or more than
+          VIDEO_MAX_UPLOAD_FRAMES 'frames' images
+    """
+    if len(request.files.getlist('frames')) > VIDEO_MAX_UPLOAD_FRAMES:
+        return jsonify({"error": f"Upload at most {VIDEO_MAX_UPLOAD_FRAMES} frames"}), 413
+    
+    crop, error = _request_crop()
+    if error:
+        return error
+    try:
+        mode = (request.values.get('sampling') or "interval").strip().lower()
+        segment_seconds = _float_param('segment_seconds', VIDEO_SEGMENT_SECONDS)
+        sampler = FrameSampler(mode=mode,
+                               interval=_float_param('interval', VIDEO_SAMPLE_INTERVAL),
+                               scene_threshold=_float_param('scene_threshold', VIDEO_SCENE_THRESHOLD),
+                               max_gap=segment_seconds,
+                               segment_seconds=segment_seconds)
+        fps = _float_param('fps', 1.0)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {str(e)}"}), 400
+    
+    if 'video' in request.files:
+        frames = video_frames(request.files['video'].stream, max_seconds=VIDEO_MAX_SECONDS)
+    elif request.files.getlist('frames'):
+        frames = image_frames([upload.stream for upload in request.files.getlist('frames')], fps=fps)
+    else:
+        return jsonify({"error": "Upload a 'video' file or one or more 'frames' images"}), 400
+    
+    try:
+        with model_pool.acquire(crop) as model:
+            response = _diagnose_video(model, frames, sampler, _request_region())
+    except VideoUnavailable as e:
+        return jsonify({"error": str(e)}), 501
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.exception(f"Video prediction error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+    if response is None:
+        return jsonify({"error": "No frames could be decoded"}), 400
+    return jsonify(response)
+
+def _run_job(image_bytes, params):
+    """Job queue handler: diagnose an upload submitted through /jobs"""
+    timings = {}
+    stage_start = time.perf_counter()
+    image = _decode_image(image_bytes)
+    timings["decode_ms"] = _elapsed_ms(stage_start)
+    
+    # Jobs queued before crops existed carry no crop and use the default
+    args = (params.get("region"), timings, params.get("explain"), params.get("crop"),
+            params.get("report", "inline"))
+    if admission is None:
+        return _diagnose(image, image_bytes, *args)
+    try:
+        with admission.slot(params.get("priority", "interactive")):
+            return _diagnose(image, image_bytes, *args)
+    except Overloaded as e:
+        raise RetryLater(str(e), delay=e.retry_after)
+
+jobs = None
+if JOBS_ENABLED:
+    jobs = JobQueue(JOBS_DB_PATH, _run_job, workers=JOBS_WORKERS,
+                    max_pending=JOBS_MAX_PENDING, retention_seconds=JOBS_RETENTION_SECONDS,
+                    lease_seconds=JOBS_LEASE_SECONDS)
+
+@api.route('/jobs', methods=['POST'])
+def submit_job():
+    """
+    Endpoint for asynchronous disease prediction
+    
+    Expects:
+        - The same fields as /predict
+        - Optional 'Idempotency-Key' header; resubmitting with the same key
+          returns the original job instead of queueing the work again
         
-        recommendation = model_instance.get_recommendation(disease)
+    Returns:
+        - 202 with job id and status for a new job (200 for a repeated key);
+          poll GET /jobs/<job_id> for the result
+    """
+    if jobs is None:
+        return jsonify({"error": "The job API is disabled"}), 404
+    
+    idempotency_key = (request.headers.get('Idempotency-Key') or "").strip() or None
+    if idempotency_key is not None and len(idempotency_key) > 255:
+        return jsonify({"error": "Idempotency-Key must be at most 255 characters"}), 400
+    
+    crop, error = _request_crop()
+    if error:
+        return error
+    image, image_bytes, error = _open_uploaded_image()
+    if error:
+        return error
+    
+    try:
+        job, created = jobs.submit(
+            image_bytes,
+            {"region": _request_region(), "priority": _request_lane(), "explain": _request_explain(),
+             "crop": crop, "report": _request_report()},
+            idempotency_key=idempotency_key
+        )
+    except IdempotencyConflict as e:
+        return jsonify({"error": str(e)}), 422
+    except QueueFull as e:
+        response = jsonify({"error": f"Server busy: {str(e)}"})
+        response.status_code = 429
+        response.headers["Retry-After"] = "10"
+        return response
+    
+    response = jsonify(job)
+    response.status_code = 202 if created else 200
+    response.headers["Location"] = f"/jobs/{job['job_id']}"
+    return response
+
+@api.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    Endpoint for polling an asynchronous prediction
+    
+    Returns:
+        - JSON with status (queued, running, done or failed), timestamps and
+          attempts; 'result' holds the /predict response once done, 'error'
+          the reason once failed
+    """
+    if jobs is None:
+        return jsonify({"error": "The job API is disabled"}), 404
+    
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job id"}), 404
+    return jsonify(job)
+
+@api.route('/similar', methods=['POST'])
+@admission_controlled
+def similar():
+    """
+    Endpoint for finding past cases that look like an image, using the default crop's model
+    
+    Expects:
+        - An image file with field name 'image'
+        - Optional 'k' (number of matches, default 5, max 100)
         
-        try:
-            pdf_base64 = model_instance.generate_full_report(image, disease, confidence, recommendation)
-        except Exception as e:
-            print(f"PDF generation failed: {str(e)}")
-            return jsonify({
-                "disease": disease,
-                "confidence": confidence,
-                "recommendation": recommendation,
-                "pdf": None,
-                "pdf_error": f"Could not generate PDF: {str(e)}"
-            })
+    Returns:
+        - JSON with the predicted disease and the most similar stored cases
+    """
+    if similarity_index is None:
+        return jsonify({"error": "Similarity index is disabled"}), 404
+    
+    try:
+        k = int(request.values.get('k', 5))
+    except ValueError:
+        return jsonify({"error": "k must be an integer"}), 400
+    k = max(1, min(k, 100))
+    
+    try:
+        image, _, error = _open_uploaded_image()
+        if error:
+            return error
+        
+        with model_pool.acquire(model_pool.default_crop) as model:
+            disease, confidence, embedding = model.predict(image, return_embedding=True)
+        matches = similarity_index.search(embedding, k=k, nprobe=SIMILARITY_NPROBE)
         
         return jsonify({
             "disease": disease,
             "confidence": confidence,
-            "recommendation": recommendation,
-            "pdf": pdf_base64
+            "matches": matches
+        })
+    except Exception as e:
+        logger.exception(f"Similarity search error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+def _parse_time(value):
+    """Parse a Unix timestamp or ISO 8601 string from a query parameter"""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+@api.route('/history', methods=['GET'])
+def history():
+    """
+    Endpoint for browsing past diagnoses, newest first
+    
+    Query parameters:
+        - crop: only this crop
+        - disease: only this class name
+        - since / until: Unix timestamp or ISO 8601 time range
+        - limit: page size (default 50, max 500)
+        - cursor: next_cursor from the previous page
+        
+    Returns:
+        - JSON with items and next_cursor (null on the last page)
+    """
+    if history_store is None:
+        return jsonify({"error": "History is disabled"}), 404
+    
+    crop = None
+    if request.args.get('crop'):
+        crop, error = _request_crop()
+        if error:
+            return error
+    
+    try:
+        limit = max(1, min(int(request.args.get('limit', 50)), 500))
+        since = _parse_time(request.args.get('since'))
+        until = _parse_time(request.args.get('until'))
+        page = history_store.query(
+            disease=request.args.get('disease'),
+            since=since,
+            until=until,
+            limit=limit,
+            cursor=request.args.get('cursor'),
+            crop=crop
+        )
+    except ValueError as e:
+        return jsonify({"error": f"Invalid query parameter: {str(e)}"}), 400
+    
+    return jsonify(page)
+
+@api.route('/analytics', methods=['GET'])
+def analytics_summary():
+    """
+    Endpoint for disease trends from precomputed rollups
+    
+    Query parameters:
+        - granularity: 'hour' or 'day' (default 'day')
+        - crop: the crop whose predictions are counted (default: the default crop)
+        - start / end: Unix timestamp or ISO 8601 time range
+        - region: only this region
+        - disease: only this class name of the crop
+        - by_region: 'true' to keep regions separate
+        
+    Returns:
+        - JSON with per-bucket counts and mean confidence, plus totals per disease
+    """
+    if analytics is None:
+        return jsonify({"error": "Analytics are disabled"}), 404
+    
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in GRANULARITIES:
+        return jsonify({"error": f"granularity must be one of: {', '.join(GRANULARITIES)}"}), 400
+    
+    # One crop at a time: crops share class names such as "Healthy"
+    crop, error = _request_crop()
+    if error:
+        return error
+    disease = request.args.get('disease')
+    if disease and disease not in model_pool.classes(crop):
+        return jsonify({"error": f"Unknown disease for {crop}: {disease}"}), 400
+    
+    try:
+        start = _parse_time(request.args.get('start'))
+        end = _parse_time(request.args.get('end'))
+    except ValueError as e:
+        return jsonify({"error": f"Invalid query parameter: {str(e)}"}), 400
+    
+    return jsonify(analytics.query(
+        granularity=granularity,
+        start=start,
+        end=end,
+        region=request.args.get('region'),
+        disease=disease,
+        by_region=request.args.get('by_region', '').lower() in ('1', 'true', 'yes'),
+        crop=crop
+    ))
+
+@api.route('/stats', methods=['GET'])
+def stats():
+    """
+    Endpoint for service counters
+    
+    Returns:
+        - JSON with admission queues, job counts, near-duplicate cache hit rate,
+          history writer counters, the report store, the log queue and the model pool (loaded
+          models, load times, evictions and reloads)
+    """
+    return jsonify({
+        "models": model_pool.stats(),
+        "admission": admission.stats() if admission is not None else None,
+        "jobs": jobs.stats() if jobs is not None else None,
+        "dedup": duplicate_cache.stats() if duplicate_cache is not None else None,
+        "history": history_store.stats() if history_store is not None else None,
+        "explanations": explanations.stats() if explanations is not None else None,
+        "reports": report_store.stats() if report_store is not None else None,
+        "logging": logging_stats()
+    })
+
+@api.route('/explain/<case_id>', methods=['GET'])
+def explain(case_id):
+    """
+    Endpoint for Grad-CAM explanations of recent diagnoses
+    
+    Expects:
+        - A case id returned by /predict (or a job) sent with explain=true,
+          within EXPLAIN_TTL_SECONDS and on the same server process
+        - Optional 'format=png' to receive the overlay image itself
+        
+    Returns:
+        - JSON with disease, confidence, the coarse heatmap (rows of values in
+          [0, 1]) and a base64 PNG overlay, or the PNG alone; 404 if the case
+          was not kept for explanation or has expired
+    """
+    try:
+        entry, heatmap = _explanation(case_id)
+        if entry is None:
+            return jsonify({"error": "No explanation available for this case; "
+                                     "send explain=true with the prediction and ask within "
+                                     f"{int(EXPLAIN_TTL_SECONDS)} seconds"}), 404
+        
+        png = encode_png(render_overlay(entry["image"], heatmap))
+        if request.args.get('format', '').lower() == 'png':
+            return Response(png, mimetype="image/png")
+        return jsonify({
+            "case_id": case_id,
+            "disease": entry["disease"],
+            "confidence": entry["confidence"],
+            "heatmap": [[round(float(v), 3) for v in row] for row in heatmap],
+            "overlay": base64.b64encode(png).decode("ascii")
         })
     except Exception as e:
-        import traceback
-        print(f"Prediction error: {str(e)}")
-        print(traceback.format_exc())
+        logger.exception(f"Explanation error: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@api.route('/reports/<key>', methods=['GET'])
+def get_report(key):
+    """
+    Endpoint for stored PDF reports
+    
+    Expects:
+        - A key from the report_url of a /predict response
+        
+    Returns:
+        - The PDF, sent from disk (with sendfile where the server supports it)
+          and cacheable indefinitely since its content never changes; 404 once
+          it has been evicted
+    """
+    if report_store is None:
+        return jsonify({"error": "The report store is disabled"}), 404
+    path = report_store.get(key) if KEY_PATTERN.match(key) else None
+    if path is None:
+        return jsonify({"error": "Unknown or expired report"}), 404
+    try:
+        response = send_file(path, mimetype="application/pdf", download_name="crop_disease_report.pdf",
+                             etag=key, max_age=365 * 24 * 3600)
+    except FileNotFoundError:
+        return jsonify({"error": "Unknown or expired report"}), 404
+    response.cache_control.immutable = True
+    return response
+
 @api.route('/health', methods=['GET'])
 def health_check():
-    """Health check endpoint"""
-    return jsonify({"status": "healthy", "model_loaded": model_instance.model is not None}) 
\ No newline at end of file
+    """Health check endpoint; never loads a model"""
+    default_model = model_pool.loaded(model_pool.default_crop)
+    return jsonify({
+        "status": "healthy",
+        "model_loaded": default_model is not None and default_model.model is not None,
+        "crops": model_pool.crops,
+        "default_crop": model_pool.default_crop,
+        "recommendations": default_model.recommendations.describe() if default_model is not None else None
+    })
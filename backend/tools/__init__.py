@@ -0,0 +1,6 @@
+"""
+Command-line tools for the Crop Disease Detection Backend
+
+Run them as modules from the project root, e.g.
+``python -m backend.tools.convert_checkpoint``.
+"""
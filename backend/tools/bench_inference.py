@@ -0,0 +1,94 @@
+"""
+Compare CPU inference profiles.
+
+Each profile is loaded and warmed up, then timed on random input at every
+batch size. The report shows warmup time, median and p90 latency per batch,
+throughput, and how far the predictions drift from the standard profile
+(bf16 trades a little accuracy for speed).
+
+Usage:
+    python -m backend.tools.bench_inference models/crop_best_model.safetensors
+    python -m backend.tools.bench_inference models/crop_best_model.pth \\
+        --profiles standard,channels_last,compiled --batch-sizes 1,16 --iterations 50
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+
+
+def time_batches(model, batch, iterations):
+    """
+    Time repeated forward passes.
+
+    Returns:
+        list: Latency of each pass in milliseconds
+    """
+    durations = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        model._forward(batch)
+        durations.append((time.perf_counter() - start) * 1000)
+    return durations
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark CPU inference profiles")
+    parser.add_argument("model_path", help="Checkpoint (.pth or .safetensors)")
+    parser.add_argument("--profiles", default=None,
+                        help="Comma-separated profile names (default: all)")
+    parser.add_argument("--batch-sizes", default="1,16", help="Comma-separated batch sizes")
+    parser.add_argument("--iterations", type=int, default=30, help="Timed passes per batch size")
+    args = parser.parse_args(argv)
+
+    from backend.app.model import CropDiseaseModel, INFERENCE_PROFILES
+
+    if not os.path.exists(args.model_path):
+        print(f"ERROR: Model file not found: {args.model_path}")
+        return 1
+    profiles = args.profiles.split(",") if args.profiles else list(INFERENCE_PROFILES)
+    unknown = [p for p in profiles if p not in INFERENCE_PROFILES]
+    if unknown:
+        print(f"ERROR: Unknown profiles: {', '.join(unknown)}")
+        return 1
+    batch_sizes = [int(b) for b in args.batch_sizes.split(",")]
+
+    torch.manual_seed(0)
+    inputs = {b: torch.randn(b, 3, 224, 224) for b in batch_sizes}
+    reference = {}
+    rows = []
+
+    for profile in profiles:
+        start = time.perf_counter()
+        model = CropDiseaseModel(model_path=args.model_path, enable_gemini=False, profile=profile)
+        ready_s = time.perf_counter() - start
+
+        for batch_size in batch_sizes:
+            batch = inputs[batch_size]
+            probabilities, _ = model._forward(batch)
+            if profile == profiles[0]:
+                reference[batch_size] = probabilities
+            drift = float((probabilities - reference[batch_size]).abs().max())
+
+            durations = time_batches(model, batch, args.iterations)
+            median = float(np.median(durations))
+            rows.append((profile, ready_s, batch_size, median, float(np.percentile(durations, 90)),
+                         batch_size * 1000 / median, drift))
+        del model
+
+    print()
+    print(f"Reference for drift: {profiles[0]}; {torch.get_num_threads()} threads")
+    print(f"{'profile':<15} {'load+warmup s':>13} {'batch':>6} {'p50 ms':>9} {'p90 ms':>9} "
+          f"{'img/s':>8} {'max prob diff':>14}")
+    for profile, ready_s, batch_size, median, p90, throughput, drift in rows:
+        print(f"{profile:<15} {ready_s:>13.1f} {batch_size:>6} {median:>9.1f} {p90:>9.1f} "
+              f"{throughput:>8.1f} {drift:>14.4f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
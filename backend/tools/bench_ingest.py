@@ -0,0 +1,56 @@
+"""
+Compare upload size and end-to-end latency with and without ingest downscaling.
+
+Each image is sent to a running backend both as the original bytes and after
+prepare_upload(), and the median round trip over several runs is reported.
+The prepared timing includes the time spent downscaling.
+
+Usage:
+    python -m backend.tools.bench_ingest photo1.jpg photo2.jpg --runs 5
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from frontend.config import BACKEND_API_URL
+from frontend.utils import prepare_upload, format_bytes, api_predict
+
+
+def _median_seconds(fn, runs):
+    durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ingest downscaling against raw uploads")
+    parser.add_argument("images", nargs="+", help="Image files to upload")
+    parser.add_argument("--runs", type=int, default=5, help="Uploads per image and mode")
+    parser.add_argument("--url", default=f"{BACKEND_API_URL}/predict", help="Prediction endpoint")
+    args = parser.parse_args(argv)
+
+    print(f"{'image':<30} {'raw':>9} {'prepared':>9} {'raw s':>7} {'prep s':>7} {'speedup':>8}")
+    for path in args.images:
+        if not os.path.exists(path):
+            print(f"ERROR: Image not found: {path}")
+            return 1
+        with open(path, "rb") as f:
+            raw = f.read()
+
+        upload_data, stats = prepare_upload(raw)
+        raw_s = _median_seconds(lambda: api_predict(raw, api_url=args.url), args.runs)
+        prep_s = _median_seconds(lambda: api_predict(prepare_upload(raw)[0], api_url=args.url), args.runs)
+
+        print(f"{os.path.basename(path)[:30]:<30} {format_bytes(stats['original_bytes']):>9} "
+              f"{format_bytes(stats['upload_bytes']):>9} {raw_s:>7.2f} {prep_s:>7.2f} {raw_s / prep_s:>7.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
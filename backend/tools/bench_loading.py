@@ -0,0 +1,122 @@
+"""
+Measure cold start time and per-worker memory for each checkpoint format.
+
+Each format is loaded by several freshly spawned worker processes at once.
+Once every worker is ready, their memory is read from
+``/proc/<pid>/smaps_rollup``: ``Pss`` splits shared pages between the
+processes mapping them, so a memory-mapped checkpoint shows up as a large
+``Shared`` figure and a small ``Private`` one.
+
+Usage:
+    python -m backend.tools.bench_loading models/crop_best_model.pth \\
+        models/crop_best_model.safetensors --workers 4
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+import sys
+import time
+
+
+def _worker(model_path, ready, done, timings):
+    """Load the model in a fresh process and report how long it took"""
+    start = time.perf_counter()
+    from backend.app.model import CropDiseaseModel
+    imported = time.perf_counter()
+
+    CropDiseaseModel(model_path=model_path, enable_gemini=False)
+    loaded = time.perf_counter()
+
+    timings.put((os.getpid(), imported - start, loaded - imported))
+    ready.set()
+    done.wait()
+
+
+def read_smaps_rollup(pid):
+    """
+    Read the memory summary of a process.
+
+    Args:
+        pid (int): Process id
+
+    Returns:
+        dict: Field name to size in KB (Rss, Pss, Shared_Clean, Private_Dirty, ...)
+    """
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 3 and parts[-1] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[-2])
+    except OSError:
+        pass
+    return fields
+
+
+def bench_format(model_path, workers):
+    """
+    Spawn ``workers`` processes that all load ``model_path`` concurrently.
+
+    Returns:
+        dict: Aggregated timings (seconds) and memory (MB)
+    """
+    ctx = mp.get_context("spawn")
+    done = ctx.Event()
+    timings = ctx.Queue()
+    procs = []
+    events = []
+    for _ in range(workers):
+        ready = ctx.Event()
+        proc = ctx.Process(target=_worker, args=(model_path, ready, done, timings))
+        proc.start()
+        procs.append(proc)
+        events.append(ready)
+
+    for ready in events:
+        ready.wait()
+
+    results = [timings.get() for _ in procs]
+    memory = [read_smaps_rollup(pid) for pid, _, _ in results]
+
+    done.set()
+    for proc in procs:
+        proc.join()
+
+    def total(field):
+        return sum(m.get(field, 0) for m in memory) / 1024
+
+    return {
+        "import_s": sum(r[1] for r in results) / len(results),
+        "load_s": sum(r[2] for r in results) / len(results),
+        "rss_mb": total("Rss"),
+        "pss_mb": total("Pss"),
+        "shared_mb": total("Shared_Clean") + total("Shared_Dirty"),
+        "private_mb": total("Private_Clean") + total("Private_Dirty"),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare checkpoint formats for cold start and memory")
+    parser.add_argument("checkpoints", nargs="+", help="Checkpoint files (.pth and/or .safetensors)")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent worker processes per format")
+    args = parser.parse_args(argv)
+
+    print(f"{'checkpoint':<40} {'import s':>9} {'load s':>8} {'RSS MB':>9} "
+          f"{'PSS MB':>9} {'shared MB':>10} {'private MB':>11}")
+    for path in args.checkpoints:
+        if not os.path.exists(path):
+            print(f"ERROR: Checkpoint not found: {path}")
+            return 1
+        # A first pass warms the page cache so both formats are compared from memory
+        bench_format(path, 1)
+        r = bench_format(path, args.workers)
+        print(f"{os.path.basename(path):<40} {r['import_s']:>9.2f} {r['load_s']:>8.3f} "
+              f"{r['rss_mb']:>9.1f} {r['pss_mb']:>9.1f} {r['shared_mb']:>10.1f} {r['private_mb']:>11.1f}")
+    print(f"(memory columns are totals over {args.workers} workers)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""
+Partition the similar-cases embedding index for fast approximate search.
+
+Exact search scans every stored embedding, which is fine up to a few hundred
+thousand cases. Beyond that, cluster the index into inverted lists so
+``/similar`` only scans the lists closest to the query. Re-run this
+periodically: rows added after a build are scanned exactly until the next one.
+The index is opened read-only, so this can run while the backend is serving
+and adding to it; the backend switches to the new partitions on its next
+search, without a restart. Every model version's index below
+SIMILARITY_INDEX_DIR is partitioned unless ``--model-version`` picks one.
+
+Usage:
+    python -m backend.tools.build_similarity_index --lists 1024
+    python -m backend.tools.build_similarity_index --model-version crop_best_model --benchmark 100
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+from backend.utils.config import SIMILARITY_INDEX_DIR, SIMILARITY_NPROBE
+from backend.utils.embedding_index import EmbeddingIndex, index_dir
+
+
+def _has_index(directory):
+    return os.path.exists(os.path.join(directory, "vectors.npy"))
+
+
+def _index_dim(directory):
+    vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r")
+    return vectors.shape[1]
+
+
+def benchmark(index, queries, k, nprobe):
+    """Time partitioned and exact search for random stored rows and report recall"""
+    rng = np.random.default_rng(1)
+    rows = rng.choice(index.count, size=min(queries, index.count), replace=False)
+    exact_ms, probe_ms, hits = [], [], 0
+    for row in rows:
+        query = np.asarray(index._vectors[row], dtype=np.float32)
+
+        start = time.perf_counter()
+        exact = index.search(query, k=k, nprobe=0)
+        exact_ms.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        approx = index.search(query, k=k, nprobe=nprobe)
+        probe_ms.append((time.perf_counter() - start) * 1000)
+
+        exact_ids = {r.get("id") for r in exact}
+        hits += len(exact_ids & {r.get("id") for r in approx})
+
+    print(f"exact scan:     p50 {np.percentile(exact_ms, 50):.1f} ms, p95 {np.percentile(exact_ms, 95):.1f} ms")
+    print(f"nprobe={nprobe:<4}     p50 {np.percentile(probe_ms, 50):.1f} ms, p95 {np.percentile(probe_ms, 95):.1f} ms")
+    print(f"recall@{k}:      {hits / (len(rows) * k):.3f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build inverted-list partitions for the similar-cases index")
+    parser.add_argument("--index-dir", default=SIMILARITY_INDEX_DIR,
+                        help="Index directory, or the root holding one per model version")
+    parser.add_argument("--model-version", default=None,
+                        help="Only the index of this model version (default: all below --index-dir)")
+    parser.add_argument("--lists", type=int, default=None,
+                        help="Number of partitions (default: about 4 x sqrt(rows))")
+    parser.add_argument("--iterations", type=int, default=10, help="k-means iterations")
+    parser.add_argument("--sample-size", type=int, default=100000, help="Rows used to train centroids")
+    parser.add_argument("--benchmark", type=int, default=0, metavar="QUERIES",
+                        help="After building, compare latency and recall against exact search")
+    parser.add_argument("--nprobe", type=int, default=SIMILARITY_NPROBE, help="Partitions probed when benchmarking")
+    args = parser.parse_args(argv)
+
+    if args.model_version:
+        directories = [index_dir(args.index_dir, args.model_version)]
+    elif _has_index(args.index_dir):
+        directories = [args.index_dir]
+    elif os.path.isdir(args.index_dir):
+        directories = sorted(entry.path for entry in os.scandir(args.index_dir) if entry.is_dir())
+    else:
+        directories = []
+    directories = [directory for directory in directories if _has_index(directory)]
+    if not directories:
+        print(f"ERROR: No embedding index found in {args.index_dir}")
+        return 1
+
+    for directory in directories:
+        index = EmbeddingIndex(directory, _index_dim(directory), read_only=True)
+        lists = args.lists or max(1, int(4 * np.sqrt(index.count)))
+
+        start = time.perf_counter()
+        index.build_partitions(n_lists=lists, iterations=args.iterations, sample_size=args.sample_size)
+        print(f"{directory}: partitioned {index.count} embeddings into {lists} lists "
+              f"in {time.perf_counter() - start:.1f}s")
+
+        if args.benchmark:
+            benchmark(index, args.benchmark, k=10, nprobe=args.nprobe)
+        index.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
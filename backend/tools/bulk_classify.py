@@ -0,0 +1,348 @@
+"""
+Classify a directory tree of images offline, without going through the API.
+
+Images are decoded and transformed by a pool of DataLoader worker processes
+and classified in large batches. Only the model runs: no Gemini
+recommendations and no PDF reports. Results are appended to a CSV file, or
+written as complete Parquet part files into an output directory. The paths
+of results on disk are recorded in a checkpoint file, so an interrupted run
+picks up where it stopped. Rows that reached the output but not the
+checkpoint before a crash are found on resume and not classified again.
+
+Usage:
+    python -m backend.tools.bulk_classify /data/archive -o results.csv
+    python -m backend.tools.bulk_classify /data/archive -o results.parquet --batch-size 128
+"""
+
+import argparse
+import csv
+import os
+import re
+import sys
+import time
+
+import torch
+from PIL import Image
+from torch.utils.data import DataLoader, Dataset
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp", ".tif", ".tiff")
+
+RESULT_FIELDS = ["path", "disease", "confidence", "error"]
+
+PART_FILE_PATTERN = re.compile(r"^part-(\d+)\.parquet$")
+
+
+def scan_images(root, extensions=IMAGE_EXTENSIONS):
+    """
+    Find all image files below a directory.
+
+    Args:
+        root (str): Directory to scan
+        extensions (tuple): Lower-case file extensions to accept
+
+    Returns:
+        list: Paths relative to ``root``, in a stable sorted order
+    """
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith(extensions):
+                found.append(os.path.relpath(os.path.join(dirpath, filename), root))
+    return found
+
+
+class ImageFileDataset(Dataset):
+    """Decode and transform image files inside DataLoader workers"""
+
+    def __init__(self, root, paths, transform, fast_decode=False):
+        self.root = root
+        self.paths = paths
+        self.transform = transform
+        self.fast_decode = fast_decode
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, index):
+        path = self.paths[index]
+        try:
+            with Image.open(os.path.join(self.root, path)) as img:
+                if self.fast_decode:
+                    # Let the JPEG decoder skip detail we would throw away when resizing
+                    img.draft("RGB", (448, 448))
+                tensor = self.transform(img.convert("RGB"))
+            return tensor, path, ""
+        except Exception as e:
+            return torch.zeros(3, 224, 224), path, f"{type(e).__name__}: {e}"
+
+
+def _worker_init(worker_id):
+    # Decoding is per-process parallel already; extra intra-op threads only contend
+    torch.set_num_threads(1)
+
+
+class CheckpointFile:
+    """Append-only record of the relative paths that have been written out"""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.done = {line.rstrip("\n") for line in f if line.strip()}
+        self._file = open(path, "a", encoding="utf-8")
+
+    def mark(self, paths):
+        self._file.write("".join(f"{p}\n" for p in paths))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.done.update(paths)
+
+    def close(self):
+        self._file.close()
+
+
+class CsvResultWriter:
+    """Append result rows to a CSV file, writing the header only once"""
+
+    def __init__(self, path):
+        self.path = path
+        is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+        if not is_new:
+            self._drop_partial_row()
+        self._file = open(path, "a", newline="", encoding="utf-8")
+        self._writer = csv.DictWriter(self._file, fieldnames=RESULT_FIELDS)
+        if is_new:
+            self._writer.writeheader()
+
+    def _drop_partial_row(self):
+        # A run killed in the middle of a write can leave half a row at the end
+        with open(self.path, "rb+") as f:
+            data = f.read()
+            if not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+
+    def durable_paths(self):
+        """Paths of the rows already in the file"""
+        with open(self.path, newline="", encoding="utf-8") as f:
+            return [row["path"] for row in csv.DictReader(f) if row.get("path")]
+
+    def write(self, rows):
+        """Write rows; returns the paths now safely on disk"""
+        self._writer.writerows(rows)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return [row["path"] for row in rows]
+
+    def close(self):
+        self._file.close()
+        return []
+
+
+class ParquetResultWriter:
+    """
+    Write result rows into a directory of Parquet part files.
+
+    A Parquet file is only readable once its footer is written, so rows are
+    buffered and written out ``rows_per_part`` at a time as a complete
+    ``part-NNNNN.parquet`` file (written under a temporary name and renamed
+    into place). Only then are their paths reported as done, so a killed run
+    never leaves checkpointed rows in an unreadable file. Readers such as
+    ``pandas.read_parquet`` load the whole directory as one table.
+    """
+
+    def __init__(self, path, rows_per_part=50000):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet output requires pyarrow: pip install pyarrow")
+
+        self._pa = pa
+        self._pq = pq
+        self.path = path
+        self.rows_per_part = rows_per_part
+        os.makedirs(path, exist_ok=True)
+        for name in os.listdir(path):
+            if name.endswith(".tmp"):
+                # Left behind by a run killed while writing a part
+                os.remove(os.path.join(path, name))
+        parts = [int(m.group(1)) for m in map(PART_FILE_PATTERN.match, os.listdir(path)) if m]
+        # Continue after the highest part, so removed parts never cause an overwrite
+        self._part = max(parts) + 1 if parts else 0
+        self.schema = pa.schema([
+            ("path", pa.string()),
+            ("disease", pa.string()),
+            ("confidence", pa.float64()),
+            ("error", pa.string()),
+        ])
+        self._rows = []
+
+    def durable_paths(self):
+        """Paths of the rows already in complete part files"""
+        paths = []
+        for name in sorted(os.listdir(self.path)):
+            if PART_FILE_PATTERN.match(name):
+                table = self._pq.read_table(os.path.join(self.path, name), columns=["path"])
+                paths.extend(table.column("path").to_pylist())
+        return paths
+
+    def write(self, rows):
+        """Buffer rows; returns the paths of rows written out in a complete part file"""
+        self._rows.extend(rows)
+        if len(self._rows) >= self.rows_per_part:
+            return self.flush()
+        return []
+
+    def flush(self):
+        """Write the buffered rows as one part file; returns their paths"""
+        if not self._rows:
+            return []
+        columns = {field: [row[field] for row in self._rows] for field in RESULT_FIELDS}
+        part_path = os.path.join(self.path, f"part-{self._part:05d}.parquet")
+        # The leading dot keeps readers of the directory away from the unfinished file
+        tmp_path = os.path.join(self.path, f".part-{self._part:05d}.parquet.tmp")
+        self._pq.write_table(self._pa.Table.from_pydict(columns, schema=self.schema), tmp_path)
+        with open(tmp_path, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, part_path)
+        self._part += 1
+        paths = [row["path"] for row in self._rows]
+        self._rows = []
+        return paths
+
+    def close(self):
+        return self.flush()
+
+
+def open_writer(output, rows_per_part=50000):
+    """Choose a result writer from the output path extension"""
+    if output.endswith(".parquet"):
+        return ParquetResultWriter(output, rows_per_part=rows_per_part)
+    return CsvResultWriter(output)
+
+
+def classify(root, output, checkpoint=None, batch_size=64, workers=None,
+             model_path=None, fast_decode=False, log_every=20, rows_per_part=50000):
+    """
+    Classify every image below ``root`` and write the results to ``output``.
+
+    Args:
+        root (str): Directory tree to scan
+        output (str): ``.csv`` file or ``.parquet`` directory
+        checkpoint (str): Checkpoint file, defaults to ``output + ".checkpoint"``
+        batch_size (int): Images per forward pass
+        workers (int): Decoder processes, defaults to the CPU count
+        model_path (str): Model file, defaults to the backend configuration
+        fast_decode (bool): Use reduced-size JPEG decoding
+        log_every (int): Print progress every N batches
+        rows_per_part (int): Rows per Parquet part file
+
+    Returns:
+        dict: Number of images processed, skipped, failed and the throughput
+    """
+    from backend.app.model import CropDiseaseModel
+
+    checkpoint = CheckpointFile(checkpoint or output.rstrip("/") + ".checkpoint")
+    writer = open_writer(output, rows_per_part=rows_per_part)
+    # A crash between writing rows and checkpointing them leaves rows in the
+    # output that the checkpoint does not know about; record them instead of
+    # classifying (and writing) those images a second time
+    recovered = [p for p in writer.durable_paths() if p not in checkpoint.done]
+    if recovered:
+        checkpoint.mark(recovered)
+        print(f"Recovered {len(recovered)} results missing from the checkpoint")
+
+    paths = scan_images(root)
+    pending = [p for p in paths if p not in checkpoint.done]
+    skipped = len(paths) - len(pending)
+    print(f"Found {len(paths)} images, {skipped} already done, {len(pending)} to classify")
+
+    stats = {"processed": 0, "skipped": skipped, "failed": 0, "images_per_sec": 0.0}
+    if not pending:
+        writer.close()
+        checkpoint.close()
+        return stats
+
+    model = CropDiseaseModel(model_path=model_path, enable_gemini=False)
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    loader = DataLoader(
+        ImageFileDataset(root, pending, model.transform, fast_decode=fast_decode),
+        batch_size=batch_size,
+        num_workers=workers,
+        worker_init_fn=_worker_init if workers > 0 else None,
+        prefetch_factor=4 if workers > 0 else None,
+        persistent_workers=False,
+    )
+
+    start = time.perf_counter()
+    try:
+        for batch_idx, (tensors, batch_paths, errors) in enumerate(loader, 1):
+            predictions = model.predict_batch(tensors)
+
+            rows = []
+            for path, error, (disease, confidence) in zip(batch_paths, errors, predictions):
+                if error:
+                    rows.append({"path": path, "disease": None, "confidence": None, "error": error})
+                    stats["failed"] += 1
+                else:
+                    rows.append({"path": path, "disease": disease,
+                                 "confidence": round(confidence, 4), "error": None})
+
+            # Only rows the writer reports as durable are checkpointed: a crash
+            # re-does unwritten batches on resume rather than losing them
+            checkpoint.mark(writer.write(rows))
+            stats["processed"] += len(rows)
+
+            if batch_idx % log_every == 0:
+                elapsed = time.perf_counter() - start
+                print(f"{stats['processed']}/{len(pending)} images, "
+                      f"{stats['processed'] / elapsed:.1f} images/sec")
+    finally:
+        try:
+            checkpoint.mark(writer.close())
+        finally:
+            checkpoint.close()
+        elapsed = time.perf_counter() - start
+        if elapsed > 0:
+            stats["images_per_sec"] = stats["processed"] / elapsed
+
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Classify a directory of crop images offline")
+    parser.add_argument("root", help="Directory tree containing images")
+    parser.add_argument("-o", "--output", required=True,
+                        help="Output .csv file or .parquet directory")
+    parser.add_argument("--checkpoint", default=None,
+                        help="Checkpoint file used to resume (default: <output>.checkpoint)")
+    parser.add_argument("--batch-size", type=int, default=64, help="Images per forward pass")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Decoder processes (default: CPU count, 0 decodes in-process)")
+    parser.add_argument("--model-path", default=None, help="Model file (default: MODEL_PATH)")
+    parser.add_argument("--rows-per-part", type=int, default=50000,
+                        help="Rows per Parquet part file; unwritten rows are redone after a crash")
+    parser.add_argument("--fast-decode", action="store_true",
+                        help="Decode JPEGs at reduced size before resizing (faster, slightly different pixels)")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.root):
+        print(f"ERROR: Not a directory: {args.root}")
+        return 1
+
+    stats = classify(args.root, args.output, checkpoint=args.checkpoint,
+                     batch_size=args.batch_size, workers=args.workers,
+                     model_path=args.model_path, fast_decode=args.fast_decode,
+                     rows_per_part=args.rows_per_part)
+
+    print(f"Done: {stats['processed']} classified ({stats['failed']} failed), "
+          f"{stats['skipped']} skipped, {stats['images_per_sec']:.1f} images/sec")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+"""
+Check the import time of the backend and frontend entry points.
+
+Each entry point is imported in a fresh interpreter with
+``python -X importtime``. The check fails when an import takes longer than
+its budget, or when it loads a module it should only load on first use
+(e.g. the Gemini client, the PDF libraries, torchvision or Dash). The
+budgets leave headroom over a typical developer machine; the
+lazy-import rules do not depend on the machine. Run it before merging
+changes to module-level imports.
+
+Usage:
+    python -m backend.tools.check_import_time
+    python -m backend.tools.check_import_time --module backend.app.model --verbose
+    python -m backend.tools.check_import_time --budget-scale 2   # slow CI machines
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Entry point -> (budget in seconds, modules it must not import)
+ENTRY_POINTS = {
+    "backend.app": (1.0, ["torch", "google.generativeai", "fpdf"]),
+    "backend.app.recommendations": (1.0, ["google.generativeai", "google.api_core", "torch"]),
+    "backend.utils.report_generator": (0.5, ["fpdf"]),
+    "backend.app.model": (4.0, ["torchvision", "timm", "google.generativeai", "fpdf"]),
+    "backend.tools.evaluate": (5.0, ["torchvision", "timm", "google.generativeai", "fpdf"]),
+    "backend.tools.loadtest": (1.0, ["torch", "google.generativeai"]),
+    "backend.tools.bench_ingest": (1.0, ["dash", "reportlab"]),
+    "frontend.api_client": (0.5, ["dash", "reportlab"]),
+    "frontend.callbacks": (3.0, ["reportlab"]),
+}
+
+
+def _importtime(code, python=sys.executable):
+    """Run code in a fresh interpreter with ``-X importtime``; returns {module: cumulative seconds}"""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [REPO_ROOT, env.get("PYTHONPATH")]))
+    result = subprocess.run([python, "-X", "importtime", "-c", code],
+                            cwd=REPO_ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        last_line = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else ""
+        raise RuntimeError(f"{code} failed: {last_line}")
+
+    imported = {}
+    for line in result.stderr.splitlines():
+        # "import time:  self [us] | cumulative | imported package"
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        imported[fields[2].strip()] = int(fields[1]) / 1e6
+    return imported
+
+
+def measure_import(module):
+    """
+    Import a module in a fresh interpreter.
+
+    Returns:
+        tuple: (cumulative seconds for the module, {imported module: cumulative seconds})
+
+    Raises:
+        RuntimeError: If the import fails
+    """
+    imported = _importtime(f"import {module}")
+    if module not in imported:
+        raise RuntimeError(f"No import time reported for {module}")
+    return imported[module], imported
+
+
+def check(module, budget, forbidden, runs=3, startup=()):
+    """
+    Time an entry point and look for eagerly imported optional modules.
+
+    Modules in ``startup``, which the bare interpreter imports anyway, are
+    left out of the slowest imports.
+
+    Returns:
+        dict: module, fastest of ``runs`` cumulative times, budget, the
+            forbidden modules that were imported and the slowest imports
+    """
+    times = []
+    imported = {}
+    for _ in range(max(1, runs)):
+        seconds, imported = measure_import(module)
+        times.append(seconds)
+    loaded = [name for name in forbidden
+              if any(m == name or m.startswith(name + ".") for m in imported)]
+    slowest = sorted(((name, s) for name, s in imported.items() if name != module and name not in startup),
+                     key=lambda item: item[1], reverse=True)[:5]
+    return {"module": module, "seconds": min(times), "budget": budget, "forbidden": loaded, "slowest": slowest}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check import times of the backend and frontend entry points")
+    parser.add_argument("--module", action="append", choices=sorted(ENTRY_POINTS), default=None,
+                        help="Entry point to check; repeat for several (default: all)")
+    parser.add_argument("--runs", type=int, default=3, help="Imports per entry point; the fastest counts")
+    parser.add_argument("--budget-scale", type=float, default=1.0, help="Multiply every budget by this factor")
+    parser.add_argument("--verbose", action="store_true", help="Also list the slowest imports of each entry point")
+    args = parser.parse_args(argv)
+
+    startup = set(_importtime("pass"))
+    failures = 0
+    print(f"{'entry point':<32} {'import s':>8} {'budget s':>8}  result")
+    for module in args.module or list(ENTRY_POINTS):
+        budget, forbidden = ENTRY_POINTS[module]
+        budget *= args.budget_scale
+        try:
+            result = check(module, budget, forbidden, args.runs, startup)
+        except RuntimeError as e:
+            print(f"{module:<32} {'-':>8} {budget:>8.2f}  ERROR: {e}")
+            failures += 1
+            continue
+
+        problems = []
+        if result["seconds"] > budget:
+            problems.append("over budget")
+        if result["forbidden"]:
+            problems.append(f"imports {', '.join(result['forbidden'])} eagerly")
+        failures += bool(problems)
+        print(f"{module:<32} {result['seconds']:>8.2f} {budget:>8.2f}  {'; '.join(problems) or 'ok'}")
+        if args.verbose or problems:
+            for name, seconds in result["slowest"]:
+                print(f"    {name:<40} {seconds:>6.2f}s")
+
+    if failures:
+        print(f"ERROR: {failures} entry point(s) failed the import check")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""
+Convert a pickled PyTorch checkpoint into a memory-mappable safetensors file.
+
+The ``module.`` prefix left behind by ``DataParallel`` is stripped once here,
+so the backend can map the weights straight into the model at startup instead
+of unpickling and rewriting every key in each worker. The size, modification
+time and SHA-256 of the source checkpoint are recorded in the metadata, so the
+backend can tell when the ``.pth`` has been replaced since the conversion.
+
+Usage:
+    python -m backend.tools.convert_checkpoint models/crop_best_model.pth
+    python -m backend.tools.convert_checkpoint in.pth -o out.safetensors --arch rexnet_150
+"""
+
+import argparse
+import hashlib
+import os
+import sys
+import time
+
+import torch
+from safetensors.torch import save_file
+
+
+def convert_checkpoint(src, dst=None, arch="rexnet_150"):
+    """
+    Convert a ``.pth`` state dict into a ``.safetensors`` file.
+
+    Args:
+        src (str): Path to the pickled checkpoint
+        dst (str): Output path, defaults to ``src`` with a ``.safetensors`` suffix
+        arch (str): timm architecture name stored in the file metadata
+
+    Returns:
+        str: Path of the written safetensors file
+    """
+    if dst is None:
+        dst = os.path.splitext(src)[0] + ".safetensors"
+
+    checkpoint = torch.load(src, map_location=torch.device('cpu'))
+    if "state_dict" in checkpoint and isinstance(checkpoint["state_dict"], dict):
+        checkpoint = checkpoint["state_dict"]
+
+    state_dict = {}
+    for key, value in checkpoint.items():
+        if not isinstance(value, torch.Tensor):
+            continue
+        # safetensors refuses shared or strided storage, so store dense copies
+        state_dict[key.replace("module.", "")] = value.detach().contiguous().clone()
+
+    stat = os.stat(src)
+    metadata = {
+        "arch": arch,
+        "num_classes": str(_infer_num_classes(state_dict)),
+        "source": os.path.basename(src),
+        "source_size": str(stat.st_size),
+        "source_mtime_ns": str(stat.st_mtime_ns),
+        "source_sha256": file_sha256(src),
+    }
+
+    return write_safetensors(state_dict, dst, metadata)
+
+
+def write_safetensors(state_dict, dst, metadata):
+    """
+    Atomically write a state dict and its string metadata to a safetensors file.
+
+    Returns:
+        str: ``dst``
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(dst)), exist_ok=True)
+    tmp_path = dst + ".tmp"
+    save_file(state_dict, tmp_path, metadata=metadata)
+    os.replace(tmp_path, dst)
+    return dst
+
+
+def file_sha256(path):
+    """SHA-256 of a file's content, as hex"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _infer_num_classes(state_dict):
+    """Guess the number of output classes from the last bias in the state dict"""
+    bias_keys = [k for k in state_dict if k.endswith(".bias")]
+    if not bias_keys:
+        return 0
+    return int(state_dict[bias_keys[-1]].shape[0])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert a .pth checkpoint to safetensors")
+    parser.add_argument("src", help="Path to the pickled .pth checkpoint")
+    parser.add_argument("-o", "--output", default=None,
+                        help="Output path (default: next to the source with .safetensors suffix)")
+    parser.add_argument("--arch", default="rexnet_150",
+                        help="timm architecture name recorded in the metadata (default: rexnet_150)")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.src):
+        print(f"ERROR: Checkpoint not found: {args.src}")
+        return 1
+
+    start = time.perf_counter()
+    dst = convert_checkpoint(args.src, args.output, arch=args.arch)
+    elapsed = time.perf_counter() - start
+
+    src_mb = os.path.getsize(args.src) / (1024 * 1024)
+    dst_mb = os.path.getsize(dst) / (1024 * 1024)
+    print(f"Converted {args.src} ({src_mb:.1f} MB) -> {dst} ({dst_mb:.1f} MB) in {elapsed:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
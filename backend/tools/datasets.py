@@ -0,0 +1,185 @@
+"""
+Labelled image folders for training and evaluation tools.
+
+A labelled folder has one sub-directory per class, named after the class:
+the full name used by the model ("Cassava Mosaic Disease (CMD)"), its
+abbreviation ("CMD", "cmd"), "healthy", or the class index ("3"). Images may
+sit at any depth below their class directory. Directories that match no
+class are reported and skipped.
+
+    data/
+        CBB/  CBSD/  CGM/  CMD/  Healthy/
+"""
+
+import hashlib
+import os
+import re
+
+import torch
+from PIL import Image
+from torch.utils.data import DataLoader, Dataset
+
+from backend.app.model import class_names
+from backend.tools.bulk_classify import scan_images
+
+MEAN = [0.485, 0.456, 0.406]
+STD = [0.229, 0.224, 0.225]
+
+
+def _class_aliases():
+    aliases = {}
+    for index, name in class_names.items():
+        aliases[name.lower()] = index
+        aliases[str(index)] = index
+        match = re.search(r"\(([^)]+)\)", name)
+        aliases[(match.group(1) if match else name).lower()] = index
+    return aliases
+
+
+CLASS_ALIASES = _class_aliases()
+
+
+def label_for_folder(name):
+    """
+    Map a class directory name to a class index.
+
+    Returns:
+        int: Index into ``class_names``, or None if the name matches no class
+    """
+    return CLASS_ALIASES.get(name.strip().lower().replace("_", " "))
+
+
+def scan_labelled_folder(root):
+    """
+    List the labelled images below a directory.
+
+    Args:
+        root (str): Directory with one sub-directory per class
+
+    Returns:
+        tuple: (items, skipped) where items is a sorted list of
+            (relative path, class index) and skipped lists unrecognized directories
+    """
+    items = []
+    skipped = []
+    for entry in sorted(os.listdir(root)):
+        # Hidden entries hold caches written by the tools, e.g. .image_cache-224
+        if entry.startswith(".") or not os.path.isdir(os.path.join(root, entry)):
+            continue
+        label = label_for_folder(entry)
+        if label is None:
+            skipped.append(entry)
+            continue
+        items.extend((os.path.join(entry, path), label)
+                     for path in scan_images(os.path.join(root, entry)))
+    return items, skipped
+
+
+def eval_transform(size=224):
+    """The serving preprocessing of ``CropDiseaseModel``"""
+    from torchvision import transforms
+    return transforms.Compose([
+        transforms.Resize((size, size)),
+        transforms.ToTensor(),
+        transforms.Normalize(mean=MEAN, std=STD)
+    ])
+
+
+def train_transform(size=224):
+    """
+    Mild augmentation: small crops and horizontal flips.
+
+    Kept light so logits computed on the un-augmented image still describe
+    the augmented one (see ``backend.tools.distill``).
+    """
+    from torchvision import transforms
+    return transforms.Compose([
+        transforms.RandomResizedCrop((size, size), scale=(0.8, 1.0), ratio=(0.9, 1.1)),
+        transforms.RandomHorizontalFlip(),
+        transforms.ToTensor(),
+        transforms.Normalize(mean=MEAN, std=STD)
+    ])
+
+
+def split_items(items, val_fraction=0.1):
+    """
+    Split items into training and validation sets by a hash of each path.
+
+    An image stays on the same side when others are added to or removed from
+    the folder, so validation images never leak into a later training run.
+
+    Returns:
+        tuple: (train items, validation items)
+    """
+    train, val = [], []
+    for item in items:
+        digest = hashlib.md5(item[0].encode("utf-8")).digest()
+        (val if int.from_bytes(digest[:4], "big") / 2 ** 32 < val_fraction else train).append(item)
+    return train, val
+
+
+class LabelledImageDataset(Dataset):
+    """
+    Decode and transform labelled images inside DataLoader workers.
+
+    Each sample is ``(tensor, label, index)``, where ``index`` is the
+    position in ``items``. Unreadable images come back as zeros with label -1
+    so a batch can mask them out instead of the whole run failing.
+    """
+
+    def __init__(self, root, items, transform):
+        self.root = root
+        self.items = items
+        self.transform = transform
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        path, label = self.items[index]
+        try:
+            with Image.open(os.path.join(self.root, path)) as img:
+                return self.transform(img.convert("RGB")), label, index
+        except Exception as e:
+            print(f"Warning: Skipping {path}: {type(e).__name__}: {e}")
+            return torch.zeros(3, 224, 224), -1, index
+
+
+def worker_init(worker_id):
+    # Decoding is per-process parallel already; extra intra-op threads only contend
+    torch.set_num_threads(1)
+
+
+def labelled_batches(root, items, positions=None, batch_size=64, workers=0, cache=None,
+                     augment=False, shuffle=False):
+    """
+    Yield normalized batches of labelled images, from an image cache if one is given.
+
+    Args:
+        root (str): Labelled folder the item paths are relative to
+        items (list): (relative path, label) tuples
+        positions (list): Indexes into ``items`` to read (default: all)
+        batch_size (int): Images per batch
+        workers (int): Decoder processes when reading the image files
+        cache (ImageCache): Preprocessed cache built for ``items``
+            (see ``backend.tools.image_cache``); skips decoding entirely
+        augment (bool): Apply the training augmentation
+        shuffle (bool): Visit the images in random order
+
+    Yields:
+        tuple: (float tensor N x 3 x 224 x 224, labels with -1 for unreadable images,
+            positions into ``items``)
+    """
+    positions = list(range(len(items))) if positions is None else list(positions)
+    if cache is not None:
+        yield from cache.batches(positions, batch_size, shuffle=shuffle, augment=augment)
+        return
+
+    dataset = LabelledImageDataset(root, [items[p] for p in positions],
+                                   train_transform() if augment else eval_transform())
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=shuffle, num_workers=workers,
+                        worker_init_fn=worker_init if workers > 0 else None,
+                        prefetch_factor=4 if workers > 0 else None)
+    mapping = torch.tensor(positions, dtype=torch.int64)
+    for tensors, labels, local in loader:
+        yield tensors, labels, mapping[local]
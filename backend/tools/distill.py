@@ -0,0 +1,311 @@
+"""
+Distil the production model into a smaller, faster student model.
+
+The current checkpoint (rexnet_150) is the teacher. A smaller timm network
+is trained on a labelled image folder (see ``backend.tools.datasets``) to
+match both the true labels and the teacher's softened class scores
+(knowledge distillation). The loss is
+
+    alpha * T^2 * KL(softmax(teacher / T) || softmax(student / T))
+        + (1 - alpha) * cross_entropy(student, label)
+
+The teacher runs only once per image. Its logits are computed on the
+serving preprocessing and cached in an .npz file keyed by image path and
+modification time, so later runs, more epochs or other student
+architectures reuse them. Student inputs get only mild augmentation
+(horizontal flips and small crops) so the cached logits still describe them.
+With ``--cache`` the images themselves are decoded only once as well (see
+``backend.tools.image_cache``), which makes every epoch decode-free.
+
+The student is written as a safetensors file whose metadata records its
+architecture, so ``CropDiseaseModel`` (and MODEL_PATH) load it directly. The
+run ends with an accuracy and latency comparison of teacher and student on
+the held-out images.
+
+Usage:
+    python -m backend.tools.distill /data/cassava -o models/crop_student.safetensors
+    python -m backend.tools.distill /data/cassava --student mobilenetv3_small_100 --pretrained --epochs 15
+"""
+
+import argparse
+import math
+import os
+import sys
+import time
+
+import numpy as np
+import timm
+import torch
+import torch.nn.functional as F
+
+from backend.app.model import CropDiseaseModel, class_names
+from backend.tools.convert_checkpoint import write_safetensors
+from backend.tools.datasets import labelled_batches, scan_labelled_folder, split_items
+from backend.tools.image_cache import open_cache
+
+
+class TeacherLogitCache:
+    """Teacher logits keyed by image path and modification time, stored in one .npz file"""
+
+    def __init__(self, path, teacher_file):
+        """
+        Args:
+            path (str): Cache file
+            teacher_file (str): Teacher checkpoint; a different or modified checkpoint invalidates the cache
+        """
+        self.path = path
+        self.teacher_key = f"{os.path.abspath(teacher_file)}:{os.path.getmtime(teacher_file)}"
+        self.entries = {}
+        if os.path.exists(path):
+            with np.load(path, allow_pickle=False) as data:
+                if str(data["teacher"]) == self.teacher_key:
+                    for key, mtime, logits in zip(data["paths"], data["mtimes"], data["logits"]):
+                        self.entries[str(key)] = (float(mtime), logits)
+                else:
+                    print("Teacher checkpoint changed; discarding cached logits")
+
+    def get(self, key, mtime):
+        entry = self.entries.get(key)
+        if entry is None or entry[0] != mtime:
+            return None
+        return entry[1]
+
+    def put(self, key, mtime, logits):
+        self.entries[key] = (mtime, logits)
+
+    def save(self):
+        keys = sorted(self.entries)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, teacher=np.array(self.teacher_key),
+                     paths=np.array(keys, dtype=str),
+                     mtimes=np.array([self.entries[k][0] for k in keys], dtype=np.float64),
+                     logits=np.stack([self.entries[k][1] for k in keys]).astype(np.float32)
+                     if keys else np.zeros((0, len(class_names)), dtype=np.float32))
+        os.replace(tmp_path, self.path)
+
+
+def teacher_logits(teacher, root, items, cache, batch_size, workers, image_cache=None):
+    """
+    Return the teacher's logits for every item, running the teacher only on images missing from the cache.
+
+    Unreadable images are cached as NaN rows too, so they are not decoded
+    again on every run until the file changes.
+
+    Returns:
+        np.ndarray: (len(items), classes) float32 array; rows of unreadable images are NaN
+    """
+    logits = np.full((len(items), len(class_names)), np.nan, dtype=np.float32)
+    keys = [os.path.join(os.path.abspath(root), path) for path, _ in items]
+    mtimes = [os.path.getmtime(key) for key in keys]
+    missing = []
+    for i, (key, mtime) in enumerate(zip(keys, mtimes)):
+        cached = cache.get(key, mtime)
+        if cached is None:
+            missing.append(i)
+        else:
+            logits[i] = cached
+    print(f"Teacher logits: {len(items) - len(missing)} cached, {len(missing)} to compute")
+    if not missing:
+        return logits
+
+    start = time.perf_counter()
+    with torch.inference_mode():
+        for tensors, labels, positions in labelled_batches(root, items, missing, batch_size, workers,
+                                                           cache=image_cache):
+            outputs = teacher.model(tensors).float().numpy()
+            for output, label, i in zip(outputs, labels.tolist(), positions.tolist()):
+                if label >= 0:
+                    logits[i] = output
+                cache.put(keys[i], mtimes[i], logits[i])
+    cache.save()
+    elapsed = time.perf_counter() - start
+    print(f"Teacher pass: {len(missing)} images in {elapsed:.1f}s ({len(missing) / elapsed:.1f} images/sec)")
+    return logits
+
+
+def distillation_loss(student_logits, teacher_logits, labels, temperature, alpha):
+    """Blend of the softened teacher-matching term and cross-entropy on the true labels"""
+    soft = F.kl_div(F.log_softmax(student_logits / temperature, dim=1),
+                    F.softmax(teacher_logits / temperature, dim=1),
+                    reduction="batchmean") * temperature ** 2
+    hard = F.cross_entropy(student_logits, labels)
+    return alpha * soft + (1 - alpha) * hard
+
+
+def train_student(student, root, items, positions, logits, args, image_cache=None):
+    """
+    Train ``student`` in place against the cached teacher logits.
+
+    Args:
+        positions (list): Indexes of the training images in ``items``
+        logits (np.ndarray): Teacher logits for all of ``items``
+    """
+    optimizer = torch.optim.AdamW(student.parameters(), lr=args.lr, weight_decay=args.weight_decay)
+    total_steps = max(1, args.epochs * math.ceil(len(positions) / args.batch_size))
+    scheduler = torch.optim.lr_scheduler.LambdaLR(
+        optimizer, lambda step: 0.5 * (1 + math.cos(math.pi * min(step, total_steps) / total_steps)))
+    logits = torch.from_numpy(logits)
+
+    student.train()
+    for epoch in range(1, args.epochs + 1):
+        start = time.perf_counter()
+        seen, loss_sum, correct = 0, 0.0, 0
+        for tensors, labels, rows in labelled_batches(root, items, positions, args.batch_size, args.workers,
+                                                      cache=image_cache, augment=True, shuffle=True):
+            valid = labels >= 0
+            if valid.sum() < 2:
+                # Batch norm cannot train on a single image
+                continue
+            tensors, labels, targets = tensors[valid], labels[valid], logits[rows[valid]]
+            outputs = student(tensors)
+            loss = distillation_loss(outputs, targets, labels, args.temperature, args.alpha)
+            optimizer.zero_grad(set_to_none=True)
+            loss.backward()
+            optimizer.step()
+            scheduler.step()
+
+            seen += len(labels)
+            loss_sum += loss.item() * len(labels)
+            correct += int((outputs.argmax(dim=1) == labels).sum())
+        elapsed = time.perf_counter() - start
+        print(f"Epoch {epoch}/{args.epochs}: loss {loss_sum / max(seen, 1):.4f}, "
+              f"train accuracy {correct / max(seen, 1):.3f}, {seen / elapsed:.1f} images/sec")
+    student.eval()
+
+
+def save_student(student, arch, output, teacher_file, args):
+    """Write the student weights and the metadata ``CropDiseaseModel`` needs to rebuild it"""
+    state_dict = {key: value.detach().contiguous().clone() for key, value in student.state_dict().items()}
+    metadata = {
+        "arch": arch,
+        "num_classes": str(len(class_names)),
+        "source": f"distilled from {os.path.basename(teacher_file)}",
+        "temperature": str(args.temperature),
+        "alpha": str(args.alpha),
+        "epochs": str(args.epochs),
+    }
+    return write_safetensors(state_dict, output, metadata)
+
+
+def predict_labels(model, root, items, positions, batch_size, workers, image_cache=None):
+    """Class predictions of a loaded ``CropDiseaseModel`` for labelled items (-1 for unreadable images)"""
+    predictions = []
+    for tensors, labels, _ in labelled_batches(root, items, positions, batch_size, workers, cache=image_cache):
+        predicted = model.predict_probabilities(tensors).argmax(axis=1)
+        predictions.extend(p if l >= 0 else -1 for p, l in zip(predicted.tolist(), labels.tolist()))
+    return np.array(predictions)
+
+
+def median_latency_ms(model, batch_size, iterations):
+    """Median wall time of a forward pass on random input"""
+    batch = torch.randn(batch_size, 3, 224, 224)
+    durations = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        model.predict_probabilities(batch)
+        durations.append((time.perf_counter() - start) * 1000)
+    return float(np.median(durations))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Distil the crop disease model into a smaller student")
+    parser.add_argument("data_dir", help="Labelled image folder with one sub-directory per class")
+    parser.add_argument("-o", "--output", default="models/crop_student.safetensors",
+                        help="Student checkpoint to write (default: models/crop_student.safetensors)")
+    parser.add_argument("--teacher", default=None, help="Teacher checkpoint (default: MODEL_PATH)")
+    parser.add_argument("--student", default="mobilenetv3_large_100", help="timm architecture of the student")
+    parser.add_argument("--pretrained", action="store_true",
+                        help="Start the student from timm's ImageNet weights (downloads them once)")
+    parser.add_argument("--epochs", type=int, default=10, help="Training epochs")
+    parser.add_argument("--batch-size", type=int, default=32, help="Images per training step")
+    parser.add_argument("--lr", type=float, default=1e-3, help="Peak learning rate (cosine decay)")
+    parser.add_argument("--weight-decay", type=float, default=0.05, help="AdamW weight decay")
+    parser.add_argument("--temperature", type=float, default=4.0, help="Softening temperature T")
+    parser.add_argument("--alpha", type=float, default=0.7, help="Weight of the teacher term against the labels")
+    parser.add_argument("--val-fraction", type=float, default=0.1, help="Share of images held out for the comparison")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Decoder processes (default: CPU count, 0 decodes in-process)")
+    parser.add_argument("--logit-cache", default=None,
+                        help="Teacher logit cache file (default: <data_dir>/.teacher_logits.npz)")
+    parser.add_argument("--cache", nargs="?", const="", default=None, metavar="DIR",
+                        help="Read images from a preprocessed cache, built or refreshed first "
+                             "(default directory: <data_dir>/.image_cache-224)")
+    parser.add_argument("--latency-iterations", type=int, default=30, help="Timed passes per model")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for initialization and shuffling")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.data_dir):
+        print(f"ERROR: Not a directory: {args.data_dir}")
+        return 1
+    if args.workers is None:
+        args.workers = os.cpu_count() or 1
+    torch.manual_seed(args.seed)
+
+    items, skipped = scan_labelled_folder(args.data_dir)
+    if skipped:
+        print(f"Warning: Ignoring directories that match no class: {', '.join(skipped)}")
+    if not items:
+        print(f"ERROR: No labelled images found in {args.data_dir}")
+        return 1
+    train_items, val_items = split_items(items, args.val_fraction)
+    if not val_items:
+        print("Warning: No images held out; comparing on the training images")
+        val_items = train_items
+    print(f"Found {len(items)} images: {len(train_items)} for training, {len(val_items)} held out")
+
+    image_cache = None
+    if args.cache is not None:
+        image_cache = open_cache(args.data_dir, items, args.cache or None, args.workers)
+
+    teacher = CropDiseaseModel(model_path=args.teacher, enable_gemini=False, profile="standard")
+    teacher_file = teacher._find_model_file()
+    cache = TeacherLogitCache(args.logit_cache or os.path.join(args.data_dir, ".teacher_logits.npz"),
+                              teacher_file)
+    logits = teacher_logits(teacher, args.data_dir, items, cache, args.batch_size, args.workers, image_cache)
+    readable = ~np.isnan(logits).any(axis=1)
+    index_of = {path: i for i, (path, _) in enumerate(items)}
+
+    try:
+        student = timm.create_model(args.student, pretrained=args.pretrained, num_classes=len(class_names))
+    except Exception as e:
+        print(f"ERROR: Could not create student {args.student!r}: {str(e)}")
+        return 1
+    train_positions = [index_of[path] for path, _ in train_items]
+    train_student(student, args.data_dir, items, train_positions, logits, args, image_cache)
+    save_student(student, args.student, args.output, teacher_file, args)
+    print(f"Student written to {args.output}")
+
+    # Compare through the serving code path, which also proves the checkpoint loads
+    student_model = CropDiseaseModel(model_path=args.output, enable_gemini=False, profile="standard")
+    val_positions = [index_of[path] for path, _ in val_items]
+    labels = np.array([label for _, label in val_items])
+    mask = readable[val_positions]
+    teacher_pred = logits[val_positions].argmax(axis=1)
+    student_pred = predict_labels(student_model, args.data_dir, items, val_positions, args.batch_size,
+                                  args.workers, image_cache)
+
+    rows = []
+    for name, model, predictions in (("teacher", teacher, teacher_pred), ("student", student_model, student_pred)):
+        rows.append((
+            name, model.arch,
+            sum(p.numel() for p in model.model.parameters()) / 1e6,
+            float((predictions[mask] == labels[mask]).mean()) if mask.any() else float("nan"),
+            median_latency_ms(model, 1, args.latency_iterations),
+            args.batch_size * 1000 / median_latency_ms(model, args.batch_size, max(3, args.latency_iterations // 5)),
+        ))
+    agreement = float((student_pred[mask] == teacher_pred[mask]).mean()) if mask.any() else float("nan")
+
+    print()
+    print(f"Held-out images: {int(mask.sum())}; student agrees with teacher on {agreement:.1%}; "
+          f"{torch.get_num_threads()} threads")
+    print(f"{'model':<8} {'arch':<24} {'params M':>9} {'accuracy':>9} {'p50 ms (1)':>11} "
+          f"{f'img/s ({args.batch_size})':>12}")
+    for name, arch, params, accuracy, latency, throughput in rows:
+        print(f"{name:<8} {arch:<24} {params:>9.2f} {accuracy:>9.3f} {latency:>11.1f} {throughput:>12.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,249 @@
+"""
+Evaluate one or more model engines on a labelled image folder.
+
+An engine is a checkpoint together with a CPU inference profile, written
+``path[:profile]``. Each engine is loaded in turn and classifies every image
+of the folder (see ``backend.tools.datasets`` for the layout), with images
+decoded by a pool of DataLoader worker processes. For each engine the report
+shows accuracy, macro F1, per-class precision/recall/F1, the confusion
+matrix, throughput and the peak resident memory of the evaluating process.
+
+Throughput is given twice: end to end (decoding included, which is what a
+bulk run achieves) and for the forward passes alone. With ``--cache`` the
+images are decoded once into a preprocessed cache (``backend.tools.image_cache``)
+and every engine, and every later run, reads from it instead.
+
+Usage:
+    python -m backend.tools.evaluate /data/cassava-val
+    python -m backend.tools.evaluate /data/cassava-val \\
+        --engine models/crop_best_model.safetensors \\
+        --engine models/crop_best_model.safetensors:compiled-bf16 \\
+        --engine models/crop_student.safetensors --json results.json --cache
+"""
+
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+
+import numpy as np
+
+from backend.app.model import CropDiseaseModel, INFERENCE_PROFILES, class_names
+from backend.tools.datasets import labelled_batches, scan_labelled_folder
+from backend.tools.image_cache import open_cache
+from backend.utils.config import INFERENCE_PROFILE
+
+
+def parse_engine(spec):
+    """
+    Split ``path[:profile]`` into its parts.
+
+    Returns:
+        tuple: (model path, profile name); the path is None for the default engine
+    """
+    if spec is None:
+        return None, INFERENCE_PROFILE
+    path, sep, profile = spec.rpartition(":")
+    if sep and profile in INFERENCE_PROFILES:
+        return path, profile
+    return spec, INFERENCE_PROFILE
+
+
+def reset_peak_rss():
+    """Reset the kernel's peak-RSS mark for this process; returns False where that is unsupported"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process since start or the last reset, in MB"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == "darwin" else maxrss / 1024
+
+
+def classification_metrics(labels, predictions, num_classes):
+    """
+    Confusion matrix and the metrics derived from it.
+
+    Args:
+        labels (np.ndarray): True class indexes
+        predictions (np.ndarray): Predicted class indexes
+        num_classes (int): Number of classes
+
+    Returns:
+        dict: ``confusion`` (rows are true classes), ``per_class`` precision/recall/F1/support,
+            ``accuracy`` and ``macro_f1``
+    """
+    confusion = np.zeros((num_classes, num_classes), dtype=np.int64)
+    np.add.at(confusion, (labels, predictions), 1)
+
+    true_positives = np.diag(confusion).astype(np.float64)
+    predicted = confusion.sum(axis=0)
+    support = confusion.sum(axis=1)
+    precision = np.divide(true_positives, predicted, out=np.zeros(num_classes), where=predicted > 0)
+    recall = np.divide(true_positives, support, out=np.zeros(num_classes), where=support > 0)
+    denominator = precision + recall
+    f1 = np.divide(2 * precision * recall, denominator, out=np.zeros(num_classes), where=denominator > 0)
+
+    return {
+        "confusion": confusion.tolist(),
+        "per_class": [
+            {"class": class_names[i], "precision": float(precision[i]), "recall": float(recall[i]),
+             "f1": float(f1[i]), "support": int(support[i])}
+            for i in range(num_classes)
+        ],
+        "accuracy": float(true_positives.sum() / max(1, len(labels))),
+        # Classes absent from the folder do not drag the average down
+        "macro_f1": float(f1[support > 0].mean()) if (support > 0).any() else 0.0,
+    }
+
+
+def evaluate_engine(spec, root, items, batch_size, workers, cache=None):
+    """
+    Load one engine and classify every item, reading from the image cache if one is given.
+
+    Returns:
+        dict: Engine description, metrics, throughput and peak memory
+    """
+    model_path, profile = parse_engine(spec)
+    peak_is_per_engine = reset_peak_rss()
+
+    start = time.perf_counter()
+    model = CropDiseaseModel(model_path=model_path, enable_gemini=False, profile=profile)
+    load_s = time.perf_counter() - start
+
+    labels, predictions = [], []
+    unreadable = 0
+    forward_s = 0.0
+    start = time.perf_counter()
+    for tensors, batch_labels, _ in labelled_batches(root, items, batch_size=batch_size,
+                                                     workers=workers, cache=cache):
+        forward_start = time.perf_counter()
+        probabilities, _ = model._forward(tensors)
+        forward_s += time.perf_counter() - forward_start
+
+        valid = batch_labels >= 0
+        unreadable += int((~valid).sum())
+        labels.append(batch_labels[valid].numpy())
+        predictions.append(probabilities.argmax(dim=1)[valid].numpy())
+    total_s = time.perf_counter() - start
+
+    labels = np.concatenate(labels) if labels else np.zeros(0, dtype=np.int64)
+    predictions = np.concatenate(predictions) if predictions else np.zeros(0, dtype=np.int64)
+    result = {
+        "engine": spec or f"default ({os.path.basename(model._find_model_file())})",
+        "model_path": model_path,
+        "arch": model.arch,
+        "profile": profile,
+        "images": int(len(labels)),
+        "unreadable": unreadable,
+        "load_s": round(load_s, 2),
+        "images_per_sec": round(len(items) / total_s, 1) if total_s else 0.0,
+        "model_images_per_sec": round(len(items) / forward_s, 1) if forward_s else 0.0,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "peak_rss_since_start": not peak_is_per_engine,
+    }
+    result.update(classification_metrics(labels, predictions, len(class_names)))
+    del model
+    return result
+
+
+def _short_name(name):
+    """Abbreviation in parentheses, e.g. "CMD", or the name itself"""
+    return name[name.find("(") + 1:name.find(")")] if "(" in name else name
+
+
+def print_report(results):
+    """Print the side-by-side summary, then per-class metrics and confusion matrix per engine"""
+    width = max(len(r["engine"]) for r in results)
+    print()
+    print(f"{'engine':<{width}} {'arch':<22} {'profile':<14} {'accuracy':>8} {'macro F1':>8} "
+          f"{'img/s':>7} {'model img/s':>11} {'peak MB':>8}")
+    for r in results:
+        print(f"{r['engine']:<{width}} {r['arch']:<22} {r['profile']:<14} {r['accuracy']:>8.3f} "
+              f"{r['macro_f1']:>8.3f} {r['images_per_sec']:>7.1f} {r['model_images_per_sec']:>11.1f} "
+              f"{r['peak_rss_mb']:>8.0f}")
+    if any(r["peak_rss_since_start"] for r in results):
+        print("Peak memory could not be reset between engines; later rows include earlier ones")
+
+    short = [_short_name(class_names[i]) for i in range(len(class_names))]
+    for r in results:
+        print()
+        print(f"== {r['engine']} ({r['images']} images, {r['unreadable']} unreadable)")
+        print(f"{'class':<8} {'precision':>9} {'recall':>7} {'F1':>6} {'support':>8}")
+        for name, metrics in zip(short, r["per_class"]):
+            print(f"{name:<8} {metrics['precision']:>9.3f} {metrics['recall']:>7.3f} "
+                  f"{metrics['f1']:>6.3f} {metrics['support']:>8}")
+        print("confusion (rows: true, columns: predicted)")
+        print(f"{'':<8}" + "".join(f"{name:>8}" for name in short))
+        for name, row in zip(short, r["confusion"]):
+            print(f"{name:<8}" + "".join(f"{count:>8}" for count in row))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate model engines on a labelled image folder")
+    parser.add_argument("data_dir", help="Labelled image folder with one sub-directory per class")
+    parser.add_argument("--engine", action="append", default=None,
+                        help="Checkpoint with optional inference profile, path[:profile]; "
+                             "repeat to compare (default: the served model and INFERENCE_PROFILE)")
+    parser.add_argument("--batch-size", type=int, default=64, help="Images per forward pass")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Decoder processes (default: CPU count, 0 decodes in-process)")
+    parser.add_argument("--cache", nargs="?", const="", default=None, metavar="DIR",
+                        help="Read images from a preprocessed cache, built or refreshed first "
+                             "(default directory: <data_dir>/.image_cache-224)")
+    parser.add_argument("--json", default=None, help="Also write the full results to this JSON file")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.data_dir):
+        print(f"ERROR: Not a directory: {args.data_dir}")
+        return 1
+    engines = args.engine or [None]
+    for spec in engines:
+        model_path, _ = parse_engine(spec)
+        if model_path is not None and not os.path.exists(model_path):
+            print(f"ERROR: Model file not found: {model_path}")
+            return 1
+    workers = (os.cpu_count() or 1) if args.workers is None else args.workers
+
+    items, skipped = scan_labelled_folder(args.data_dir)
+    if skipped:
+        print(f"Warning: Ignoring directories that match no class: {', '.join(skipped)}")
+    if not items:
+        print(f"ERROR: No labelled images found in {args.data_dir}")
+        return 1
+
+    cache = None
+    if args.cache is not None:
+        start = time.perf_counter()
+        cache = open_cache(args.data_dir, items, args.cache or None, workers)
+        print(f"Image cache ready in {time.perf_counter() - start:.1f}s")
+    print(f"Evaluating {len(engines)} engine(s) on {len(items)} images")
+
+    results = [evaluate_engine(spec, args.data_dir, items, args.batch_size, workers, cache)
+               for spec in engines]
+    print_report(results)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""
+Local stand-in for the Gemini generateContent REST API.
+
+Answers ``POST /v1beta/models/<model>:generateContent`` with a canned
+recommendation after a configurable delay, and fails a configurable share
+of calls. This lets the backend run its complete /predict path without
+network access or API quota. It is meant for load tests and offline
+development.
+
+Point the backend at it with:
+
+    GEMINI_API_KEY=fake GEMINI_API_ENDPOINT=http://127.0.0.1:8090
+
+Usage:
+    python -m backend.tools.fake_gemini --port 8090 --latency-ms 800 --jitter-ms 300 --error-rate 0.05
+"""
+
+import argparse
+import random
+import sys
+import threading
+import time
+
+from flask import Flask, jsonify, request
+
+CANNED_RECOMMENDATION = """- Remove and destroy severely affected plants
+- Use clean, disease-free planting material for new plantings
+- Keep the field free of weeds and ensure proper drainage
+- Maintain proper spacing between plants for good air circulation
+- Inspect plants weekly and record any spread of symptoms"""
+
+
+def create_fake_gemini_app(latency_ms=800.0, jitter_ms=0.0, error_rate=0.0, error_status=503, seed=None):
+    """
+    Build the fake API application.
+
+    Args:
+        latency_ms (float): Mean delay before answering
+        jitter_ms (float): Standard deviation of the delay (normal, clipped at zero)
+        error_rate (float): Share of calls (0-1) answered with ``error_status``
+        error_status (int): HTTP status used for injected failures
+        seed (int): Seed for reproducible delays and failures
+
+    Returns:
+        Flask: The application; ``app.config["FAKE_GEMINI_STATS"]`` counts calls
+    """
+    app = Flask(__name__)
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+    stats = {"calls": 0, "errors": 0}
+    app.config["FAKE_GEMINI_STATS"] = stats
+
+    @app.route("/v1beta/models/<path:model_method>", methods=["POST"])
+    def generate_content(model_method):
+        if not model_method.endswith(":generateContent"):
+            return jsonify({"error": {"code": 404, "message": "Method not found", "status": "NOT_FOUND"}}), 404
+
+        with rng_lock:
+            delay = max(0.0, rng.gauss(latency_ms, jitter_ms)) / 1000.0
+            fail = rng.random() < error_rate
+            stats["calls"] += 1
+            if fail:
+                stats["errors"] += 1
+        time.sleep(delay)
+
+        if fail:
+            return jsonify({"error": {"code": error_status, "message": "Injected failure",
+                                      "status": "UNAVAILABLE"}}), error_status
+
+        prompt = request.get_json(silent=True) or {}
+        prompt_chars = sum(len(part.get("text", ""))
+                           for content in prompt.get("contents", [])
+                           for part in content.get("parts", []))
+        return jsonify({
+            "candidates": [{
+                "content": {"role": "model", "parts": [{"text": CANNED_RECOMMENDATION}]},
+                "finishReason": "STOP",
+                "index": 0
+            }],
+            "usageMetadata": {
+                "promptTokenCount": prompt_chars // 4,
+                "candidatesTokenCount": len(CANNED_RECOMMENDATION) // 4,
+                "totalTokenCount": (prompt_chars + len(CANNED_RECOMMENDATION)) // 4
+            }
+        })
+
+    @app.route("/stats", methods=["GET"])
+    def get_stats():
+        with rng_lock:
+            return jsonify(dict(stats))
+
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a local fake of the Gemini generateContent API")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=8090, help="Port to listen on")
+    parser.add_argument("--latency-ms", type=float, default=800.0, help="Mean response delay")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Standard deviation of the delay")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of calls that fail (0-1)")
+    parser.add_argument("--error-status", type=int, default=503, help="HTTP status for injected failures")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for reproducible runs")
+    args = parser.parse_args(argv)
+
+    if not 0.0 <= args.error_rate <= 1.0:
+        print("ERROR: --error-rate must be between 0 and 1")
+        return 1
+
+    app = create_fake_gemini_app(args.latency_ms, args.jitter_ms, args.error_rate, args.error_status, args.seed)
+    print(f"Fake Gemini API on http://{args.host}:{args.port} "
+          f"(latency {args.latency_ms:.0f}±{args.jitter_ms:.0f} ms, error rate {args.error_rate:.0%})")
+    app.run(host=args.host, port=args.port, threaded=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,277 @@
+"""
+Preprocessed image cache for repeated evaluation and training runs.
+
+Decoding and resizing JPEGs dominates the time of an evaluation pass. The
+cache stores every image of a labelled folder already resized to the model
+input size, as uint8 RGB in one memory-mapped array, next to a JSON index
+with the label, path, size and modification time of each row:
+
+    <cache_dir>/index.json
+    <cache_dir>/images-<id>.u8      N x 224 x 224 x 3 uint8, row i = item i
+
+Batches are read as slices of the mapped file (no copy for contiguous rows)
+and converted to normalized float tensors in one vectorized step, giving the
+same values as the serving transform. Rebuilding only decodes images whose
+modification time or size changed; a different preprocessing configuration
+invalidates the whole cache.
+
+Usage:
+    python -m backend.tools.image_cache /data/cassava-val
+    python -m backend.tools.image_cache /data/cassava-val --cache-dir /fast/disk/cassava-224
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.data import DataLoader, Dataset
+
+from backend.tools.datasets import MEAN, STD, scan_labelled_folder, worker_init
+
+INDEX_FILE = "index.json"
+CACHE_VERSION = 1
+
+
+def default_cache_dir(root, size=224):
+    return os.path.join(root, f".image_cache-{size}")
+
+
+def preprocessing_config(size):
+    """Everything that changes the stored pixels; a mismatch invalidates the cache"""
+    return {"version": CACHE_VERSION, "size": size, "resample": "bilinear", "mode": "RGB"}
+
+
+class _ResizeDataset(Dataset):
+    """Decode and resize images to uint8 arrays inside DataLoader workers"""
+
+    def __init__(self, root, paths, size):
+        self.root = root
+        self.paths = paths
+        self.size = size
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, index):
+        try:
+            with Image.open(os.path.join(self.root, self.paths[index])) as img:
+                # Same resampling as transforms.Resize on a PIL image
+                img = img.convert("RGB").resize((self.size, self.size), Image.BILINEAR)
+                return torch.from_numpy(np.asarray(img, dtype=np.uint8).copy()), True, index
+        except Exception as e:
+            print(f"Warning: Skipping {self.paths[index]}: {type(e).__name__}: {e}")
+            return torch.zeros(self.size, self.size, 3, dtype=torch.uint8), False, index
+
+
+class ImageCache:
+    """Read side of the cache: labels, paths and a memory-mapped uint8 image array"""
+
+    def __init__(self, cache_dir):
+        """
+        Open an existing cache.
+
+        Raises:
+            FileNotFoundError: If the directory holds no cache
+        """
+        self.cache_dir = cache_dir
+        with open(os.path.join(cache_dir, INDEX_FILE), encoding="utf-8") as f:
+            self.index = json.load(f)
+        self.entries = self.index["entries"]
+        self.size = self.index["preprocessing"]["size"]
+        self.paths = [entry["path"] for entry in self.entries]
+        self.labels = torch.tensor([entry["label"] if entry["valid"] else -1 for entry in self.entries],
+                                   dtype=torch.int64)
+        if self.entries:
+            # Copy-on-write mapping: pages are shared with the page cache and
+            # torch.from_numpy gets a writable array without copying
+            self.images = np.memmap(os.path.join(cache_dir, self.index["data_file"]), dtype=np.uint8,
+                                    mode="c", shape=(len(self.entries), self.size, self.size, 3))
+        else:
+            self.images = np.zeros((0, self.size, self.size, 3), dtype=np.uint8)
+        self._mean = torch.tensor(MEAN).view(1, 3, 1, 1) * 255
+        self._std = torch.tensor(STD).view(1, 3, 1, 1) * 255
+
+    def __len__(self):
+        return len(self.entries)
+
+    @classmethod
+    def build(cls, cache_dir, root, items, size=224, workers=0, batch_size=64):
+        """
+        Create or update the cache so row ``i`` holds ``items[i]``.
+
+        Rows whose source path, modification time and size are unchanged are
+        copied from the previous cache; only the other images are decoded.
+
+        Args:
+            cache_dir (str): Cache directory
+            root (str): Labelled folder the item paths are relative to
+            items (list): (relative path, label) tuples, e.g. from ``scan_labelled_folder``
+            size (int): Side length images are resized to
+            workers (int): Decoder processes
+            batch_size (int): Images per decoded batch
+
+        Returns:
+            ImageCache: The opened, up-to-date cache
+        """
+        config = preprocessing_config(size)
+        old = None
+        try:
+            old = cls(cache_dir)
+            if old.index["preprocessing"] != config:
+                print("Preprocessing changed; rebuilding the image cache")
+                old = None
+        except (OSError, ValueError, KeyError):
+            old = None
+
+        entries = []
+        for path, label in items:
+            stat = os.stat(os.path.join(root, path))
+            entries.append({"path": path, "label": label, "mtime": stat.st_mtime, "bytes": stat.st_size})
+
+        reuse = {}
+        if old is not None:
+            old_rows = {entry["path"]: (i, entry) for i, entry in enumerate(old.entries)}
+            for i, entry in enumerate(entries):
+                match = old_rows.get(entry["path"])
+                if match and match[1]["mtime"] == entry["mtime"] and match[1]["bytes"] == entry["bytes"]:
+                    reuse[i] = match[0]
+            if len(reuse) == len(entries) == len(old) and all(reuse[i] == i for i in reuse) \
+                    and all(old.entries[i]["label"] == entries[i]["label"] for i in reuse):
+                return old
+
+        missing = [i for i in range(len(entries)) if i not in reuse]
+        print(f"Image cache: {len(reuse)} images reused, {len(missing)} to decode")
+        os.makedirs(cache_dir, exist_ok=True)
+        data_file = f"images-{uuid.uuid4().hex[:12]}.u8"
+        data_path = os.path.join(cache_dir, data_file)
+        images = None
+        if entries:
+            images = np.memmap(data_path, dtype=np.uint8, mode="w+", shape=(len(entries), size, size, 3))
+        for i, old_i in reuse.items():
+            images[i] = old.images[old_i]
+            entries[i]["valid"] = old.entries[old_i]["valid"]
+
+        start = time.perf_counter()
+        loader = DataLoader(_ResizeDataset(root, [entries[i]["path"] for i in missing], size),
+                            batch_size=batch_size, num_workers=workers,
+                            worker_init_fn=worker_init if workers > 0 else None)
+        for pixels, ok, positions in loader:
+            rows = [missing[p] for p in positions.tolist()]
+            images[rows] = pixels.numpy()
+            for row, valid in zip(rows, ok.tolist()):
+                entries[row]["valid"] = bool(valid)
+        if missing:
+            elapsed = time.perf_counter() - start
+            print(f"Decoded {len(missing)} images in {elapsed:.1f}s ({len(missing) / elapsed:.1f} images/sec)")
+        if images is not None:
+            images.flush()
+            del images
+
+        # The index names its data file, so replacing it switches caches atomically
+        index = {"preprocessing": config, "root": os.path.abspath(root), "data_file": data_file,
+                 "entries": entries}
+        tmp_path = os.path.join(cache_dir, INDEX_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, os.path.join(cache_dir, INDEX_FILE))
+        if old is not None and old.entries:
+            old_file = os.path.join(cache_dir, old.index["data_file"])
+            del old
+            os.remove(old_file)
+        return cls(cache_dir)
+
+    def normalize(self, pixels):
+        """
+        Turn a (N, H, W, 3) uint8 batch into normalized float input.
+
+        Equivalent to ToTensor followed by Normalize, done for the whole
+        batch at once. The result is an NCHW view with channels-last strides.
+        """
+        return pixels.permute(0, 3, 1, 2).float().sub_(self._mean).div_(self._std)
+
+    def batches(self, positions=None, batch_size=64, shuffle=False, augment=False):
+        """
+        Yield batches of cached rows.
+
+        Runs of consecutive rows are sliced straight from the mapped file;
+        shuffled batches gather their rows with one copy.
+
+        Args:
+            positions (list): Rows to read (default: all)
+            batch_size (int): Rows per batch
+            shuffle (bool): Visit the rows in random order
+            augment (bool): Random flips and small crops, as for training
+
+        Yields:
+            tuple: (float tensor N x 3 x H x W, labels with -1 for unreadable images, row positions)
+        """
+        order = torch.arange(len(self)) if positions is None else torch.as_tensor(list(positions), dtype=torch.int64)
+        if shuffle:
+            order = order[torch.randperm(len(order))]
+        crop = None
+        if augment:
+            from torchvision import transforms
+            crop = transforms.RandomResizedCrop((self.size, self.size), scale=(0.8, 1.0), ratio=(0.9, 1.1))
+
+        for start in range(0, len(order), batch_size):
+            rows = order[start:start + batch_size]
+            first, last = int(rows[0]), int(rows[-1])
+            if last - first + 1 == len(rows) and bool((rows[1:] > rows[:-1]).all()):
+                pixels = torch.from_numpy(self.images[first:last + 1])
+            else:
+                pixels = torch.from_numpy(self.images[rows.numpy()])
+            if augment:
+                pixels = torch.stack([self._augment(image, crop) for image in pixels])
+            yield self.normalize(pixels), self.labels[rows], rows
+
+    @staticmethod
+    def _augment(image, crop):
+        chw = crop(image.permute(2, 0, 1))
+        if torch.rand(1).item() < 0.5:
+            chw = chw.flip(-1)
+        return chw.permute(1, 2, 0)
+
+
+def open_cache(root, items, cache_dir=None, workers=0, size=224):
+    """Build or refresh the cache for ``items`` below ``root`` and return it"""
+    return ImageCache.build(cache_dir or default_cache_dir(root, size), root, items, size=size, workers=workers)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the preprocessed image cache for a labelled folder")
+    parser.add_argument("data_dir", help="Labelled image folder with one sub-directory per class")
+    parser.add_argument("--cache-dir", default=None,
+                        help="Cache directory (default: <data_dir>/.image_cache-<size>)")
+    parser.add_argument("--size", type=int, default=224, help="Side length images are resized to")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Decoder processes (default: CPU count, 0 decodes in-process)")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.data_dir):
+        print(f"ERROR: Not a directory: {args.data_dir}")
+        return 1
+    items, skipped = scan_labelled_folder(args.data_dir)
+    if skipped:
+        print(f"Warning: Ignoring directories that match no class: {', '.join(skipped)}")
+    if not items:
+        print(f"ERROR: No labelled images found in {args.data_dir}")
+        return 1
+
+    workers = (os.cpu_count() or 1) if args.workers is None else args.workers
+    start = time.perf_counter()
+    cache = open_cache(args.data_dir, items, args.cache_dir, workers, args.size)
+    size_mb = cache.images.nbytes / (1024 * 1024)
+    unreadable = int((cache.labels < 0).sum())
+    print(f"Cache {cache.cache_dir}: {len(cache)} images ({unreadable} unreadable), "
+          f"{size_mb:.1f} MB, ready in {time.perf_counter() - start:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,257 @@
+"""
+Open-loop load generator for the /predict endpoint.
+
+Requests arrive as a Poisson process at each offered rate in turn,
+independently of how quickly earlier requests complete. This is how real
+clients behave, and it means a saturated server shows up as growing queueing
+delay instead of quietly lowering the load. Latency is measured from each
+request's scheduled arrival time, so time spent waiting for a free client
+slot is counted as well.
+
+Each request uploads an image drawn from a weighted mix of sizes
+(synthetic JPEGs) or from a directory of real photos. For every rate step
+the tool prints achieved throughput, error counts, p50/p95/p99 latency and the
+server-side stage timings. Plot throughput against latency to find the
+saturation point. With the default tiered recommendations no request waits on
+Gemini. To include Gemini latency, start the backend with
+RECOMMENDATION_PROVIDER=gemini and GEMINI_API_ENDPOINT pointing at
+backend.tools.fake_gemini, which avoids spending API quota.
+
+Usage:
+    python -m backend.tools.loadtest --rates 0.5,1,2,4 --step-duration 60 --concurrency 32
+    python -m backend.tools.loadtest --images /data/samples --rates 2 --csv results.csv
+"""
+
+import argparse
+import csv
+import io
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from PIL import Image
+from requests.adapters import HTTPAdapter
+
+from backend.utils.config import API_PORT
+
+DEFAULT_SIZES = "640x480:0.5,1600x1200:0.3,4000x3000:0.2"
+
+SERVER_STAGES = ("decode_ms", "inference_ms", "recommendation_ms", "report_ms")
+
+REPORT_FIELDS = ["offered_rps", "achieved_rps", "sent", "ok", "errors", "dropped",
+                 "p50_ms", "p95_ms", "p99_ms", "max_ms"] + [f"mean_{stage}" for stage in SERVER_STAGES]
+
+
+def parse_size_mix(spec):
+    """
+    Parse a size mix such as ``"640x480:0.5,4000x3000:0.5"``.
+
+    Returns:
+        list: ((width, height), weight) tuples
+    """
+    mix = []
+    for item in spec.split(","):
+        size, _, weight = item.strip().partition(":")
+        width, height = (int(v) for v in size.lower().split("x"))
+        mix.append(((width, height), float(weight or 1)))
+    return mix
+
+
+def synthetic_jpeg(width, height, seed=0, quality=90):
+    """
+    Encode a leaf-coloured noise image, so its file size is close to that of a real photo of the same size.
+
+    Returns:
+        bytes: JPEG data
+    """
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, size=(max(1, height // 8), max(1, width // 8), 3), dtype=np.uint8)
+    small[..., 1] = np.maximum(small[..., 1], 96)
+    image = Image.fromarray(small).resize((width, height), Image.BILINEAR)
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def load_payloads(args):
+    """Build the (name, bytes, weight) upload pool from --images or --sizes"""
+    if args.images:
+        payloads = []
+        for name in sorted(os.listdir(args.images)):
+            path = os.path.join(args.images, name)
+            if os.path.isfile(path) and name.lower().endswith((".jpg", ".jpeg", ".png")):
+                with open(path, "rb") as f:
+                    payloads.append((name, f.read(), 1.0))
+        return payloads
+    return [(f"{w}x{h}.jpg", synthetic_jpeg(w, h, seed=i), weight)
+            for i, ((w, h), weight) in enumerate(parse_size_mix(args.sizes))]
+
+
+class LoadStep:
+    """Results of one offered-rate step"""
+
+    def __init__(self, offered_rps):
+        self.offered_rps = offered_rps
+        self.latencies_ms = []
+        self.stage_ms = {stage: [] for stage in SERVER_STAGES}
+        self.errors = {}
+        self.sent = 0
+        self.dropped = 0
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, latency_ms, error=None, timings=None):
+        with self._lock:
+            if error is not None:
+                self.errors[error] = self.errors.get(error, 0) + 1
+                return
+            self.latencies_ms.append(latency_ms)
+            for stage in SERVER_STAGES:
+                if timings and stage in timings:
+                    self.stage_ms[stage].append(timings[stage])
+
+    def summary(self):
+        ok = len(self.latencies_ms)
+        latencies = np.asarray(self.latencies_ms) if ok else np.zeros(1)
+        row = {
+            "offered_rps": self.offered_rps,
+            "achieved_rps": round(ok / self.elapsed, 3) if self.elapsed else 0.0,
+            "sent": self.sent,
+            "ok": ok,
+            "errors": sum(self.errors.values()),
+            "dropped": self.dropped,
+            "p50_ms": round(float(np.percentile(latencies, 50)), 1),
+            "p95_ms": round(float(np.percentile(latencies, 95)), 1),
+            "p99_ms": round(float(np.percentile(latencies, 99)), 1),
+            "max_ms": round(float(latencies.max()), 1),
+        }
+        for stage, values in self.stage_ms.items():
+            row[f"mean_{stage}"] = round(float(np.mean(values)), 1) if values else None
+        return row
+
+
+def run_step(session, url, payloads, rate, duration, concurrency, timeout, fields, rng, headers=None):
+    """
+    Offer Poisson arrivals at ``rate`` requests/s for ``duration`` seconds.
+
+    At most ``concurrency`` requests are in flight; arrivals beyond
+    ``4 * concurrency`` queued requests are dropped and counted, which keeps
+    an overloaded step from running on indefinitely.
+    """
+    step = LoadStep(rate)
+    names = [p[0] for p in payloads]
+    weights = [p[2] for p in payloads]
+    data_by_name = {p[0]: p[1] for p in payloads}
+    in_queue = threading.Semaphore(concurrency * 5)
+
+    def send(name, scheduled):
+        try:
+            response = session.post(url, files={"image": (name, data_by_name[name])},
+                                    data=fields, headers=headers, timeout=timeout)
+            latency_ms = (time.perf_counter() - scheduled) * 1000
+            if response.status_code == 200:
+                step.record(latency_ms, timings=response.json().get("timings"))
+            else:
+                step.record(latency_ms, error=f"HTTP {response.status_code}")
+        except requests.exceptions.RequestException as e:
+            step.record(None, error=type(e).__name__)
+        finally:
+            in_queue.release()
+
+    start = time.perf_counter()
+    next_arrival = start
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while True:
+            next_arrival += rng.expovariate(rate)
+            if next_arrival - start >= duration:
+                break
+            time.sleep(max(0.0, next_arrival - time.perf_counter()))
+            if not in_queue.acquire(blocking=False):
+                step.dropped += 1
+                continue
+            step.sent += 1
+            executor.submit(send, rng.choices(names, weights)[0], next_arrival)
+    step.elapsed = time.perf_counter() - start
+    return step
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure /predict latency and throughput under open-loop load")
+    parser.add_argument("--url", default=f"http://127.0.0.1:{API_PORT}/predict", help="Prediction endpoint")
+    parser.add_argument("--rates", default="0.5,1,2,4", help="Comma-separated offered rates in requests/s")
+    parser.add_argument("--step-duration", type=float, default=60.0, help="Seconds of arrivals per rate")
+    parser.add_argument("--concurrency", type=int, default=16, help="Maximum requests in flight")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help="Synthetic image mix as WxH:weight,... (ignored with --images)")
+    parser.add_argument("--images", default=None, help="Directory of real images to upload instead")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--warmup", type=int, default=2, help="Sequential requests sent before measuring")
+    parser.add_argument("--region", default=None, help="Region form field sent with every request")
+    parser.add_argument("--priority", choices=["interactive", "bulk"], default=None,
+                        help="Admission lane requested with the X-Priority header")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for arrivals and image choice")
+    parser.add_argument("--csv", default=None, help="Also write the per-step results to this CSV file")
+    args = parser.parse_args(argv)
+
+    try:
+        rates = [float(r) for r in args.rates.split(",") if r.strip()]
+        payloads = load_payloads(args)
+    except (ValueError, OSError) as e:
+        print(f"ERROR: {str(e)}")
+        return 1
+    if not payloads:
+        print("ERROR: No images to upload")
+        return 1
+
+    fields = {"region": args.region} if args.region else None
+    headers = {"X-Priority": args.priority} if args.priority else None
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=args.concurrency)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    for _ in range(args.warmup):
+        name, data, _ = payloads[0]
+        try:
+            session.post(args.url, files={"image": (name, data)}, data=fields, headers=headers,
+                         timeout=args.timeout)
+        except requests.exceptions.RequestException as e:
+            print(f"ERROR: Warm-up request failed: {str(e)}")
+            return 1
+
+    sizes = ", ".join(f"{name} ({len(data) // 1024} KB)" for name, data, _ in payloads[:6])
+    print(f"Uploading {len(payloads)} images: {sizes}{' ...' if len(payloads) > 6 else ''}")
+    print(f"{'offered':>8} {'achieved':>9} {'ok':>6} {'err':>5} {'drop':>5} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  server mean ms (decode/infer/rec/report)")
+
+    rng = random.Random(args.seed)
+    rows = []
+    for rate in rates:
+        step = run_step(session, args.url, payloads, rate, args.step_duration,
+                        args.concurrency, args.timeout, fields, rng, headers)
+        row = step.summary()
+        rows.append(row)
+        stages = "/".join("-" if row[f"mean_{s}"] is None else f"{row[f'mean_{s}']:.0f}" for s in SERVER_STAGES)
+        print(f"{row['offered_rps']:>8.2f} {row['achieved_rps']:>9.2f} {row['ok']:>6} {row['errors']:>5} "
+              f"{row['dropped']:>5} {row['p50_ms']:>8.0f} {row['p95_ms']:>8.0f} {row['p99_ms']:>8.0f}  {stages}")
+        for error, count in sorted(step.errors.items()):
+            print(f"{'':>8} {count} x {error}")
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"Results written to {args.csv}")
+
+    session.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+"""
+Admission control for the inference endpoints.
+
+At most ``max_concurrency`` requests run the model at once. Others wait in a
+bounded FIFO queue per priority lane. When a lane's queue is full, or a
+request has waited longer than ``max_wait``, the request is rejected at once
+with a Retry-After estimate instead of piling up until the client times out.
+
+Free slots go to queued interactive requests first. Bulk requests may hold
+at most ``bulk_max_concurrency`` slots, so a flood of batch uploads never
+occupies every worker and interactive latency stays bounded under overload.
+"""
+
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+LANES = (INTERACTIVE, BULK)
+
+
+class Overloaded(Exception):
+    """Raised when a request is not admitted"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Ticket:
+    __slots__ = ("lane", "granted")
+
+    def __init__(self, lane):
+        self.lane = lane
+        self.granted = False
+
+
+class AdmissionController:
+    """Concurrency limit with bounded, prioritized waiting queues"""
+
+    def __init__(self, max_concurrency=2, queue_limits=None, bulk_max_concurrency=None, max_wait=30.0):
+        """
+        Args:
+            max_concurrency (int): Requests allowed to run at once
+            queue_limits (dict): Lane name to maximum queued requests
+            bulk_max_concurrency (int): Slots bulk requests may hold at once,
+                defaults to all but one
+            max_wait (float): Seconds a request may wait in the queue
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        self.queue_limits = {INTERACTIVE: 32, BULK: 64, **(queue_limits or {})}
+        if bulk_max_concurrency is None:
+            bulk_max_concurrency = self.max_concurrency - 1
+        self.bulk_max_concurrency = max(1, min(bulk_max_concurrency, self.max_concurrency))
+        self.max_wait = max_wait
+
+        self._cond = threading.Condition()
+        self._queues = {lane: deque() for lane in LANES}
+        self._running = {lane: 0 for lane in LANES}
+        self._counters = {lane: {"admitted": 0, "rejected": 0, "timed_out": 0} for lane in LANES}
+        # Moving average of how long an admitted request holds its slot
+        self._service_seconds = 1.0
+
+    def _free_slots(self):
+        return self.max_concurrency - sum(self._running.values())
+
+    def _dispatch(self):
+        """Hand free slots to queued tickets, interactive first; caller holds the lock"""
+        granted = False
+        while self._free_slots() > 0:
+            if self._queues[INTERACTIVE]:
+                ticket = self._queues[INTERACTIVE].popleft()
+            elif self._queues[BULK] and self._running[BULK] < self.bulk_max_concurrency:
+                ticket = self._queues[BULK].popleft()
+            else:
+                break
+            ticket.granted = True
+            self._running[ticket.lane] += 1
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def _retry_after(self, lane):
+        """Seconds until a retry is likely to be admitted, from queue depth and service time"""
+        ahead = len(self._queues[INTERACTIVE])
+        if lane == BULK:
+            ahead += len(self._queues[BULK])
+        return min(60, max(1, math.ceil(self._service_seconds * (ahead + 1) / self.max_concurrency)))
+
+    def acquire(self, lane=INTERACTIVE):
+        """
+        Wait for a slot.
+
+        Args:
+            lane (str): "interactive" or "bulk"
+
+        Raises:
+            Overloaded: If the lane's queue is full or the wait exceeds ``max_wait``
+        """
+        lane = lane if lane in LANES else INTERACTIVE
+        with self._cond:
+            ticket = _Ticket(lane)
+            queue = self._queues[lane]
+            if len(queue) >= self.queue_limits[lane]:
+                self._counters[lane]["rejected"] += 1
+                raise Overloaded(f"Too many queued {lane} requests", self._retry_after(lane))
+
+            queue.append(ticket)
+            self._dispatch()
+            deadline = time.monotonic() + self.max_wait
+            while not ticket.granted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    queue.remove(ticket)
+                    self._counters[lane]["timed_out"] += 1
+                    raise Overloaded(f"Timed out waiting for a free {lane} slot", self._retry_after(lane))
+                self._cond.wait(remaining)
+            self._counters[lane]["admitted"] += 1
+
+    def release(self, lane=INTERACTIVE, held_seconds=None):
+        """Give a slot back and record how long it was held"""
+        lane = lane if lane in LANES else INTERACTIVE
+        with self._cond:
+            self._running[lane] -= 1
+            if held_seconds is not None:
+                self._service_seconds = 0.9 * self._service_seconds + 0.1 * held_seconds
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, lane=INTERACTIVE):
+        """Hold a slot for the duration of a ``with`` block"""
+        self.acquire(lane)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(lane, time.monotonic() - start)
+
+    def stats(self):
+        """Queue depths, running requests and counters per lane"""
+        with self._cond:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "bulk_max_concurrency": self.bulk_max_concurrency,
+                "mean_service_ms": round(self._service_seconds * 1000, 1),
+                "lanes": {
+                    lane: {
+                        "running": self._running[lane],
+                        "queued": len(self._queues[lane]),
+                        "queue_limit": self.queue_limits[lane],
+                        **self._counters[lane]
+                    }
+                    for lane in LANES
+                }
+            }
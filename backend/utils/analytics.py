@@ -0,0 +1,287 @@
+"""
+Incrementally maintained disease-trend rollups.
+
+Every prediction bumps a counter and a confidence sum for its (time bucket,
+region, crop, disease) cell at each granularity. The crop is part of the key
+because crops share class names such as "Healthy". That is O(1) work per prediction.
+Range queries read the cells directly instead of rescanning raw results.
+Cells live in memory. A background thread adds the counts gathered since its
+last run to the rows in SQLite, so the rollups survive restarts without
+slowing the request path, and several server processes sharing the database
+add up instead of overwriting each other. Each process answers queries from
+the rows persisted when it started plus its own predictions since.
+
+Buckets are aligned to UTC hour and day boundaries. Region labels come from
+clients, so they are normalized and their number is bounded: either by a
+configured list of regions or by a maximum number of distinct labels. Other
+labels are counted under "other".
+"""
+
+import atexit
+import bisect
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from backend.utils.config import DEFAULT_CROP
+from backend.utils.history import connect
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = {"hour": 3600, "day": 86400}
+
+DEFAULT_REGION = "unknown"
+OTHER_REGION = "other"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rollups (
+    granularity TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    region TEXT NOT NULL,
+    crop TEXT NOT NULL,
+    disease TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    confidence_sum REAL NOT NULL,
+    PRIMARY KEY (granularity, bucket, region, crop, disease)
+) WITHOUT ROWID;
+"""
+
+
+def normalize_region(region):
+    """Lower-case a region label and collapse its whitespace, or None for an empty one"""
+    return " ".join((region or "").split()).lower()[:64] or None
+
+
+def bucket_start(timestamp, granularity):
+    """Start of the UTC bucket containing ``timestamp`` (Unix seconds)"""
+    size = GRANULARITIES[granularity]
+    return int(timestamp // size) * size
+
+
+class AnalyticsRollups:
+    """Per-hour and per-day counts and confidence sums by region and disease"""
+
+    def __init__(self, db_path, flush_interval=5.0, legacy_crop=DEFAULT_CROP, regions=None, max_regions=200):
+        """
+        Load persisted rollups and start the background flusher.
+
+        Args:
+            db_path (str): SQLite database file
+            flush_interval (float): Seconds between writes of changed cells
+            legacy_crop (str): Crop of rollups persisted before crops were recorded
+            regions (list): Allowed region labels; others count as "other"
+            max_regions (int): Without ``regions``, distinct labels kept
+                before further new ones count as "other"
+        """
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.regions = {normalize_region(r) for r in regions or [] if normalize_region(r)} or None
+        self.max_regions = max_regions
+        # Region labels with cells, for the cap on distinct labels
+        self._seen_regions = set()
+        self._lock = threading.Lock()
+        # granularity -> bucket -> (region, crop, disease) -> [count, confidence_sum]
+        self._cells = {g: {} for g in GRANULARITIES}
+        # granularity -> sorted bucket starts, for range queries
+        self._buckets = {g: [] for g in GRANULARITIES}
+        # (granularity, bucket, region, crop, disease) -> [count, confidence_sum] not yet persisted
+        self._pending = {}
+        self._stop = threading.Event()
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        conn = connect(db_path)
+        try:
+            with conn:
+                # Locks out other processes, so only one of them migrates
+                conn.execute("BEGIN IMMEDIATE")
+                existing = {row[1] for row in conn.execute("PRAGMA table_info(rollups)")}
+                if existing and "crop" not in existing:
+                    # Rollups persisted before crops were recorded held one crop's predictions;
+                    # the primary key changes, so the table is rebuilt
+                    conn.execute("ALTER TABLE rollups RENAME TO rollups_before_crops")
+                    conn.execute(SCHEMA)
+                    conn.execute(
+                        "INSERT INTO rollups (granularity, bucket, region, crop, disease, count, confidence_sum) "
+                        "SELECT granularity, bucket, region, ?, disease, count, confidence_sum "
+                        "FROM rollups_before_crops", (legacy_crop,))
+                    conn.execute("DROP TABLE rollups_before_crops")
+                else:
+                    conn.execute(SCHEMA)
+            for granularity, bucket, region, crop, disease, count, confidence_sum in conn.execute(
+                    "SELECT granularity, bucket, region, crop, disease, count, confidence_sum FROM rollups"):
+                if granularity in self._cells:
+                    self._cell(granularity, bucket, region, crop, disease)[:] = [count, confidence_sum]
+        finally:
+            conn.close()
+
+        self._flusher = threading.Thread(target=self._run, name="analytics-flusher", daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    def _cell(self, granularity, bucket, region, crop, disease):
+        """Get or create a cell; callers hold the lock (or own the object)"""
+        buckets = self._cells[granularity]
+        cells = buckets.get(bucket)
+        if cells is None:
+            cells = buckets[bucket] = {}
+            bisect.insort(self._buckets[granularity], bucket)
+        cell = cells.get((region, crop, disease))
+        if cell is None:
+            cell = cells[(region, crop, disease)] = [0, 0.0]
+            if region not in (DEFAULT_REGION, OTHER_REGION):
+                self._seen_regions.add(region)
+        return cell
+
+    def _region_label(self, region):
+        """Label a client-supplied region is counted under; callers hold the lock"""
+        region = normalize_region(region)
+        if region is None:
+            return DEFAULT_REGION
+        if self.regions is not None:
+            return region if region in self.regions else OTHER_REGION
+        if region in self._seen_regions or len(self._seen_regions) < self.max_regions:
+            return region
+        return OTHER_REGION
+
+    def record(self, disease, confidence, region=None, timestamp=None, crop=DEFAULT_CROP):
+        """
+        Add one prediction to every granularity.
+
+        Args:
+            disease (str): Predicted class name
+            confidence (float): Confidence score (0-100)
+            region (str): Region label supplied by the client
+            timestamp (float): Unix time, defaults to now
+            crop (str): Crop whose model made the prediction
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            region = self._region_label(region)
+            for granularity in GRANULARITIES:
+                bucket = bucket_start(timestamp, granularity)
+                cell = self._cell(granularity, bucket, region, crop, disease)
+                cell[0] += 1
+                cell[1] += confidence
+                delta = self._pending.setdefault((granularity, bucket, region, crop, disease), [0, 0.0])
+                delta[0] += 1
+                delta[1] += confidence
+
+    def query(self, granularity="day", start=None, end=None, region=None, disease=None, by_region=False,
+              crop=None):
+        """
+        Read rollups for a time range.
+
+        Args:
+            granularity (str): "hour" or "day"
+            start (float): Unix time; buckets starting before the one containing it are skipped
+            end (float): Unix time; buckets starting at or after it are skipped
+            region (str): Only this region
+            disease (str): Only this class name
+            by_region (bool): Keep regions separate instead of summing over them
+            crop (str): Only this crop; None sums over crops, merging class names they share
+
+        Returns:
+            dict: ``series`` ordered by bucket and ``totals`` per disease,
+                each with ``count`` and ``mean_confidence``
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Unknown granularity: {granularity}")
+        if region is not None:
+            region = normalize_region(region) or DEFAULT_REGION
+
+        with self._lock:
+            buckets = self._buckets[granularity]
+            lo = 0 if start is None else bisect.bisect_left(buckets, bucket_start(start, granularity))
+            hi = len(buckets) if end is None else bisect.bisect_left(buckets, end)
+            selected = [(bucket, list(self._cells[granularity][bucket].items()))
+                        for bucket in buckets[lo:hi]]
+
+        series = []
+        totals = {}
+        for bucket, cells in selected:
+            merged = {}
+            for (cell_region, cell_crop, cell_disease), (count, confidence_sum) in cells:
+                if region is not None and cell_region != region:
+                    continue
+                if crop is not None and cell_crop != crop:
+                    continue
+                if disease is not None and cell_disease != disease:
+                    continue
+                key = (cell_region if by_region else None, cell_disease)
+                entry = merged.setdefault(key, [0, 0.0])
+                entry[0] += count
+                entry[1] += confidence_sum
+                total = totals.setdefault(cell_disease, [0, 0.0])
+                total[0] += count
+                total[1] += confidence_sum
+
+            bucket_iso = datetime.fromtimestamp(bucket, timezone.utc).isoformat()
+            for (cell_region, cell_disease), (count, confidence_sum) in sorted(
+                    merged.items(), key=lambda item: (item[0][0] or "", item[0][1])):
+                point = {
+                    "bucket": bucket_iso,
+                    "disease": cell_disease,
+                    "count": count,
+                    "mean_confidence": round(confidence_sum / count, 2)
+                }
+                if by_region:
+                    point["region"] = cell_region
+                series.append(point)
+
+        return {
+            "granularity": granularity,
+            "crop": crop,
+            "series": series,
+            "totals": {
+                name: {"count": count, "mean_confidence": round(confidence_sum / count, 2)}
+                for name, (count, confidence_sum) in sorted(totals.items())
+            }
+        }
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        """Add the counts gathered since the last flush to the persisted cells"""
+        with self._lock:
+            if not self._pending:
+                return
+            pending = self._pending
+            self._pending = {}
+        rows = [(*key, count, confidence_sum) for key, (count, confidence_sum) in pending.items()]
+
+        committed = False
+        try:
+            conn = connect(self.db_path)
+            try:
+                with conn:
+                    conn.executemany(
+                        "INSERT INTO rollups (granularity, bucket, region, crop, disease, count, confidence_sum) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                        "ON CONFLICT (granularity, bucket, region, crop, disease) DO UPDATE SET "
+                        "count = count + excluded.count, "
+                        "confidence_sum = confidence_sum + excluded.confidence_sum",
+                        rows)
+                committed = True
+            finally:
+                conn.close()
+        except Exception as e:
+            if committed:
+                return
+            logger.error(f"Failed to persist {len(rows)} analytics rollups: {str(e)}")
+            # Keep the deltas, including ones recorded meanwhile, for the next flush
+            with self._lock:
+                for key, (count, confidence_sum) in pending.items():
+                    delta = self._pending.setdefault(key, [0, 0.0])
+                    delta[0] += count
+                    delta[1] += confidence_sum
+
+    def close(self, timeout=5.0):
+        """Write outstanding changes and stop the flusher"""
+        if self._flusher.is_alive():
+            self._stop.set()
+            self._flusher.join(timeout)
@@ -0,0 +1,207 @@
+"""
+Content-addressed on-disk store for generated artifacts such as PDF reports.
+
+An artifact is stored under the SHA-256 of everything that determines its
+content (see ``artifact_key``), so identical inputs map to the same file and
+it is rendered only once:
+
+    <root>/<first two hex digits>/<key><suffix>
+
+Files are written to a temporary name in the same directory and renamed into
+place, so readers never see a partial file. The total size is kept under a
+quota by deleting the least recently used files; a read refreshes the file's
+modification time, which is how recency survives restarts. Several processes
+may share a directory: each keeps its own index and treats files that
+disappear under it as misses.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+KEY_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+def artifact_key(*parts):
+    """
+    Hash the inputs of an artifact into its key.
+
+    Args:
+        *parts: str or bytes values; each is length-prefixed, so ("ab", "c")
+            and ("a", "bc") give different keys
+
+    Returns:
+        str: 64 hex digits
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part if isinstance(part, bytes) else str(part).encode("utf-8")
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class ArtifactStore:
+    """Files keyed by content hash, evicted least recently used first beyond a disk quota"""
+
+    def __init__(self, root, quota_bytes, suffix=".pdf"):
+        """
+        Open or create a store, indexing the files already in it.
+
+        Args:
+            root (str): Store directory
+            quota_bytes (int): Total size kept; older files are deleted beyond it
+            suffix (str): File name extension of the artifacts
+        """
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        # key -> size in bytes, least recently used first
+        self._index = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        os.makedirs(root, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        found = []
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".tmp"):
+                    # Left behind by a writer that died before renaming
+                    self._remove(entry.path)
+                    continue
+                key = entry.name[:-len(self.suffix)] if entry.name.endswith(self.suffix) else None
+                if key and KEY_PATTERN.match(key):
+                    stat = entry.stat()
+                    found.append((stat.st_mtime, key, stat.st_size))
+        with self._lock:
+            for _, key, size in sorted(found):
+                self._index[key] = size
+                self._bytes += size
+            self._evict()
+        logger.info(f"Artifact store {self.root}: {len(found)} files, {self._bytes / 2 ** 20:.1f} MB")
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key + self.suffix)
+
+    def get(self, key):
+        """
+        Look up an artifact and mark it as recently used.
+
+        Returns:
+            str: Path of the stored file, or None if it is not stored
+        """
+        path = self.path(key)
+        with self._lock:
+            known = key in self._index
+        if known:
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                # Evicted by another process sharing the directory
+                self._forget(key)
+                known = False
+        elif os.path.exists(path):
+            # Written by another process sharing the directory
+            try:
+                size = os.path.getsize(path)
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+            else:
+                with self._lock:
+                    if key not in self._index:
+                        self._index[key] = size
+                        self._bytes += size
+                known = True
+        with self._lock:
+            if known:
+                self._index.move_to_end(key)
+                self.hits += 1
+                return path
+            self.misses += 1
+            return None
+
+    def put(self, key, data):
+        """
+        Store an artifact atomically, evicting older ones beyond the quota.
+
+        Args:
+            key (str): Key from ``artifact_key``
+            data (bytes): File content
+
+        Returns:
+            str: Path of the stored file
+        """
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+        with self._lock:
+            self._bytes += len(data) - self._index.pop(key, 0)
+            self._index[key] = len(data)
+            self.writes += 1
+            self._evict(keep=key)
+        return path
+
+    def _evict(self, keep=None):
+        """Delete least recently used files until the quota holds; call with the lock held"""
+        while self._bytes > self.quota_bytes and self._index:
+            key, size = next(iter(self._index.items()))
+            if key == keep:
+                break
+            del self._index[key]
+            self._bytes -= size
+            self.evictions += 1
+            self._remove(self.path(key))
+
+    def _forget(self, key):
+        with self._lock:
+            size = self._index.pop(key, None)
+            if size is not None:
+                self._bytes -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not delete {path}: {str(e)}")
+
+    def stats(self):
+        """Counters for /stats"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._index),
+                "mb": round(self._bytes / 2 ** 20, 1),
+                "quota_mb": round(self.quota_bytes / 2 ** 20, 1),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "writes": self.writes,
+                "evictions": self.evictions,
+            }
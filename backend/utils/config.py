@@ -10,8 +10,103 @@ API_HOST = os.getenv("API_HOST", "0.0.0.0")
 API_PORT = int(os.getenv("API_PORT", "5000"))
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
+# Alternative Gemini REST endpoint, e.g. backend.tools.fake_gemini for load tests
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT", "")
+# Seconds allowed per recommendation request, retries included
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "30"))
 
 MODEL_PATH = os.getenv("MODEL_PATH", "models/crop_best_model.pth")
+# timm architecture of .pth checkpoints; safetensors files record their own in the metadata
+MODEL_ARCH = os.getenv("MODEL_ARCH", "rexnet_150")
+
+# Crop-specific models: a JSON file {"default": crop, "crops": {crop: {"model_path": ..., ...}}}
+# (see backend/app/model_pool.py); when unset, MODEL_PATH is served as the only crop, DEFAULT_CROP
+CROP_MODELS_PATH = os.getenv("CROP_MODELS_PATH", "")
+DEFAULT_CROP = os.getenv("DEFAULT_CROP", "cassava").strip().lower()
+# RAM budget for loaded models; idle ones are evicted least recently used first (0: no limit)
+MODEL_POOL_MEMORY_MB = float(os.getenv("MODEL_POOL_MEMORY_MB", "0"))
 
 TEMP_DIR = os.path.join(tempfile.gettempdir(), "crop_disease_detection")
-os.makedirs(TEMP_DIR, exist_ok=True) 
\ No newline at end of file
+os.makedirs(TEMP_DIR, exist_ok=True) 
+
+DATA_DIR = os.getenv("DATA_DIR", os.path.join(base_dir, "backend", "data"))
+
+SIMILARITY_INDEX_DIR = os.getenv("SIMILARITY_INDEX_DIR", os.path.join(DATA_DIR, "similar"))
+SIMILARITY_INDEX_ENABLED = os.getenv("SIMILARITY_INDEX_ENABLED", "true").lower() in ("1", "true", "yes")
+SIMILARITY_NPROBE = int(os.getenv("SIMILARITY_NPROBE", "16"))
+
+HISTORY_ENABLED = os.getenv("HISTORY_ENABLED", "true").lower() in ("1", "true", "yes")
+HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", os.path.join(DATA_DIR, "history.db"))
+
+# Recorded with every diagnosis; defaults to the model file name
+MODEL_VERSION = os.getenv("MODEL_VERSION", "")
+
+ANALYTICS_ENABLED = os.getenv("ANALYTICS_ENABLED", "true").lower() in ("1", "true", "yes")
+ANALYTICS_DB_PATH = os.getenv("ANALYTICS_DB_PATH", os.path.join(DATA_DIR, "analytics.db"))
+# Comma-separated region labels; others are counted as "other". Empty keeps the
+# first ANALYTICS_MAX_REGIONS labels seen instead
+ANALYTICS_REGIONS = [r for r in (" ".join(r.split()).lower() for r in os.getenv("ANALYTICS_REGIONS", "").split(",")) if r]
+ANALYTICS_MAX_REGIONS = int(os.getenv("ANALYTICS_MAX_REGIONS", "200"))
+
+# "tiered" (local knowledge base, refreshed from Gemini in the background), "local" or "gemini"
+RECOMMENDATION_PROVIDER = os.getenv("RECOMMENDATION_PROVIDER", "tiered").lower()
+KNOWLEDGE_BASE_PATH = os.getenv("KNOWLEDGE_BASE_PATH", os.path.join(base_dir, "backend", "knowledge", "cassava.json"))
+RECOMMENDATION_REFRESH_SECONDS = float(os.getenv("RECOMMENDATION_REFRESH_SECONDS", str(7 * 24 * 3600)))
+RECOMMENDATION_CACHE_PATH = os.getenv("RECOMMENDATION_CACHE_PATH", os.path.join(DATA_DIR, "recommendations.json"))
+
+# Reuse the diagnosis of an earlier upload whose perceptual hash is within DEDUP_MAX_DISTANCE bits
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() in ("1", "true", "yes")
+DEDUP_MAX_DISTANCE = int(os.getenv("DEDUP_MAX_DISTANCE", "6"))
+DEDUP_CAPACITY = int(os.getenv("DEDUP_CAPACITY", "100000"))
+
+# Inference admission control: concurrent requests, per-lane queue bounds and maximum queue wait
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() in ("1", "true", "yes")
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "2"))
+# Slots bulk requests may hold at once; defaults to all but one
+ADMISSION_BULK_MAX_CONCURRENCY = int(os.getenv("ADMISSION_BULK_MAX_CONCURRENCY", "0")) or None
+ADMISSION_QUEUE_INTERACTIVE = int(os.getenv("ADMISSION_QUEUE_INTERACTIVE", "32"))
+ADMISSION_QUEUE_BULK = int(os.getenv("ADMISSION_QUEUE_BULK", "64"))
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "30"))
+
+# Asynchronous /jobs API: durable queue, worker threads and how long finished jobs are kept
+JOBS_ENABLED = os.getenv("JOBS_ENABLED", "true").lower() in ("1", "true", "yes")
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", os.path.join(DATA_DIR, "jobs.db"))
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", "2"))
+JOBS_MAX_PENDING = int(os.getenv("JOBS_MAX_PENDING", "1000"))
+JOBS_RETENTION_SECONDS = float(os.getenv("JOBS_RETENTION_SECONDS", "86400"))
+JOBS_LEASE_SECONDS = float(os.getenv("JOBS_LEASE_SECONDS", "60"))
+
+# CPU inference profile: standard, channels_last, compiled, bf16 or compiled-bf16 (see backend/app/model.py)
+INFERENCE_PROFILE = os.getenv("INFERENCE_PROFILE", "standard")
+# Intra-op threads for PyTorch; 0 keeps the PyTorch default (one per core)
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", "0"))
+INFERENCE_WARMUP_RUNS = int(os.getenv("INFERENCE_WARMUP_RUNS", "2"))
+
+# Grad-CAM explanations: requests with explain=true keep their activations this long for /explain/<case_id>
+EXPLAIN_ENABLED = os.getenv("EXPLAIN_ENABLED", "true").lower() in ("1", "true", "yes")
+EXPLAIN_CACHE_SIZE = int(os.getenv("EXPLAIN_CACHE_SIZE", "128"))
+EXPLAIN_TTL_SECONDS = float(os.getenv("EXPLAIN_TTL_SECONDS", "600"))
+
+# /predict/video: default frame sampling, per-upload limits on video length and classified frames,
+# and limits on the request body. The multipart parser keeps parts under 500 KB in memory, so
+# VIDEO_MAX_UPLOAD_FRAMES and VIDEO_MAX_UPLOAD_MB bound the memory a frame sequence takes
+VIDEO_SAMPLE_INTERVAL = float(os.getenv("VIDEO_SAMPLE_INTERVAL", "1.0"))
+VIDEO_SCENE_THRESHOLD = float(os.getenv("VIDEO_SCENE_THRESHOLD", "0.12"))
+VIDEO_SEGMENT_SECONDS = float(os.getenv("VIDEO_SEGMENT_SECONDS", "5"))
+VIDEO_MAX_SECONDS = float(os.getenv("VIDEO_MAX_SECONDS", "600"))
+VIDEO_MAX_FRAMES = int(os.getenv("VIDEO_MAX_FRAMES", "300"))
+VIDEO_BATCH_SIZE = int(os.getenv("VIDEO_BATCH_SIZE", "16"))
+VIDEO_MAX_UPLOAD_MB = float(os.getenv("VIDEO_MAX_UPLOAD_MB", "200"))
+VIDEO_MAX_UPLOAD_FRAMES = int(os.getenv("VIDEO_MAX_UPLOAD_FRAMES", "600"))
+
+# Generated PDF reports, stored by a hash of their inputs and served from disk by /reports/<key>
+REPORT_STORE_ENABLED = os.getenv("REPORT_STORE_ENABLED", "true").lower() in ("1", "true", "yes")
+REPORT_STORE_DIR = os.getenv("REPORT_STORE_DIR", os.path.join(DATA_DIR, "reports"))
+REPORT_STORE_QUOTA_MB = float(os.getenv("REPORT_STORE_QUOTA_MB", "512"))
+
+# Logging: records are queued and written as JSON lines ("text" for plain lines) by a background thread
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+# With LOG_LEVEL=DEBUG, the fraction of requests whose debug records are kept
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
@@ -0,0 +1,354 @@
+"""
+On-disk nearest-neighbour index of image embeddings for "similar cases" lookup.
+
+Layout of an index directory:
+
+    vectors.npy        float16 matrix (capacity x dim), L2-normalized rows, memory-mapped
+    meta.jsonl         one JSON object per stored row; a row only counts once its line exists
+    ivf_*.npy, ivf.json  optional inverted-file partitions built by build_partitions()
+
+Embeddings of different models are not comparable, so each model version
+keeps its own index directory below the configured root (see ``index_dir``).
+
+Without partitions every search is an exact, chunked scan of the matrix.
+With partitions only the ``nprobe`` lists whose centroids are closest to the
+query are scanned, plus any rows added since the partitions were built.
+Partitions can be rebuilt by another process while the index is in use:
+every file is written under a temporary name and renamed into place, with
+``ivf.json`` last, and searches reload the partitions when it changes.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+from array import array
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Rows converted to float32 at a time while scoring (8192 x 1920 floats ~ 60 MB)
+CHUNK_ROWS = 8192
+
+
+def index_dir(root, model_version):
+    """Directory of the index holding one model version's embeddings"""
+    return os.path.join(root, re.sub(r"[^A-Za-z0-9._-]", "_", model_version or "default"))
+
+
+def _normalize(vectors):
+    """L2-normalize vectors along the last axis, leaving zero vectors untouched"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _top_k(scores, ids, k):
+    """Return the k highest scores (descending) with their ids"""
+    if len(scores) > k:
+        keep = np.argpartition(-scores, k - 1)[:k]
+        scores, ids = scores[keep], ids[keep]
+    order = np.argsort(-scores, kind="stable")
+    return scores[order], ids[order]
+
+
+class EmbeddingIndex:
+    """Append-only float16 embedding matrix with exact or partitioned cosine search"""
+
+    def __init__(self, directory, dim, initial_capacity=4096, read_only=False):
+        """
+        Open or create an index.
+
+        Args:
+            directory (str): Directory holding the index files
+            dim (int): Embedding dimension
+            initial_capacity (int): Rows preallocated for a new index
+            read_only (bool): Open an existing index without modifying its
+                vectors or metadata, e.g. from a tool while the backend is
+                adding to it; ``add`` is not available
+        """
+        self.directory = directory
+        self.dim = dim
+        self.read_only = read_only
+        self._lock = threading.Lock()
+        self._vectors_path = os.path.join(directory, "vectors.npy")
+        self._meta_path = os.path.join(directory, "meta.jsonl")
+        self._info_path = os.path.join(directory, "ivf.json")
+        if not read_only:
+            os.makedirs(directory, exist_ok=True)
+
+        self._offsets = array("q")
+        if os.path.exists(self._meta_path):
+            valid_end = 0
+            with open(self._meta_path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    self._offsets.append(valid_end)
+                    valid_end += len(line)
+            if os.path.getsize(self._meta_path) != valid_end and not read_only:
+                # Drop a partially written last line left by a crash
+                with open(self._meta_path, "r+b") as f:
+                    f.truncate(valid_end)
+
+        if os.path.exists(self._vectors_path) or read_only:
+            self._vectors = np.load(self._vectors_path, mmap_mode="r" if read_only else "r+")
+            if self._vectors.shape[1] != dim:
+                raise ValueError(f"Index at {directory} has dimension {self._vectors.shape[1]}, expected {dim}")
+            del self._offsets[self._vectors.shape[0]:]
+        else:
+            self._vectors = np.lib.format.open_memmap(
+                self._vectors_path, mode="w+", dtype=np.float16,
+                shape=(max(initial_capacity, 1), dim))
+
+        self._meta_file = None if read_only else open(self._meta_path, "ab")
+        self._ivf = None
+        self._ivf_stamp = None
+        self._refresh_partitions()
+
+    @property
+    def count(self):
+        """Number of stored embeddings"""
+        return len(self._offsets)
+
+    def add(self, embedding, metadata):
+        """
+        Store one embedding with its metadata.
+
+        Args:
+            embedding (array-like): Vector of length ``dim``
+            metadata (dict): JSON-serializable data returned with search results
+
+        Returns:
+            int: Row number of the stored embedding
+        """
+        if self.read_only:
+            raise ValueError(f"Index at {self.directory} is open read-only")
+        vector = _normalize(embedding).astype(np.float16)
+        line = (json.dumps(metadata, separators=(",", ":")) + "\n").encode("utf-8")
+
+        with self._lock:
+            row = len(self._offsets)
+            if row >= self._vectors.shape[0]:
+                self._grow(row + 1)
+            self._vectors[row] = vector
+            # The metadata line commits the row; vectors past the last line are ignored
+            offset = self._meta_file.seek(0, os.SEEK_END)
+            self._meta_file.write(line)
+            self._meta_file.flush()
+            self._offsets.append(offset)
+            return row
+
+    def _grow(self, min_rows):
+        """Double the matrix capacity by copying it into a larger file"""
+        capacity = self._vectors.shape[0]
+        while capacity < min_rows:
+            capacity *= 2
+        tmp_path = self._vectors_path + ".tmp"
+        grown = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float16,
+                                          shape=(capacity, self.dim))
+        count = len(self._offsets)
+        for start in range(0, count, CHUNK_ROWS):
+            end = min(start + CHUNK_ROWS, count)
+            grown[start:end] = self._vectors[start:end]
+        grown.flush()
+        del grown
+        os.replace(tmp_path, self._vectors_path)
+        # Searches still holding the old mapping keep working on the unlinked file
+        self._vectors = np.load(self._vectors_path, mmap_mode="r+")
+        logger.info(f"Grew embedding index to {capacity} rows")
+
+    def flush(self):
+        """Write dirty pages of the matrix back to disk"""
+        if self.read_only:
+            return
+        with self._lock:
+            self._vectors.flush()
+
+    def metadata(self, rows):
+        """Read the metadata objects for the given row numbers"""
+        results = []
+        with open(self._meta_path, "rb") as f:
+            for row in rows:
+                f.seek(self._offsets[int(row)])
+                results.append(json.loads(f.readline()))
+        return results
+
+    def _score_rows(self, vectors, rows, query):
+        """Cosine scores for an ascending array of row numbers"""
+        scores = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), CHUNK_ROWS):
+            chunk = rows[start:start + CHUNK_ROWS]
+            scores[start:start + len(chunk)] = vectors[chunk].astype(np.float32) @ query
+        return scores
+
+    def _scan_range(self, vectors, start, end, query, k):
+        """Exact top-k over a contiguous row range"""
+        best_scores = np.empty(0, dtype=np.float32)
+        best_ids = np.empty(0, dtype=np.int64)
+        for chunk_start in range(start, end, CHUNK_ROWS):
+            chunk_end = min(chunk_start + CHUNK_ROWS, end)
+            scores = vectors[chunk_start:chunk_end].astype(np.float32) @ query
+            ids = np.arange(chunk_start, chunk_end, dtype=np.int64)
+            best_scores, best_ids = _top_k(np.concatenate([best_scores, scores]),
+                                           np.concatenate([best_ids, ids]), k)
+        return best_scores, best_ids
+
+    def search(self, query, k=5, nprobe=16):
+        """
+        Find the stored embeddings most similar to ``query``.
+
+        Args:
+            query (array-like): Query vector of length ``dim``
+            k (int): Number of results
+            nprobe (int): Partitions to scan when the index is partitioned;
+                0 forces an exact scan
+
+        Returns:
+            list: Dicts with the stored metadata plus ``score`` (cosine similarity), best first
+        """
+        query = _normalize(query)
+        self._refresh_partitions()
+        with self._lock:
+            vectors = self._vectors
+            count = len(self._offsets)
+            ivf = self._ivf
+        if count == 0 or k <= 0:
+            return []
+
+        if ivf is None or not nprobe:
+            scores, ids = self._scan_range(vectors, 0, count, query, k)
+        else:
+            centroids, order, list_offsets, built_rows = ivf
+            probe = np.argsort(-(centroids @ query))[:nprobe]
+            rows = np.concatenate([order[list_offsets[p]:list_offsets[p + 1]] for p in probe])
+            rows = np.sort(rows[rows < count]).astype(np.int64)
+            scores, ids = _top_k(self._score_rows(vectors, rows, query), rows, k)
+            if built_rows < count:
+                tail_scores, tail_ids = self._scan_range(vectors, built_rows, count, query, k)
+                scores, ids = _top_k(np.concatenate([scores, tail_scores]),
+                                     np.concatenate([ids, tail_ids]), k)
+
+        results = []
+        for score, meta in zip(scores.tolist(), self.metadata(ids)):
+            meta["score"] = round(score, 4)
+            results.append(meta)
+        return results
+
+    def build_partitions(self, n_lists=1024, iterations=10, sample_size=100000, seed=0):
+        """
+        Cluster the stored embeddings into inverted lists with spherical k-means.
+
+        Rows added afterwards are scanned exactly until the partitions are rebuilt.
+
+        Args:
+            n_lists (int): Number of partitions
+            iterations (int): k-means iterations over the training sample
+            sample_size (int): Rows used to train the centroids
+            seed (int): Random seed for sampling and initialization
+        """
+        with self._lock:
+            vectors = self._vectors
+            count = len(self._offsets)
+        if count == 0:
+            raise ValueError("Cannot partition an empty index")
+
+        n_lists = min(n_lists, count)
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(rng.choice(count, size=min(sample_size, count), replace=False))
+        sample = vectors[sample_rows].astype(np.float32)
+
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)]
+        for _ in range(iterations):
+            assignment = self._assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            empty = np.bincount(assignment, minlength=n_lists) == 0
+            # Re-seed empty lists with random sample points
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+            centroids = _normalize(sums)
+
+        assignment = np.concatenate([
+            self._assign(vectors[start:min(start + CHUNK_ROWS, count)].astype(np.float32), centroids)
+            for start in range(0, count, CHUNK_ROWS)
+        ])
+        order = np.argsort(assignment, kind="stable").astype(np.int32)
+        list_offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=n_lists), out=list_offsets[1:])
+
+        # Searches in other processes may be reading the previous partitions,
+        # so no file is ever rewritten in place; ivf.json goes last and makes
+        # them reload
+        self._save_array("ivf_centroids.npy", centroids.astype(np.float32))
+        self._save_array("ivf_order.npy", order)
+        self._save_array("ivf_offsets.npy", list_offsets)
+        tmp_path = self._info_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"rows": count, "lists": n_lists}, f)
+        os.replace(tmp_path, self._info_path)
+
+        self._refresh_partitions()
+        logger.info(f"Partitioned {count} embeddings into {n_lists} lists")
+
+    @staticmethod
+    def _assign(vectors, centroids):
+        """Index of the most similar centroid for each row"""
+        assignment = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), CHUNK_ROWS):
+            chunk = vectors[start:start + CHUNK_ROWS]
+            assignment[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+        return assignment
+
+    def _save_array(self, name, values):
+        """Write an array file under a temporary name and rename it into place"""
+        path = os.path.join(self.directory, name)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, values)
+        os.replace(tmp_path, path)
+
+    def _refresh_partitions(self):
+        """Reload the partitions when ivf.json has been replaced since the last load"""
+        try:
+            stat = os.stat(self._info_path)
+            stamp = (stat.st_ino, stat.st_mtime_ns)
+        except FileNotFoundError:
+            stamp = None
+        if stamp == self._ivf_stamp:
+            return
+        ivf = self._load_partitions() if stamp else None
+        with self._lock:
+            if stamp and ivf is None and self._ivf is not None:
+                # Caught a rebuild half-way; keep the previous partitions and try again next time
+                return
+            self._ivf = ivf
+            self._ivf_stamp = stamp
+
+    def _load_partitions(self):
+        """Load inverted lists written by build_partitions, if any"""
+        try:
+            with open(self._info_path) as f:
+                info = json.load(f)
+            centroids = np.load(os.path.join(self.directory, "ivf_centroids.npy"))
+            order = np.load(os.path.join(self.directory, "ivf_order.npy"), mmap_mode="r")
+            list_offsets = np.load(os.path.join(self.directory, "ivf_offsets.npy"))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable index partitions in {self.directory}: {str(e)}")
+            return None
+        if centroids.shape[1] != self.dim:
+            return None
+        if (len(order) != info["rows"] or len(list_offsets) != info["lists"] + 1
+                or len(centroids) != info["lists"]):
+            # Files from two different builds
+            return None
+        return centroids, order, list_offsets, int(info["rows"])
+
+    def close(self):
+        """Flush and release the index files"""
+        if self.read_only:
+            return
+        with self._lock:
+            self._vectors.flush()
+            self._meta_file.close()
@@ -0,0 +1,156 @@
+"""
+Short-lived storage and rendering for Grad-CAM explanations.
+
+When a client asks for an explanation, /predict keeps the final-stage
+activation map of its forward pass (a few hundred KB) and a small copy of the
+image, keyed by case id. A later /explain/<case_id> call turns them into a
+heatmap with one backward pass through the classifier head, so explaining a
+diagnosis never runs the network a second time. Entries expire after
+``ttl_seconds`` and the oldest are evicted beyond ``capacity``. The cache
+lives in the process that served /predict.
+"""
+
+import io
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+# Anchor colours of the heatmap palette, from cold (0) to hot (1)
+_PALETTE_STOPS = np.array([
+    [0, 0, 128],
+    [0, 0, 255],
+    [0, 255, 255],
+    [255, 255, 0],
+    [255, 0, 0],
+    [128, 0, 0],
+], dtype=np.float32)
+
+
+def colorize(heatmap):
+    """
+    Map a heatmap in [0, 1] to RGB with a blue-to-red palette.
+
+    Returns:
+        np.ndarray: (h, w, 3) uint8 array
+    """
+    positions = np.clip(heatmap, 0, 1) * (len(_PALETTE_STOPS) - 1)
+    lower = np.floor(positions).astype(np.int64)
+    upper = np.minimum(lower + 1, len(_PALETTE_STOPS) - 1)
+    fraction = (positions - lower)[..., None]
+    colors = _PALETTE_STOPS[lower] * (1 - fraction) + _PALETTE_STOPS[upper] * fraction
+    return colors.astype(np.uint8)
+
+
+def render_overlay(image, heatmap, alpha=0.45):
+    """
+    Blend a coloured heatmap over an image.
+
+    Args:
+        image (PIL.Image.Image): Image the heatmap was computed for
+        heatmap (np.ndarray): (h, w) values in [0, 1], usually 7x7
+        alpha (float): Weight of the heatmap colour
+
+    Returns:
+        PIL.Image.Image: RGB overlay at the image's size
+    """
+    base = image.convert("RGB")
+    # Upsample the coarse map smoothly to the image size
+    heat = Image.fromarray((np.clip(heatmap, 0, 1) * 255).astype(np.uint8), "L")
+    heat = np.asarray(heat.resize(base.size, Image.BICUBIC), dtype=np.float32) / 255
+    colors = Image.fromarray(colorize(heat), "RGB")
+    return Image.blend(base, colors, alpha)
+
+
+def encode_png(image):
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG", optimize=False)
+    return buffer.getvalue()
+
+
+class ExplanationCache:
+    """Activations and thumbnails of recent explainable diagnoses, by case id"""
+
+    def __init__(self, capacity=128, ttl_seconds=600, thumbnail_size=512):
+        """
+        Args:
+            capacity (int): Entries kept; the oldest are evicted first
+            ttl_seconds (float): Seconds an entry can be explained after its diagnosis
+            thumbnail_size (int): Longest side of the stored image copy
+        """
+        self.capacity = capacity
+        self.ttl_seconds = ttl_seconds
+        self.thumbnail_size = thumbnail_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.stored = 0
+        self.explained = 0
+        self.evicted = 0
+
+    def put(self, case_id, activations, class_index, disease, confidence, image, crop=None):
+        """
+        Keep what is needed to explain a diagnosis later.
+
+        Args:
+            case_id (str): Diagnosis id
+            activations (torch.Tensor): Final-stage activation map from the forward pass
+            class_index (int): Predicted class
+            disease (str): Predicted class name
+            confidence (float): Confidence in percent
+            image (PIL.Image.Image): The diagnosed image
+            crop (str): Crop whose model made the diagnosis
+        """
+        thumbnail = image.convert("RGB")
+        thumbnail.thumbnail((self.thumbnail_size, self.thumbnail_size))
+        entry = {
+            "activations": activations,
+            "class_index": class_index,
+            "disease": disease,
+            "confidence": confidence,
+            "image": thumbnail,
+            "crop": crop,
+            "heatmap": None,
+            "created": time.monotonic(),
+        }
+        with self._lock:
+            self._entries[case_id] = entry
+            self._entries.move_to_end(case_id)
+            self.stored += 1
+            self._evict()
+
+    def get(self, case_id):
+        """Return the entry for a case, or None if unknown or expired"""
+        with self._lock:
+            self._evict()
+            return self._entries.get(case_id)
+
+    def set_heatmap(self, case_id, heatmap):
+        """Remember a computed heatmap so repeated calls skip the backward pass"""
+        with self._lock:
+            entry = self._entries.get(case_id)
+            if entry is not None:
+                entry["heatmap"] = heatmap
+                self.explained += 1
+
+    def _evict(self):
+        cutoff = time.monotonic() - self.ttl_seconds
+        while self._entries:
+            case_id, entry = next(iter(self._entries.items()))
+            if len(self._entries) <= self.capacity and entry["created"] >= cutoff:
+                break
+            del self._entries[case_id]
+            self.evicted += 1
+
+    def stats(self):
+        """Counters for /stats"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "capacity": self.capacity,
+                "ttl_seconds": self.ttl_seconds,
+                "stored": self.stored,
+                "explained": self.explained,
+                "evicted": self.evicted,
+            }
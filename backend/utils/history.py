@@ -0,0 +1,257 @@
+"""
+Persistent history of diagnoses, stored in an embedded SQLite database.
+
+Request handlers only put rows on an in-memory queue. A background thread
+writes them out in batches, one transaction per batch, so recording a
+diagnosis never waits on disk I/O. If the queue is full (the disk cannot
+keep up), new rows are dropped and counted rather than blocking the request.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS diagnoses (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    case_id TEXT,
+    timestamp REAL NOT NULL,
+    image_hash TEXT,
+    disease TEXT NOT NULL,
+    confidence REAL,
+    model_version TEXT,
+    timings TEXT,
+    phash TEXT,
+    crop TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_diagnoses_disease_time ON diagnoses (disease, timestamp);
+CREATE INDEX IF NOT EXISTS idx_diagnoses_time ON diagnoses (timestamp);
+"""
+
+COLUMNS = ("case_id", "timestamp", "image_hash", "disease", "confidence", "model_version", "timings", "phash",
+           "crop")
+
+_STOP = object()
+
+
+def connect(db_path):
+    """Open a connection with the pragmas every user of the database expects"""
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class HistoryStore:
+    """Write-behind store of diagnosis results with a paginated query API"""
+
+    def __init__(self, db_path, batch_size=200, flush_interval=1.0, max_queue=10000, legacy_crop=None):
+        """
+        Open the database and start the background writer.
+
+        Args:
+            db_path (str): SQLite database file
+            batch_size (int): Maximum rows written per transaction
+            flush_interval (float): Seconds to wait for more rows before writing a partial batch
+            max_queue (int): Rows buffered in memory before new ones are dropped
+            legacy_crop (str): Crop of rows written before crops were recorded
+        """
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        conn = connect(db_path)
+        with conn:
+            conn.executescript(SCHEMA)
+            existing = {row[1] for row in conn.execute("PRAGMA table_info(diagnoses)")}
+            if "phash" not in existing:
+                # Databases created before perceptual hashes were recorded
+                conn.execute("ALTER TABLE diagnoses ADD COLUMN phash TEXT")
+            if "crop" not in existing:
+                # Databases created before crops were recorded held one crop's diagnoses
+                conn.execute("ALTER TABLE diagnoses ADD COLUMN crop TEXT")
+                conn.execute("UPDATE diagnoses SET crop = ?", (legacy_crop,))
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_diagnoses_crop_time ON diagnoses (crop, timestamp)")
+        conn.close()
+
+        self._writer = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def record(self, disease, confidence, image_hash=None, model_version=None,
+               timings=None, case_id=None, timestamp=None, phash=None, crop=None):
+        """
+        Queue one diagnosis for writing. Never blocks.
+
+        Args:
+            disease (str): Predicted class name
+            confidence (float): Confidence score (0-100)
+            image_hash (str): Hash of the uploaded image bytes
+            model_version (str): Version of the model that produced the result
+            timings (dict): Stage name to duration in milliseconds
+            case_id (str): Id returned to the client for this diagnosis
+            timestamp (float): Unix time, defaults to now
+            phash (str): Perceptual hash of the image, as hex
+            crop (str): Crop whose model produced the result
+
+        Returns:
+            bool: False if the row was dropped because the queue is full
+        """
+        row = (
+            case_id,
+            timestamp if timestamp is not None else time.time(),
+            image_hash,
+            disease,
+            confidence,
+            model_version,
+            json.dumps(timings, separators=(",", ":")) if timings else None,
+            phash,
+            crop,
+        )
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _run(self):
+        conn = connect(self.db_path)
+        stopping = False
+        while not stopping:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+
+            batch = []
+            while True:
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            if batch:
+                self._write(conn, batch)
+        conn.close()
+
+    def _write(self, conn, batch):
+        placeholders = ", ".join("?" for _ in COLUMNS)
+        try:
+            with conn:
+                conn.executemany(
+                    f"INSERT INTO diagnoses ({', '.join(COLUMNS)}) VALUES ({placeholders})", batch)
+            self.written += len(batch)
+        except sqlite3.Error as e:
+            logger.error(f"Failed to write {len(batch)} history rows: {str(e)}")
+
+    def query(self, disease=None, since=None, until=None, limit=50, cursor=None, crop=None):
+        """
+        Read diagnoses, newest first.
+
+        Args:
+            disease (str): Only return this class name
+            since (float): Only rows at or after this Unix time
+            until (float): Only rows before this Unix time
+            limit (int): Page size
+            cursor (str): ``next_cursor`` from the previous page
+            crop (str): Only return diagnoses of this crop
+
+        Returns:
+            dict: ``items`` (list of dicts) and ``next_cursor`` (None on the last page)
+        """
+        clauses, params = [], []
+        if crop:
+            clauses.append("crop = ?")
+            params.append(crop)
+        if disease:
+            clauses.append("disease = ?")
+            params.append(disease)
+        if since is not None:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("timestamp < ?")
+            params.append(until)
+        if cursor:
+            # Keyset pagination on (timestamp, id), which both indexes can serve in order
+            cursor_time, cursor_id = cursor.split(":")
+            clauses.append("(timestamp, id) < (?, ?)")
+            params.extend([float(cursor_time), int(cursor_id)])
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        conn = connect(self.db_path)
+        try:
+            rows = conn.execute(
+                f"SELECT id, {', '.join(COLUMNS)} FROM diagnoses {where} "
+                f"ORDER BY timestamp DESC, id DESC LIMIT ?",
+                params + [limit + 1]).fetchall()
+        finally:
+            conn.close()
+
+        next_cursor = None
+        if len(rows) > limit:
+            next_cursor = f"{rows[limit - 1][2]!r}:{rows[limit - 1][0]}"
+
+        items = []
+        for row in rows[:limit]:
+            item = dict(zip(("id",) + COLUMNS, row))
+            item["timestamp"] = datetime.fromtimestamp(item["timestamp"]).isoformat(timespec="seconds")
+            item["timings"] = json.loads(item["timings"]) if item["timings"] else None
+            items.append(item)
+
+        return {"items": items, "next_cursor": next_cursor}
+
+    def recent_phashes(self, limit, model_version=None):
+        """
+        Read the newest diagnoses that have a perceptual hash.
+
+        Args:
+            limit (int): Maximum rows
+            model_version (str): Only rows produced by this model version
+
+        Returns:
+            list: (phash hex, case_id, disease, confidence) tuples, oldest first
+        """
+        conn = connect(self.db_path)
+        try:
+            rows = conn.execute(
+                "SELECT phash, case_id, disease, confidence FROM diagnoses "
+                "WHERE phash IS NOT NULL AND (? IS NULL OR model_version = ?) "
+                "ORDER BY id DESC LIMIT ?", (model_version, model_version, limit)).fetchall()
+        finally:
+            conn.close()
+        return rows[::-1]
+
+    def stats(self):
+        """Counters for monitoring the writer"""
+        return {"queued": self._queue.qsize(), "written": self.written, "dropped": self.dropped}
+
+    def close(self, timeout=5.0):
+        """Flush queued rows and stop the writer thread"""
+        if not self._writer.is_alive():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logger.warning("History queue full at shutdown; some rows were not written")
+            return
+        self._writer.join(timeout)
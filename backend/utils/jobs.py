@@ -0,0 +1,357 @@
+"""
+Durable background jobs for long-running diagnoses.
+
+Submitted work is stored in an SQLite table before the client gets its job
+id. A small pool of worker threads in the same process claims queued jobs,
+runs them and stores the result for polling. Several server processes may
+share the table. A claim is a single ``UPDATE ... RETURNING`` inside
+``BEGIN IMMEDIATE``, so exactly one worker gets each job, and it records the
+claiming process as the owner with a lease that the owner renews while the
+job runs. Because the queue is on disk, jobs survive restarts: a running job
+whose lease expired, because its process died, is queued again, up to
+``max_attempts`` tries. Jobs running in live processes are left alone.
+
+Clients may send an idempotency key. A retried submission with the same key
+returns the original job instead of queueing the work twice. Reusing a key
+for a different payload or different parameters is an error.
+"""
+
+import atexit
+import hashlib
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from backend.utils.history import connect
+from backend.utils.logging_setup import reset_request_id, set_request_id
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    idempotency_key TEXT UNIQUE,
+    payload_hash TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    params TEXT,
+    payload BLOB,
+    result TEXT,
+    error TEXT,
+    owner TEXT,
+    lease_expires REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created);
+"""
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class IdempotencyConflict(Exception):
+    """Raised when an idempotency key is reused for a different payload"""
+
+
+class QueueFull(Exception):
+    """Raised when too many jobs are waiting"""
+
+
+class RetryLater(Exception):
+    """Raised by a handler to put its job back in the queue without using up an attempt"""
+
+    def __init__(self, message, delay=1.0):
+        super().__init__(message)
+        self.delay = delay
+
+
+class JobQueue:
+    """SQLite-backed job queue executed by an in-process worker pool"""
+
+    def __init__(self, db_path, handler, workers=2, max_pending=1000, max_attempts=3,
+                 retention_seconds=86400, poll_interval=2.0, lease_seconds=60.0):
+        """
+        Open the queue, requeue jobs whose lease expired and start the workers.
+
+        Args:
+            db_path (str): SQLite database file
+            handler (callable): ``handler(payload_bytes, params_dict)`` returning a
+                JSON-serializable result; exceptions mark the job failed
+            workers (int): Worker threads
+            max_pending (int): Queued jobs accepted before submissions are refused
+            max_attempts (int): Tries per job, counting runs interrupted by a restart
+            retention_seconds (float): Finished jobs older than this are deleted
+            poll_interval (float): Seconds idle workers wait before checking the table
+            lease_seconds (float): How long a claim holds without renewal; the owner
+                renews it every third of this while the job runs
+        """
+        self.db_path = db_path
+        self.handler = handler
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.retention_seconds = retention_seconds
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._wakeup = threading.Condition()
+        self._stop = threading.Event()
+        self._last_purge = 0.0
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        conn = connect(db_path)
+        try:
+            with conn:
+                conn.executescript(SCHEMA)
+                existing = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+                if "owner" not in existing:
+                    # Databases created before claims had leases
+                    conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+                    conn.execute("ALTER TABLE jobs ADD COLUMN lease_expires REAL")
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                self._requeue_expired(conn)
+        finally:
+            conn.close()
+
+        self._workers = [threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+                         for i in range(max(1, workers))]
+        for worker in self._workers:
+            worker.start()
+        self._renewer = threading.Thread(target=self._renew_leases, name="job-lease-renewer", daemon=True)
+        self._renewer.start()
+        atexit.register(self.close)
+
+    def submit(self, payload, params=None, idempotency_key=None):
+        """
+        Store a job.
+
+        Args:
+            payload (bytes): Input data, e.g. the uploaded image
+            params (dict): JSON-serializable options passed to the handler
+            idempotency_key (str): Client-chosen key identifying this submission
+
+        Returns:
+            tuple: (job dict, created) where created is False for a repeated submission
+
+        Raises:
+            IdempotencyConflict: If the key was used for a different payload or params
+            QueueFull: If ``max_pending`` jobs are already queued
+        """
+        params_json = json.dumps(params or {}, sort_keys=True)
+        # Covers the options too: a reused key with the same image but another crop is a different request
+        payload_hash = hashlib.sha256(payload + b"\0" + params_json.encode("utf-8")).hexdigest()
+        conn = connect(self.db_path)
+        try:
+            if idempotency_key:
+                existing = self._get_by_key(conn, idempotency_key)
+                if existing is not None:
+                    return _public(self._check_same_payload(existing, payload_hash)), False
+
+            pending = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+            if pending >= self.max_pending:
+                raise QueueFull(f"{pending} jobs are already queued")
+
+            job_id = uuid.uuid4().hex
+            try:
+                with conn:
+                    conn.execute(
+                        "INSERT INTO jobs (id, idempotency_key, payload_hash, status, created, params, payload) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (job_id, idempotency_key, payload_hash, QUEUED, time.time(),
+                         params_json, sqlite3.Binary(payload)))
+            except sqlite3.IntegrityError:
+                # A concurrent request with the same key won the race
+                existing = self._get_by_key(conn, idempotency_key)
+                return _public(self._check_same_payload(existing, payload_hash)), False
+            job = _public(self._get(conn, job_id))
+        finally:
+            conn.close()
+
+        with self._wakeup:
+            self._wakeup.notify()
+        return job, True
+
+    def _check_same_payload(self, job, payload_hash):
+        if job["_payload_hash"] != payload_hash:
+            raise IdempotencyConflict("Idempotency key was already used for a different request")
+        return job
+
+    def get(self, job_id):
+        """
+        Read a job.
+
+        Returns:
+            dict: Job status, timestamps and, once finished, ``result`` or ``error``; None if unknown
+        """
+        conn = connect(self.db_path)
+        try:
+            return _public(self._get(conn, job_id))
+        finally:
+            conn.close()
+
+    def _get(self, conn, job_id):
+        row = conn.execute(
+            "SELECT id, status, created, started, finished, attempts, result, error, payload_hash "
+            "FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row)
+
+    def _get_by_key(self, conn, key):
+        row = conn.execute(
+            "SELECT id, status, created, started, finished, attempts, result, error, payload_hash "
+            "FROM jobs WHERE idempotency_key = ?", (key,)).fetchone()
+        return self._to_dict(row)
+
+    @staticmethod
+    def _to_dict(row):
+        if row is None:
+            return None
+        job_id, status, created, started, finished, attempts, result, error, payload_hash = row
+        job = {"job_id": job_id, "status": status, "created": created, "started": started,
+               "finished": finished, "attempts": attempts, "_payload_hash": payload_hash}
+        if result is not None:
+            job["result"] = json.loads(result)
+        if error is not None:
+            job["error"] = error
+        return job
+
+    def _requeue_expired(self, conn):
+        """Queue again the running jobs whose owner stopped renewing their lease; call in a transaction"""
+        requeued = conn.execute(
+            "UPDATE jobs SET status = ?, owner = NULL, lease_expires = NULL "
+            "WHERE status = ? AND (lease_expires IS NULL OR lease_expires < ?)",
+            (QUEUED, RUNNING, time.time())).rowcount
+        if requeued:
+            logger.info(f"Requeued {requeued} jobs whose worker stopped")
+
+    def _claim(self, conn):
+        """Mark the oldest queued job running and return (id, payload, params), or None"""
+        now = time.time()
+        with conn:
+            # Takes the write lock up front, so concurrent claims from other
+            # processes wait for it instead of failing with SQLITE_BUSY
+            conn.execute("BEGIN IMMEDIATE")
+            self._requeue_expired(conn)
+            row = conn.execute(
+                "UPDATE jobs SET status = ?, started = ?, attempts = attempts + 1, owner = ?, lease_expires = ? "
+                "WHERE id = (SELECT id FROM jobs WHERE status = ? ORDER BY created LIMIT 1) "
+                "RETURNING id, payload, params, attempts",
+                (RUNNING, now, self.owner, now + self.lease_seconds, QUEUED)).fetchone()
+            if row is None:
+                return None
+            job_id, payload, params, attempts = row
+            if attempts > self.max_attempts:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, finished = ?, payload = NULL, error = ?, owner = NULL, "
+                    "lease_expires = NULL, attempts = attempts - 1 WHERE id = ?",
+                    (FAILED, now, f"Gave up after {attempts - 1} attempts", job_id))
+                return False
+        return job_id, bytes(payload), json.loads(params or "{}")
+
+    def _finish(self, conn, job_id, result=None, error=None):
+        with conn:
+            updated = conn.execute(
+                "UPDATE jobs SET status = ?, finished = ?, payload = NULL, result = ?, error = ?, "
+                "owner = NULL, lease_expires = NULL WHERE id = ? AND owner = ?",
+                (FAILED if error is not None else DONE, time.time(),
+                 json.dumps(result) if error is None else None, error, job_id, self.owner)).rowcount
+        if not updated:
+            logger.warning(f"Job {job_id} lost its lease while running; its result was discarded")
+
+    def _requeue(self, conn, job_id):
+        with conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts - 1, owner = NULL, lease_expires = NULL "
+                "WHERE id = ? AND owner = ?", (QUEUED, job_id, self.owner))
+
+    def _renew_leases(self):
+        conn = connect(self.db_path)
+        try:
+            while not self._stop.wait(self.lease_seconds / 3):
+                try:
+                    with conn:
+                        conn.execute("UPDATE jobs SET lease_expires = ? WHERE status = ? AND owner = ?",
+                                     (time.time() + self.lease_seconds, RUNNING, self.owner))
+                except sqlite3.Error as e:
+                    logger.error(f"Could not renew job leases: {str(e)}")
+        finally:
+            conn.close()
+
+    def _purge(self, conn):
+        now = time.time()
+        if now - self._last_purge < 3600:
+            return
+        self._last_purge = now
+        with conn:
+            deleted = conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND finished < ?",
+                (DONE, FAILED, now - self.retention_seconds)).rowcount
+        if deleted:
+            logger.info(f"Deleted {deleted} finished jobs")
+
+    def _run(self):
+        conn = connect(self.db_path)
+        try:
+            while not self._stop.is_set():
+                try:
+                    self._purge(conn)
+                    claimed = self._claim(conn)
+                except sqlite3.Error as e:
+                    logger.error(f"Job queue error: {str(e)}")
+                    self._stop.wait(self.poll_interval)
+                    continue
+
+                if claimed is False:
+                    continue
+                if claimed is None:
+                    with self._wakeup:
+                        self._wakeup.wait(self.poll_interval)
+                    continue
+
+                job_id, payload, params = claimed
+                # Log records written while the job runs carry its id
+                token = set_request_id(job_id)
+                try:
+                    result = self.handler(payload, params)
+                except RetryLater as e:
+                    self._requeue(conn, job_id)
+                    self._stop.wait(e.delay)
+                    continue
+                except Exception as e:
+                    logger.error(f"Job {job_id} failed: {str(e)}")
+                    self._finish(conn, job_id, error=str(e))
+                    continue
+                finally:
+                    reset_request_id(token)
+                self._finish(conn, job_id, result=result)
+        finally:
+            conn.close()
+
+    def stats(self):
+        """Job counts by status"""
+        conn = connect(self.db_path)
+        try:
+            return dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        finally:
+            conn.close()
+
+    def close(self, timeout=5.0):
+        """Stop the workers after their current job; unfinished jobs stay queued or leased until expiry"""
+        self._stop.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        for worker in self._workers:
+            worker.join(timeout)
+        self._renewer.join(timeout)
+
+
+def _public(job):
+    """Drop internal fields before a job is returned to callers"""
+    if job is not None:
+        job.pop("_payload_hash", None)
+    return job
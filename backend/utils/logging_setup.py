@@ -0,0 +1,196 @@
+"""
+Non-blocking structured logging for the API.
+
+Request threads never write to stdout themselves. Their log records go into
+a bounded in-memory queue, and a single background thread formats them
+(tracebacks included) and writes them out. When the queue is full, records
+are dropped and counted rather than making the request wait.
+
+Every record is one JSON object per line with the time, level, logger,
+message, the id of the request it belongs to and any ``extra`` fields, e.g.
+
+    logger.info("Diagnosis complete", extra={"disease": disease, "timings": timings})
+
+DEBUG records are sampled per request: a fraction ``debug_sample_rate`` of
+requests log all of their debug lines and the others log none, so a sampled
+request can be followed from start to end.
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+import zlib
+from datetime import datetime, timezone
+
+_request_id = contextvars.ContextVar("request_id", default=None)
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+_listener = None
+_queue_handler = None
+_lock = threading.Lock()
+
+
+def set_request_id(request_id):
+    """
+    Tag the log records of the current request, thread or task.
+
+    Returns:
+        contextvars.Token: Pass to ``reset_request_id`` when the request ends
+    """
+    return _request_id.set(request_id)
+
+
+def reset_request_id(token):
+    _request_id.reset(token)
+
+
+def get_request_id():
+    return _request_id.get()
+
+
+class JsonFormatter(logging.Formatter):
+    """Format a record as a single-line JSON object"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    """
+    Copy the current request id onto the record, and sample DEBUG records.
+
+    Runs in the calling thread, before the record is queued,
+    because the request id lives in that thread's context.
+    """
+
+    def __init__(self, debug_sample_rate=0.0):
+        super().__init__()
+        self.debug_sample_rate = debug_sample_rate
+
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        if record.levelno > logging.DEBUG:
+            return True
+        if self.debug_sample_rate >= 1:
+            return True
+        if self.debug_sample_rate <= 0:
+            return False
+        if record.request_id is None:
+            return random.random() < self.debug_sample_rate
+        # Same decision for every record of a request
+        return zlib.crc32(record.request_id.encode("utf-8")) / 2 ** 32 < self.debug_sample_rate
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that never blocks and leaves all formatting to the listener.
+
+    The standard ``QueueHandler`` formats the message and traceback in the
+    calling thread; here the record is only copied and the work happens on
+    the listener thread.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(vars(record))
+        # Resolve %-style arguments now; they may be mutated after the call returns
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _DrainingListener(logging.handlers.QueueListener):
+    """Queue listener whose stop waits for room in a full queue instead of failing"""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+def setup_logging(level="INFO", json_format=True, debug_sample_rate=1.0, queue_size=10000, stream=None):
+    """
+    Route all logging through a bounded queue to a background writer thread.
+
+    Replaces any handlers on the root logger. Calling it again reconfigures
+    logging with the new settings.
+
+    Args:
+        level (str): Minimum level, e.g. "INFO"; use "DEBUG" together with a sample rate
+        json_format (bool): One JSON object per line; False gives plain text
+        debug_sample_rate (float): Fraction of requests whose DEBUG records are kept
+        queue_size (int): Records buffered before new ones are dropped
+        stream: Output stream (default: stdout)
+    """
+    global _listener, _queue_handler
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(JsonFormatter() if json_format else logging.Formatter(
+            "%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"))
+
+        log_queue = queue.Queue(maxsize=queue_size)
+        _queue_handler = NonBlockingQueueHandler(log_queue)
+        _queue_handler.addFilter(RequestContextFilter(debug_sample_rate))
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(_queue_handler)
+        root.setLevel(getattr(logging, str(level).upper(), logging.INFO))
+
+        _listener = _DrainingListener(log_queue, output, respect_handler_level=True)
+        _listener.start()
+
+
+def shutdown_logging():
+    """Write out everything still queued and stop the writer thread"""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def logging_stats():
+    """Queue depth and dropped-record count for /stats"""
+    if _queue_handler is None:
+        return {"enabled": False}
+    return {"enabled": True, "queued": _queue_handler.queue.qsize(), "dropped": _queue_handler.dropped}
+
+
+atexit.register(shutdown_logging)
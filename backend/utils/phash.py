@@ -0,0 +1,212 @@
+"""
+Perceptual hashing and near-duplicate lookup for uploaded images.
+
+Field workers often upload the same leaf several times. The copies may be
+re-cropped, re-compressed, resized or slightly rotated, so their bytes
+differ. A difference hash (dHash) of a tiny grayscale thumbnail barely
+changes under those edits. Two uploads whose hashes are within a few bits
+(Hamming distance) of each other are treated as the same photo, and the
+earlier diagnosis is reused.
+
+Flat or low-contrast images (an overexposed shot, a lens cap, a blank
+page) have almost no brightness differences to hash: their bits are
+decided by noise, or are all zero, so unrelated photos of that kind would
+match each other. dhash returns None for them and they are never deduplicated.
+
+Hashes are kept in a multi-index hash table, which finds every stored hash
+within a given Hamming radius without comparing against all of them.
+"""
+
+import io
+import threading
+from collections import deque
+
+from PIL import Image, ImageOps
+
+HASH_SIZE = 8
+
+# A neighbour comparison only counts as image detail if the gray levels
+# differ by at least this much...
+MIN_DIFFERENCE = 2
+# ...and an image needs this share of such comparisons to be hashed
+MIN_DETAIL_FRACTION = 0.125
+
+
+def hamming(a, b):
+    """Number of differing bits between two integer hashes"""
+    return bin(a ^ b).count("1")
+
+
+def dhash(image_bytes, hash_size=HASH_SIZE):
+    """
+    Compute the difference hash of an encoded image.
+
+    JPEGs are decoded at reduced scale (``Image.draft``), so hashing a
+    12-megapixel photo costs a fraction of a full decode.
+
+    Args:
+        image_bytes (bytes): Encoded image
+        hash_size (int): Hash is ``hash_size * hash_size`` bits
+
+    Returns:
+        int: The hash, or None if the image has too little detail for a
+            hash that tells it apart from other flat images
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    image.draft("L", (hash_size * 8, hash_size * 8))
+    image = ImageOps.exif_transpose(image).convert("L")
+    # One extra column so every row yields hash_size left/right comparisons
+    pixels = list(image.resize((hash_size + 1, hash_size), Image.BILINEAR).getdata())
+
+    value = 0
+    detail = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            difference = pixels[offset + col] - pixels[offset + col + 1]
+            value = (value << 1) | (difference > 0)
+            detail += abs(difference) >= MIN_DIFFERENCE
+    if value == 0 or detail < MIN_DETAIL_FRACTION * hash_size * hash_size:
+        return None
+    return value
+
+
+def format_hash(value, hash_size=HASH_SIZE):
+    """Fixed-width hex string, used for storage"""
+    return f"{value:0{hash_size * hash_size // 4}x}"
+
+
+class MultiIndexHash:
+    """
+    Hamming-radius search over integer hashes by multi-index hashing.
+
+    The hash bits are split into ``radius + 1`` chunks. Two hashes that
+    differ in at most ``radius`` bits must agree exactly on at least one
+    chunk (pigeonhole). A lookup therefore only compares the query against
+    entries that share one of its chunk values, found through one dict per
+    chunk, instead of scanning everything.
+    """
+
+    def __init__(self, radius, bits=HASH_SIZE * HASH_SIZE):
+        """
+        Args:
+            radius (int): Largest Hamming distance searched for
+            bits (int): Hash length
+        """
+        self.radius = radius
+        n_chunks = min(radius + 1, bits)
+        bounds = [round(i * bits / n_chunks) for i in range(n_chunks + 1)]
+        # (shift, mask) per chunk
+        self._chunks = [(lo, (1 << (hi - lo)) - 1) for lo, hi in zip(bounds, bounds[1:])]
+        self._tables = [{} for _ in self._chunks]
+        self._values = {}
+
+    def __len__(self):
+        return len(self._values)
+
+    def __contains__(self, key):
+        return key in self._values
+
+    def add(self, key, value):
+        """Store ``value`` under ``key``, replacing any value stored for the same hash"""
+        if key not in self._values:
+            for table, (shift, mask) in zip(self._tables, self._chunks):
+                table.setdefault((key >> shift) & mask, set()).add(key)
+        self._values[key] = value
+
+    def remove(self, key):
+        if key not in self._values:
+            return
+        del self._values[key]
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            chunk = (key >> shift) & mask
+            bucket = table[chunk]
+            bucket.discard(key)
+            if not bucket:
+                del table[chunk]
+
+    def search(self, key, radius=None):
+        """
+        Find stored entries within ``radius`` bits of ``key``.
+
+        Args:
+            key (int): Query hash
+            radius (int): At most the radius the index was built for
+
+        Returns:
+            list: (distance, hash, value) tuples, nearest first
+        """
+        radius = self.radius if radius is None else min(radius, self.radius)
+        candidates = set()
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            bucket = table.get((key >> shift) & mask)
+            if bucket:
+                candidates.update(bucket)
+
+        matches = []
+        for candidate in candidates:
+            distance = hamming(key, candidate)
+            if distance <= radius:
+                matches.append((distance, candidate, self._values[candidate]))
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+
+class NearDuplicateCache:
+    """Recent diagnoses keyed by perceptual hash, with hit-rate counters"""
+
+    def __init__(self, max_distance=6, capacity=100000):
+        """
+        Args:
+            max_distance (int): Largest Hamming distance treated as the same photo
+            capacity (int): Entries kept; the oldest are dropped first
+        """
+        self.max_distance = max_distance
+        self.capacity = capacity
+        self.lookups = 0
+        self.hits = 0
+        self._lock = threading.Lock()
+        self._index = MultiIndexHash(max_distance)
+        self._order = deque()
+
+    def lookup(self, key):
+        """
+        Return the stored result of the nearest earlier upload within ``max_distance``.
+
+        Returns:
+            tuple: (result dict, distance), or (None, None) on a miss
+        """
+        with self._lock:
+            self.lookups += 1
+            matches = self._index.search(key)
+            if not matches:
+                return None, None
+            self.hits += 1
+            distance, _, result = matches[0]
+            return result, distance
+
+    def add(self, key, result):
+        """
+        Remember the diagnosis for a hash.
+
+        Args:
+            key (int): Perceptual hash
+            result (dict): Stored diagnosis, e.g. case_id, disease and confidence
+        """
+        with self._lock:
+            if key not in self._index:
+                self._order.append(key)
+            self._index.add(key, result)
+            while len(self._order) > self.capacity:
+                self._index.remove(self._order.popleft())
+
+    def stats(self):
+        """Counters for /stats"""
+        with self._lock:
+            return {
+                "entries": len(self._index),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+                "max_distance": self.max_distance
+            }
@@ -1,4 +1,3 @@
-from fpdf import FPDF
 from datetime import datetime
 import base64
 import os
@@ -7,9 +6,12 @@ import logging
 from typing import Optional, Tuple
 from io import BytesIO
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Part of the key of stored reports: bump it whenever the layout or wording
+# below changes, so reports rendered with the old template are not served
+TEMPLATE_VERSION = "2"
+
 def validate_inputs(image_path: str, disease: str, confidence: float, recommendation: str) -> Tuple[bool, str]:
     """
     Validate input parameters for report generation
@@ -65,7 +67,8 @@ def process_image(image_path: str, max_size: int = 1000) -> Optional[Image.Image
         logger.error(f"Error processing image: {str(e)}")
         return None
 
-def generate_report(image_path: str, disease: str, confidence: float, recommendation: str) -> str:
+def generate_report(image_path: str, disease: str, confidence: float, recommendation: str,
+                    overlay_path: Optional[str] = None, report_date: Optional[str] = None) -> str:
     """
     Generate a PDF report based on diagnosis results using fpdf2
     
@@ -74,6 +77,9 @@ def generate_report(image_path: str, disease: str, confidence: float, recommenda
         disease: Detected disease name
         confidence: Confidence score (0-100)
         recommendation: Treatment recommendations
+        overlay_path: Optional Grad-CAM overlay image, added on a second page
+        report_date: Diagnosis date printed instead of the generation time, for
+            reports that are stored and served again later
         
     Returns:
         Base64 encoded PDF data
@@ -94,12 +100,15 @@ def generate_report(image_path: str, disease: str, confidence: float, recommenda
         temp_img_path = os.path.join(os.path.dirname(image_path), f"temp_{unique_id}.jpg")
         img.save(temp_img_path, "JPEG", quality=95)
         
-        print(f"Creating PDF report...")
-        print(f"Image path: {image_path}")
-        print(f"Temporary image path: {temp_img_path}")
-        print(f"Disease: {disease}")
-        print(f"Recommendation length: {len(recommendation)} chars")
+        logger.debug("Creating PDF report", extra={
+            "image_path": image_path,
+            "temp_image_path": temp_img_path,
+            "disease": disease,
+            "recommendation_chars": len(recommendation)
+        })
         
+        # fpdf is only needed here and is slow to import
+        from fpdf import FPDF
         pdf = FPDF()
         pdf.add_page()
         
@@ -108,7 +117,10 @@ def generate_report(image_path: str, disease: str, confidence: float, recommenda
         pdf.cell(0, 10, "Crop Disease Diagnosis Report", ln=True, align='C')
         
         pdf.set_font('Arial', '', 12)
-        pdf.cell(0, 10, f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')}", ln=True, align='C')
+        if report_date:
+            pdf.cell(0, 10, f"Diagnosis date: {report_date}", ln=True, align='C')
+        else:
+            pdf.cell(0, 10, f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')}", ln=True, align='C')
         pdf.ln(10)
         
         try:
@@ -152,6 +164,24 @@ def generate_report(image_path: str, disease: str, confidence: float, recommenda
                 pdf.multi_cell(0, 10, paragraph.strip())
                 pdf.ln(5)
         
+        if overlay_path:
+            try:
+                overlay = process_image(overlay_path)
+                if overlay is None:
+                    raise ValueError("unreadable overlay image")
+                pdf.add_page()
+                pdf.set_font('Arial', 'B', 14)
+                pdf.cell(0, 10, "Regions that influenced the diagnosis (Grad-CAM):", ln=True)
+                pdf.set_font('Arial', '', 11)
+                pdf.multi_cell(0, 7, "Warmer colours mark the leaf areas the model relied on most "
+                                     f"when predicting {disease}.")
+                pdf.ln(5)
+                overlay_width = 150  # mm
+                overlay_height = overlay_width * overlay.size[1] / float(overlay.size[0])
+                pdf.image(overlay_path, x=30, y=pdf.get_y(), w=overlay_width, h=overlay_height)
+            except Exception as e:
+                logger.error(f"Error adding Grad-CAM overlay to report: {str(e)}")
+        
         pdf_buffer = BytesIO()
         pdf.output(pdf_buffer)
         pdf_buffer.seek(0)
@@ -160,9 +190,9 @@ def generate_report(image_path: str, disease: str, confidence: float, recommenda
         encoded_pdf = base64.b64encode(pdf_data).decode('utf-8')
         
         if len(encoded_pdf) < 100:
-            print(f"WARNING: Generated PDF is suspiciously small ({len(encoded_pdf)} bytes)")
+            logger.warning(f"Generated PDF is suspiciously small ({len(encoded_pdf)} bytes)")
         else:
-            print(f"PDF generated successfully ({len(encoded_pdf)} bytes)")
+            logger.debug(f"PDF generated successfully ({len(encoded_pdf)} bytes)")
             
         return encoded_pdf
         
@@ -174,7 +204,7 @@ def generate_report(image_path: str, disease: str, confidence: float, recommenda
         if temp_img_path and os.path.exists(temp_img_path):
             try:
                 os.unlink(temp_img_path)
-                print(f"Deleted temporary image file: {temp_img_path}")
+                logger.debug(f"Deleted temporary image file: {temp_img_path}")
             except Exception as e:
                 logger.warning(f"Error deleting temporary image: {str(e)}")
         
@@ -0,0 +1,244 @@
+"""
+Frame sampling and aggregation for walk-through videos.
+
+A video (decoded with the optional PyAV package) or a sequence of still
+frames is read one frame at a time. A sampler picks the frames worth
+classifying:
+
+- "interval": one frame every ``interval`` seconds
+- "scene": a frame whenever the picture differs enough from the last sampled
+  one (mean absolute difference of 32x32 colour thumbnails above
+  ``scene_threshold``; colour, because diseased patches often differ from
+  healthy leaves in hue more than in brightness), and at least one every
+  ``max_gap`` seconds
+
+Sampled frames are classified in batches, and only running sums per segment
+are kept, so memory does not grow with the length of the video. Segments are
+fixed windows of ``segment_seconds`` in interval mode and the stretches
+between scene changes in scene mode.
+"""
+
+import io
+
+import numpy as np
+from PIL import Image, ImageOps
+
+SAMPLING_MODES = ("interval", "scene")
+
+_THUMBNAIL_SIZE = (32, 32)
+
+
+class VideoUnavailable(RuntimeError):
+    """Video decoding needs PyAV, which is not installed"""
+
+
+class Frame:
+    """A decoded frame: presentation time, a small thumbnail and the full RGB image on demand"""
+
+    def __init__(self, time, thumbnail_fn, image_fn):
+        self.time = time
+        self._thumbnail_fn = thumbnail_fn
+        self._image_fn = image_fn
+
+    def thumbnail(self):
+        """32x32x3 RGB thumbnail as float32 in [0, 1]"""
+        return self._thumbnail_fn()
+
+    def image(self):
+        return self._image_fn()
+
+
+def video_frames(fileobj, max_seconds=None):
+    """
+    Decode the first video stream of a file incrementally.
+
+    Frames are converted to RGB only when the sampler asks for them.
+
+    Args:
+        fileobj: Seekable binary file object holding the video
+        max_seconds (float): Stop after this much video
+
+    Yields:
+        Frame: Decoded frames in presentation order
+
+    Raises:
+        VideoUnavailable: If PyAV is not installed
+        ValueError: If the file holds no decodable video
+    """
+    try:
+        import av
+    except ImportError:
+        raise VideoUnavailable("Video uploads need the optional PyAV package (pip install av); "
+                               "send the frames as images instead")
+    try:
+        container = av.open(fileobj)
+    except Exception as e:
+        raise ValueError(f"Unreadable video: {str(e)}")
+    try:
+        if not container.streams.video:
+            raise ValueError("The file holds no video stream")
+        stream = container.streams.video[0]
+        stream.thread_type = "AUTO"
+        for index, frame in enumerate(container.decode(stream)):
+            if frame.time is not None:
+                time = float(frame.time)
+            else:
+                time = index / float(stream.average_rate or 25)
+            if max_seconds is not None and time > max_seconds:
+                break
+            yield Frame(
+                time,
+                # swscale downsizes in C without building a full-size RGB image
+                lambda frame=frame: frame.reformat(width=_THUMBNAIL_SIZE[0], height=_THUMBNAIL_SIZE[1],
+                                                   format="rgb24").to_ndarray().astype(np.float32) / 255,
+                lambda frame=frame: frame.to_image()
+            )
+    finally:
+        container.close()
+
+
+def image_frames(files, fps=1.0):
+    """
+    Treat uploaded still images as consecutive video frames.
+
+    Args:
+        files (list): Binary file objects, one image each, in recording order
+        fps (float): Frame rate the images were captured at, for timestamps
+
+    Yields:
+        Frame: One frame per image
+
+    Raises:
+        ValueError: If an image cannot be decoded
+    """
+    for index, fileobj in enumerate(files):
+        data = fileobj.read()
+        try:
+            Image.open(io.BytesIO(data)).verify()
+        except Exception as e:
+            raise ValueError(f"Frame {index} is not a readable image: {str(e)}")
+        yield Frame(index / fps, lambda data=data: _image_thumbnail(data),
+                    lambda data=data: ImageOps.exif_transpose(Image.open(io.BytesIO(data))).convert("RGB"))
+
+
+def _image_thumbnail(data):
+    image = Image.open(io.BytesIO(data))
+    # JPEGs decode at reduced scale, which is much faster than a full decode
+    image.draft("RGB", (_THUMBNAIL_SIZE[0] * 4, _THUMBNAIL_SIZE[1] * 4))
+    return np.asarray(image.convert("RGB").resize(_THUMBNAIL_SIZE, Image.BILINEAR), dtype=np.float32) / 255
+
+
+class FrameSampler:
+    """Decide which frames are classified, and where segments start"""
+
+    def __init__(self, mode="interval", interval=1.0, scene_threshold=0.12, max_gap=5.0, segment_seconds=5.0):
+        """
+        Args:
+            mode (str): "interval" or "scene"
+            interval (float): Seconds between sampled frames in interval mode
+            scene_threshold (float): Mean absolute thumbnail difference in [0, 1]
+                that counts as a scene change
+            max_gap (float): Longest stretch without a sampled frame in scene mode
+            segment_seconds (float): Segment length in interval mode
+        """
+        if mode not in SAMPLING_MODES:
+            raise ValueError(f"sampling must be one of: {', '.join(SAMPLING_MODES)}")
+        self.mode = mode
+        self.interval = interval
+        self.scene_threshold = scene_threshold
+        self.max_gap = max_gap
+        self.segment_seconds = segment_seconds
+        self._last_time = None
+        self._last_thumbnail = None
+        self._segment = -1
+
+    def sample(self, frame):
+        """
+        Returns:
+            tuple: (keep the frame, index of the segment it belongs to)
+        """
+        if self._last_time is None:
+            self._keep(frame, frame.thumbnail() if self.mode == "scene" else None)
+            self._segment = 0
+            return True, self._segment
+
+        if self.mode == "interval":
+            segment = int(frame.time // self.segment_seconds)
+            if frame.time - self._last_time >= self.interval:
+                self._keep(frame)
+                return True, segment
+            return False, segment
+
+        thumbnail = frame.thumbnail()
+        if float(np.abs(thumbnail - self._last_thumbnail).mean()) >= self.scene_threshold:
+            self._segment += 1
+            self._keep(frame, thumbnail)
+            return True, self._segment
+        if frame.time - self._last_time >= self.max_gap:
+            self._keep(frame, thumbnail)
+            return True, self._segment
+        return False, self._segment
+
+    def _keep(self, frame, thumbnail=None):
+        self._last_time = frame.time
+        if thumbnail is not None:
+            self._last_thumbnail = thumbnail
+
+
+class SegmentAggregator:
+    """Running per-segment sums of class probabilities; per-frame results are not kept"""
+
+    def __init__(self, class_names):
+        """
+        Args:
+            class_names (dict): Class index to name, as on the model
+        """
+        self.class_names = class_names
+        self._segments = {}
+        self._total = np.zeros(len(class_names), dtype=np.float64)
+        self.frames = 0
+
+    def add(self, segment, time, probabilities):
+        """Add one classified frame"""
+        entry = self._segments.get(segment)
+        if entry is None:
+            entry = self._segments[segment] = {
+                "start": time, "end": time, "frames": 0,
+                "sum": np.zeros(len(self.class_names), dtype=np.float64),
+                "votes": np.zeros(len(self.class_names), dtype=np.int64),
+            }
+        entry["start"] = min(entry["start"], time)
+        entry["end"] = max(entry["end"], time)
+        entry["frames"] += 1
+        entry["sum"] += probabilities
+        entry["votes"][int(np.argmax(probabilities))] += 1
+        self._total += probabilities
+        self.frames += 1
+
+    def _verdict(self, probability_sum, frames):
+        mean = probability_sum / max(1, frames)
+        index = int(np.argmax(mean))
+        return self.class_names[index], float(mean[index] * 100)
+
+    def segments(self):
+        """Per-segment verdicts in time order: mean probability over the segment's frames"""
+        results = []
+        for segment in sorted(self._segments):
+            entry = self._segments[segment]
+            disease, confidence = self._verdict(entry["sum"], entry["frames"])
+            results.append({
+                "start": round(entry["start"], 2),
+                "end": round(entry["end"], 2),
+                "frames": entry["frames"],
+                "disease": disease,
+                "confidence": confidence,
+                "votes": {self.class_names[i]: int(n) for i, n in enumerate(entry["votes"]) if n},
+            })
+        return results
+
+    def overall(self):
+        """Verdict over all classified frames, or None if there were none"""
+        if not self.frames:
+            return None
+        disease, confidence = self._verdict(self._total, self.frames)
+        return {"disease": disease, "confidence": confidence}
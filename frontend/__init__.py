@@ -1,14 +1,37 @@
 """
 Frontend package for the Crop Disease Detection application.
+
+The Dash application is assembled on first access to ``frontend.app``, so the
+API client and command-line tools in this package can be imported without
+loading Dash.
 """
 
-from frontend.app import app
-from frontend.layouts import layout
-from frontend.callbacks import register_callbacks
+_dash_app = None
+
+
+def get_app():
+    """Return the Dash application with its layout and callbacks, building it on first use"""
+    global _dash_app
+    if _dash_app is None:
+        from frontend.app import app
+        from frontend.layouts import layout
+        from frontend.callbacks import register_callbacks
+
+        app.layout = layout
+        register_callbacks(app)
+        _dash_app = app
+        # Importing the frontend.app submodule bound its module object to this
+        # name; restore the application the package has always exported
+        globals()["app"] = app
+    return _dash_app
+
+
+def __getattr__(name):
+    if name == "app":
+        return get_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-app.layout = layout
-register_callbacks(app)
 
 def run_server(debug=True, port=8050):
     """Run the Dash server."""
-    app.run_server(debug=debug, port=port) 
\ No newline at end of file
+    get_app().run_server(debug=debug, port=port)
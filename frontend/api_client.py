@@ -0,0 +1,340 @@
+"""
+Client for the Crop Disease Detection backend API.
+
+ApiClient keeps a pool of keep-alive connections and retries failed calls
+with exponential backoff. Each call gets a deadline that bounds the total
+time spent on all its attempts. A POST is only retried when the server
+cannot have run it (the connection failed, or it answered 429/503), unless
+it carries an Idempotency-Key the server deduplicates on. AsyncApiClient
+exposes the same calls to asyncio code and uploads many images concurrently
+with bounded parallelism.
+
+Both the Dash callbacks and standalone scripts can use these:
+
+    from frontend.api_client import get_client
+    result = get_client().predict(image_bytes)
+"""
+
+import asyncio
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from frontend.config import BACKEND_API_URL
+
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+
+# Responses that turn a request away before it runs, so resending is safe for any method
+NOT_RUN_STATUS_CODES = (429, 503)
+
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+
+class ApiError(Exception):
+    """Raised when the API cannot be reached or returns an error response"""
+
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class ApiClient:
+    """Pooled, retrying HTTP client for the backend API"""
+
+    def __init__(self, base_url=BACKEND_API_URL, deadline=60.0, connect_timeout=3.05,
+                 retries=3, backoff=0.5, pool_size=16):
+        """
+        Args:
+            base_url (str): Backend root URL, e.g. "http://localhost:5000"
+            deadline (float): Default total seconds allowed per call, including retries
+            connect_timeout (float): Seconds allowed to establish a connection
+            retries (int): Extra attempts after a failed one
+            backoff (float): Base delay in seconds, doubled after every attempt
+            pool_size (int): Keep-alive connections kept per host
+        """
+        self.base_url = base_url.rstrip("/")
+        self.deadline = deadline
+        self.connect_timeout = connect_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+
+        self.session = requests.Session()
+        # Retries are handled here so they can respect the per-call deadline
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method, path, deadline=None, **kwargs):
+        """
+        Send a request, retrying connection errors, timeouts and 429/5xx responses.
+
+        A non-idempotent request without an Idempotency-Key header may
+        already have run when its response timed out or a gateway answered
+        502/504, so it is only retried after connection failures and 429/503.
+
+        Args:
+            method (str): HTTP method
+            path (str): Path below the base URL, or an absolute URL
+            deadline (float): Total seconds allowed, defaults to the client deadline
+            **kwargs: Passed to requests (files, data, params, headers, ...);
+                uploads must be bytes so they can be resent on retry
+
+        Returns:
+            requests.Response: The successful response
+
+        Raises:
+            ApiError: When the call fails permanently or the deadline runs out
+        """
+        url = path if path.startswith(("http://", "https://")) else f"{self.base_url}{path}"
+        give_up_at = time.monotonic() + (deadline or self.deadline)
+        headers = kwargs.get("headers") or {}
+        safe_to_resend = (method.upper() in IDEMPOTENT_METHODS
+                          or any(name.lower() == "idempotency-key" for name in headers))
+
+        attempt = 0
+        while True:
+            remaining = give_up_at - time.monotonic()
+            if remaining <= 0:
+                raise ApiError(f"API request to {url} exceeded its deadline")
+
+            retry_after = None
+            try:
+                response = self.session.request(
+                    method, url,
+                    timeout=(min(self.connect_timeout, remaining), remaining),
+                    **kwargs)
+                if response.status_code < 400:
+                    return response
+                error = ApiError(f"API request failed with status code {response.status_code}",
+                                 status_code=response.status_code,
+                                 retry_after=_parse_retry_after(response))
+                retryable = RETRY_STATUS_CODES if safe_to_resend else NOT_RUN_STATUS_CODES
+                if response.status_code not in retryable:
+                    raise error
+                retry_after = error.retry_after
+            except requests.exceptions.RequestException as e:
+                error = ApiError(f"Error connecting to the API: {str(e)}")
+                # A read timeout or dropped response may come after the server ran the request
+                if not safe_to_resend and not isinstance(e, requests.exceptions.ConnectionError):
+                    raise error
+
+            attempt += 1
+            if attempt > self.retries:
+                raise error
+
+            delay = self.backoff * (2 ** (attempt - 1)) * (0.5 + random.random())
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+            if time.monotonic() + delay >= give_up_at:
+                raise error
+            time.sleep(delay)
+
+    def predict(self, image_data, filename="image.jpg", deadline=None, url=None, priority=None, **fields):
+        """
+        Send an image for diagnosis.
+
+        Args:
+            image_data (bytes): Encoded image
+            filename (str): File name reported to the server
+            deadline (float): Total seconds allowed, including retries
+            url (str): Full endpoint URL overriding ``base_url + "/predict"``
+            priority (str): Admission lane, "interactive" (server default) or "bulk"
+            **fields: Extra form fields, e.g. region
+
+        Returns:
+            dict: Parsed JSON response
+        """
+        response = self.request(
+            "POST", url or "/predict", deadline=deadline,
+            files={"image": (filename, image_data)},
+            data=fields or None,
+            headers={"X-Priority": priority} if priority else None)
+        return response.json()
+
+    def predict_video(self, video_data=None, frames=None, filename="video.mp4", deadline=None, priority=None,
+                      **fields):
+        """
+        Diagnose a walk-through video, or a sequence of frames in recording order.
+
+        Args:
+            video_data (bytes): Encoded video
+            frames (list): Encoded images (bytes), sent instead of a video
+            filename (str): Video file name reported to the server
+            deadline (float): Total seconds allowed, including retries
+            priority (str): Admission lane, "interactive" (server default) or "bulk"
+            **fields: Extra form fields, e.g. crop, sampling, interval or fps
+
+        Returns:
+            dict: Overall verdict and per-segment verdicts
+        """
+        if video_data is not None:
+            files = {"video": (filename, video_data)}
+        else:
+            files = [("frames", (f"frame{index:05d}.jpg", data)) for index, data in enumerate(frames or [])]
+        response = self.request(
+            "POST", "/predict/video", deadline=deadline,
+            files=files,
+            data=fields or None,
+            headers={"X-Priority": priority} if priority else None)
+        return response.json()
+
+    def predict_many(self, images, max_concurrency=4, deadline=None, **fields):
+        """
+        Diagnose several images concurrently.
+
+        Args:
+            images (list): Encoded images (bytes)
+            max_concurrency (int): Requests in flight at once
+            deadline (float): Total seconds allowed per image
+            **fields: Extra form fields sent with every image, or ``priority``
+
+        Yields:
+            tuple: (index, result dict or None, ApiError or None) as each request finishes
+        """
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+            futures = {
+                executor.submit(self.predict, data, deadline=deadline, **fields): index
+                for index, data in enumerate(images)
+            }
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result(), None
+                except ApiError as e:
+                    yield futures[future], None, e
+
+    def submit_job(self, image_data, filename="image.jpg", idempotency_key=None, deadline=None,
+                   priority=None, **fields):
+        """
+        Queue an image for asynchronous diagnosis.
+
+        Every retry of the upload carries the same idempotency key, so a
+        retry after a lost response never queues the work twice.
+
+        Args:
+            image_data (bytes): Encoded image
+            idempotency_key (str): Key for this submission, generated when omitted
+            priority (str): Admission lane, "interactive" or "bulk"
+            **fields: Extra form fields, e.g. region
+
+        Returns:
+            dict: Job with ``job_id`` and ``status``
+        """
+        headers = {"Idempotency-Key": idempotency_key or uuid.uuid4().hex}
+        if priority:
+            headers["X-Priority"] = priority
+        response = self.request(
+            "POST", "/jobs", deadline=deadline,
+            files={"image": (filename, image_data)},
+            data=fields or None,
+            headers=headers)
+        return response.json()
+
+    def get_job(self, job_id, deadline=None):
+        """Return the current status of a job, with ``result`` once it is done"""
+        return self.request("GET", f"/jobs/{job_id}", deadline=deadline).json()
+
+    def wait_for_job(self, job_id, timeout=300.0, poll_interval=1.0):
+        """
+        Poll a job until it finishes.
+
+        Returns:
+            dict: The /predict result of the job
+
+        Raises:
+            ApiError: If the job failed or did not finish within ``timeout``
+        """
+        give_up_at = time.monotonic() + timeout
+        while True:
+            job = self.get_job(job_id)
+            if job["status"] == "done":
+                return job["result"]
+            if job["status"] == "failed":
+                raise ApiError(f"Job {job_id} failed: {job.get('error')}")
+            if time.monotonic() + poll_interval > give_up_at:
+                raise ApiError(f"Job {job_id} did not finish within {timeout:.0f}s")
+            time.sleep(poll_interval)
+
+    def explain(self, case_id, deadline=None):
+        """
+        Fetch the Grad-CAM explanation of a case predicted with ``explain="true"``.
+
+        Returns:
+            dict: Disease, confidence, coarse heatmap and base64 PNG ``overlay``
+        """
+        return self.request("GET", f"/explain/{case_id}", deadline=deadline).json()
+
+    def health(self, deadline=5.0):
+        """Return the backend health status"""
+        return self.request("GET", "/health", deadline=deadline).json()
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncApiClient:
+    """
+    asyncio front-end for ApiClient.
+
+    Requests run on a bounded thread pool sharing one connection pool, so
+    coroutines can fan out many uploads without blocking the event loop.
+    """
+
+    def __init__(self, client=None, max_concurrency=8):
+        self.client = client or ApiClient(pool_size=max(max_concurrency, 1))
+        self.max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_concurrency))
+
+    async def predict(self, image_data, **kwargs):
+        """Awaitable version of ApiClient.predict"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: self.client.predict(image_data, **kwargs))
+
+    async def predict_many(self, images, max_concurrency=None, **kwargs):
+        """
+        Diagnose many images with at most ``max_concurrency`` uploads in flight.
+
+        Returns:
+            list: Result dicts or ApiError instances, in input order
+        """
+        semaphore = asyncio.Semaphore(max_concurrency or self.max_concurrency)
+
+        async def one(data):
+            async with semaphore:
+                try:
+                    return await self.predict(data, **kwargs)
+                except ApiError as e:
+                    return e
+
+        return await asyncio.gather(*(one(data) for data in images))
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.client.close()
+
+
+def _parse_retry_after(response):
+    value = response.headers.get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the process-wide client for BACKEND_API_URL"""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = ApiClient()
+        return _default_client
@@ -4,11 +4,19 @@ Dash app initialization module.
 
 import dash
 import dash_bootstrap_components as dbc
+import diskcache
+
+from frontend.config import FRONTEND_CACHE_DIR
+
+# Slow callbacks (analysis, PDF download) run in worker processes managed
+# through this cache, so they never tie up the web server's request threads
+background_callback_manager = dash.DiskcacheManager(diskcache.Cache(FRONTEND_CACHE_DIR))
 
 app = dash.Dash(__name__, 
                 external_stylesheets=[dbc.themes.FLATLY, 
                                       dbc.icons.FONT_AWESOME],
-                suppress_callback_exceptions=True)
+                suppress_callback_exceptions=True,
+                background_callback_manager=background_callback_manager)
 
 app.index_string = '''
 <!DOCTYPE html>
@@ -6,18 +6,26 @@ from dash import Input, Output, State, callback, html, dcc
 import dash_bootstrap_components as dbc
 from dash.exceptions import PreventUpdate
 import base64
+import time
 from io import BytesIO
 from PIL import Image
 
 from frontend.utils import (
     parse_image_content,
-    get_image_details,
+    inspect_image_content,
+    make_thumbnail,
+    make_thumbnail_bytes,
+    generate_batch_report,
+    prepare_upload,
+    format_bytes,
     api_predict,
     format_treatment_points,
     get_severity,
     get_spread_risk,
     get_treatment_cost
 )
+from frontend.api_client import get_client
+from frontend.config import BATCH_MAX_CONCURRENCY
 
 
 def register_callbacks(app):
@@ -42,14 +50,15 @@ def register_callbacks(app):
             return None, True
         
         try:
-            decoded = parse_image_content(content)
+            width, height, img_format, img_size = inspect_image_content(content)
             
-            width, height, img_format, img_size = get_image_details(decoded)
+            # Send a small preview back instead of echoing the full upload
+            thumbnail = make_thumbnail(parse_image_content(content))
             
             return [
                 dbc.Row([
                     dbc.Col([
-                        html.Img(src=content, 
+                        html.Img(src=thumbnail, 
                                className="img-preview",
                                style={'width': '100%', 'borderRadius': '12px'})
                     ], width=7),
@@ -93,20 +102,46 @@ def register_callbacks(app):
          Output('results-container', 'style'),
          Output('tips-card', 'style')],
         [Input('analyze-button', 'n_clicks')],
-        [State('upload-image', 'contents')]
+        [State('upload-image', 'contents')],
+        background=True,
+        running=[
+            (Output('analyze-button', 'disabled'), True, False),
+            (Output('analysis-progress-container', 'style'), {'display': 'block'}, {'display': 'none'})
+        ],
+        progress=[Output('analysis-progress', 'value'), Output('analysis-status', 'children')],
+        cancel=[Input('cancel-analysis', 'n_clicks')],
+        prevent_initial_call=True
     )
-    def analyze_image(n_clicks, content):
+    def analyze_image(set_progress, n_clicks, content):
         """
         Analyze the uploaded image when the analyze button is clicked.
+        
+        Runs as a background callback in a worker process, so a slow backend
+        does not hold a frontend request thread; progress is reported to the
+        UI and the Cancel button stops the job.
         """
         if n_clicks is None or n_clicks == 0 or content is None:
             raise PreventUpdate
         
         try:
+            start = time.perf_counter()
+            set_progress((10, "Preparing image..."))
             decoded = parse_image_content(content)
+            upload_data, upload_stats = prepare_upload(decoded)
             
             try:
-                result = api_predict(decoded)
+                set_progress((40, f"Analyzing {format_bytes(upload_stats['upload_bytes'])} image..."))
+                result = api_predict(upload_data)
+                elapsed = time.perf_counter() - start
+                set_progress((90, "Preparing results..."))
+                
+                saved = upload_stats["original_bytes"] - upload_stats["upload_bytes"]
+                upload_summary = (
+                    f"Uploaded {format_bytes(upload_stats['upload_bytes'])} "
+                    f"of {format_bytes(upload_stats['original_bytes'])} "
+                    f"({saved / upload_stats['original_bytes']:.0%} saved) · "
+                    f"analysis took {elapsed:.2f}s"
+                )
                 
                 disease = result['disease']
                 recommendation = result['recommendation']
@@ -183,7 +218,10 @@ def register_callbacks(app):
                                                 ])
                                             ], className="h-100 result-metrics-card")
                                         ], width=4)
-                                    ], className="mb-3")
+                                    ], className="mb-3"),
+                                    
+                                    html.P([html.I(className="fas fa-tachometer-alt me-2"), upload_summary],
+                                           className="text-muted small mb-0")
                                 ])
                             ], label="Diagnosis", tab_id="tab-diagnosis", className="fancy-tab"),
                             
@@ -301,7 +339,15 @@ def register_callbacks(app):
     @callback(
         Output('download-pdf', 'data'),
         Input('download-report', 'n_clicks'),
-        [State('upload-image', 'contents')]
+        [State('upload-image', 'contents')],
+        background=True,
+        running=[
+            (Output('download-report', 'disabled'), True, False),
+            (Output('download-report', 'children'),
+             [html.I(className="fas fa-spinner fa-spin me-2"), "Preparing PDF Report..."],
+             [html.I(className="fas fa-file-download me-2"), "Download PDF Report"])
+        ],
+        prevent_initial_call=True
     )
     def download_pdf(n_clicks, content):
         """
@@ -312,7 +358,8 @@ def register_callbacks(app):
         
         try:
             decoded = parse_image_content(content)
-            result = api_predict(decoded)
+            upload_data, _ = prepare_upload(decoded)
+            result = api_predict(upload_data)
             
             disease = result['disease']
             recommendation = result['recommendation']
@@ -399,4 +446,125 @@ def register_callbacks(app):
             return dict(
                 content=f"Error generating PDF: {str(e)}",
                 filename="error_report.txt"
-            ) 
\ No newline at end of file
+            ) 
+    
+    @callback(
+        [Output('batch-gallery', 'children'),
+         Output('analyze-all-button', 'disabled')],
+        [Input('upload-batch', 'contents')],
+        [State('upload-batch', 'filename')]
+    )
+    def update_gallery(contents, filenames):
+        """
+        Show thumbnails of the images selected for batch analysis.
+        """
+        if not contents:
+            return None, True
+        
+        tiles = []
+        for content, filename in zip(contents, filenames):
+            try:
+                thumbnail = make_thumbnail(parse_image_content(content), max_side=160)
+                tiles.append(html.Img(src=thumbnail, title=filename, className="img-preview",
+                                      style={"height": "96px", "borderRadius": "8px"}))
+            except Exception:
+                tiles.append(dbc.Badge(f"{filename}: unreadable", color="danger", className="p-2"))
+        
+        return tiles, False
+
+    @callback(
+        [Output('batch-results-store', 'data'),
+         Output('download-batch-report', 'disabled')],
+        [Input('analyze-all-button', 'n_clicks')],
+        [State('upload-batch', 'contents'),
+         State('upload-batch', 'filename')],
+        background=True,
+        running=[
+            (Output('analyze-all-button', 'disabled'), True, False),
+            (Output('batch-progress-container', 'style'), {'display': 'block'}, {'display': 'none'})
+        ],
+        progress=[Output('batch-results', 'data'),
+                  Output('batch-progress', 'value'),
+                  Output('batch-status', 'children')],
+        cancel=[Input('cancel-batch', 'n_clicks')],
+        prevent_initial_call=True
+    )
+    def analyze_all(set_progress, n_clicks, contents, filenames):
+        """
+        Analyze every uploaded image with bounded parallelism, filling the
+        results table as each diagnosis arrives.
+        """
+        if not n_clicks or not contents:
+            raise PreventUpdate
+        
+        rows = [{"file": filename, "disease": None, "confidence": None,
+                 "severity": None, "status": "Queued", "recommendation": None}
+                for filename in filenames]
+        set_progress((rows, 0, f"Preparing {len(rows)} images..."))
+        
+        uploads = []
+        for row, content in zip(rows, contents):
+            try:
+                upload_data, _ = prepare_upload(parse_image_content(content))
+                uploads.append(upload_data)
+            except Exception as e:
+                uploads.append(None)
+                row["status"] = f"Error: {str(e)}"
+        
+        indexes = [i for i, data in enumerate(uploads) if data is not None]
+        done = len(rows) - len(indexes)
+        client = get_client()
+        # The bulk lane keeps batch uploads from delaying single-image analysis
+        results = client.predict_many([uploads[i] for i in indexes],
+                                      max_concurrency=BATCH_MAX_CONCURRENCY, priority="bulk")
+        for position, result, error in results:
+            row = rows[indexes[position]]
+            if error is not None:
+                row["status"] = f"Error: {str(error)}"
+            else:
+                row.update({
+                    "disease": result['disease'],
+                    "confidence": round(result.get('confidence', 0), 1),
+                    "severity": get_severity(result['disease']),
+                    "status": "Done",
+                    "recommendation": result.get('recommendation')
+                })
+            done += 1
+            set_progress((rows, done * 100 / len(rows), f"{done} of {len(rows)} images analyzed"))
+        
+        return rows, False
+
+    @callback(
+        Output('download-batch-pdf', 'data'),
+        Input('download-batch-report', 'n_clicks'),
+        [State('batch-results-store', 'data'),
+         State('upload-batch', 'contents')],
+        background=True,
+        running=[
+            (Output('download-batch-report', 'disabled'), True, False)
+        ],
+        prevent_initial_call=True
+    )
+    def download_batch_report(n_clicks, rows, contents):
+        """
+        Download one PDF report covering every image in the batch.
+        """
+        if not n_clicks or not rows:
+            raise PreventUpdate
+        
+        try:
+            entries = []
+            for row, content in zip(rows, contents or [None] * len(rows)):
+                entry = dict(row)
+                try:
+                    entry["thumbnail"] = make_thumbnail_bytes(parse_image_content(content), max_side=240)
+                except Exception:
+                    entry["thumbnail"] = None
+                entries.append(entry)
+            
+            return dcc.send_bytes(generate_batch_report(entries), "crop_disease_batch_report.pdf")
+        except Exception as e:
+            return dict(
+                content=f"Error generating PDF: {str(e)}",
+                filename="error_report.txt"
+            )
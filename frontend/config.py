@@ -0,0 +1,26 @@
+"""
+Configuration for the frontend application, read from the environment and .env.
+"""
+
+import os
+import pathlib
+import tempfile
+from dotenv import load_dotenv
+
+base_dir = pathlib.Path(__file__).parent.parent
+load_dotenv(os.path.join(base_dir, ".env"))
+
+BACKEND_API_URL = os.getenv("BACKEND_API_URL", "http://localhost:5000")
+
+# Uploads are downscaled so their longest side is at most this many pixels
+# before being sent to the backend (0 disables). The model only needs 224px,
+# but the PDF report renders the image at up to 1000px.
+INGEST_MAX_SIDE = int(os.getenv("INGEST_MAX_SIDE", "1024"))
+INGEST_JPEG_QUALITY = int(os.getenv("INGEST_JPEG_QUALITY", "90"))
+
+# Disk cache shared by the background callback worker processes
+FRONTEND_CACHE_DIR = os.getenv("FRONTEND_CACHE_DIR",
+                               os.path.join(tempfile.gettempdir(), "crop_disease_frontend_cache"))
+
+# Uploads in flight at once when analyzing a batch of images
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "4"))
@@ -3,7 +3,7 @@ Layout components for the Dash application.
 """
 
 import dash
-from dash import dcc, html
+from dash import dcc, html, dash_table
 import dash_bootstrap_components as dbc
 
 layout = dbc.Container([
@@ -111,6 +111,18 @@ layout = dbc.Container([
                         className="btn-custom-success w-100 mt-3",
                         size="lg", 
                         disabled=True)
+                    ]),
+                    
+                    html.Div(id='analysis-progress-container', style={'display': 'none'}, children=[
+                        dbc.Progress(id='analysis-progress', value=0, striped=True, animated=True,
+                                     color="success", className="mt-3 progress-custom"),
+                        html.Div([
+                            html.Span(id='analysis-status', className="text-muted small"),
+                            dbc.Button([
+                                html.I(className="fas fa-times me-1"),
+                                "Cancel"
+                            ], id="cancel-analysis", color="link", size="sm", className="text-danger p-0")
+                        ], className="d-flex justify-content-between align-items-center mt-2")
                     ])
                 ])
             ], className="app-card mb-4"),
@@ -155,6 +167,86 @@ layout = dbc.Container([
                     ])
                 ])
             ], className="app-card mb-4", id="tips-card"),
+            
+            dbc.Card([
+                dbc.CardHeader([
+                    html.H3([html.I(className="fas fa-images me-2"), "Batch Analysis"], 
+                           className="mb-0 text-success")
+                ], className="bg-white"),
+                
+                dbc.CardBody([
+                    html.P("Upload several images of a plot and analyze them all at once", 
+                          className="card-text text-muted mb-4"),
+                    
+                    dcc.Upload(
+                        id='upload-batch',
+                        children=html.Div([
+                            html.Div(className="icon-circle", children=[
+                                html.I(className="fas fa-copy fa-2x")
+                            ]),
+                            html.Div("Drag and Drop or Click to Select Multiple Images", 
+                                    style={"fontWeight": "500"}),
+                            html.Div("JPG, PNG or JPEG files accepted", 
+                                    className="text-muted small mt-1")
+                        ]),
+                        className="upload-area mb-4",
+                        multiple=True,
+                        accept='image/*'
+                    ),
+                    
+                    html.Div(id='batch-gallery', className="d-flex flex-wrap gap-2 mb-3"),
+                    
+                    dbc.Button([
+                        html.I(className="fas fa-layer-group me-2"), 
+                        "Analyze All"
+                    ], 
+                    id="analyze-all-button", 
+                    className="btn-custom-success w-100",
+                    size="lg", 
+                    disabled=True),
+                    
+                    html.Div(id='batch-progress-container', style={'display': 'none'}, children=[
+                        dbc.Progress(id='batch-progress', value=0, striped=True, animated=True,
+                                     color="success", className="mt-3 progress-custom"),
+                        html.Div([
+                            html.Span(id='batch-status', className="text-muted small"),
+                            dbc.Button([
+                                html.I(className="fas fa-times me-1"),
+                                "Cancel"
+                            ], id="cancel-batch", color="link", size="sm", className="text-danger p-0")
+                        ], className="d-flex justify-content-between align-items-center mt-2")
+                    ]),
+                    
+                    dash_table.DataTable(
+                        id='batch-results',
+                        columns=[
+                            {"name": "File", "id": "file"},
+                            {"name": "Disease", "id": "disease"},
+                            {"name": "Confidence (%)", "id": "confidence", "type": "numeric"},
+                            {"name": "Severity", "id": "severity"},
+                            {"name": "Status", "id": "status"}
+                        ],
+                        data=[],
+                        sort_action="native",
+                        page_size=20,
+                        style_table={"overflowX": "auto", "marginTop": "20px"},
+                        style_cell={"textAlign": "left", "padding": "8px", "fontFamily": "inherit"},
+                        style_header={"fontWeight": "bold", "backgroundColor": "#f0f7f0"}
+                    ),
+                    
+                    dcc.Store(id='batch-results-store'),
+                    
+                    dbc.Button([
+                        html.I(className="fas fa-file-download me-2"), 
+                        "Download Combined Report"
+                    ], 
+                    id="download-batch-report", 
+                    className="btn-custom-primary w-100 mt-4",
+                    size="lg",
+                    disabled=True),
+                    dcc.Download(id="download-batch-pdf")
+                ])
+            ], className="app-card mb-4"),
 
             html.Footer([
                 html.P([
@@ -4,9 +4,12 @@ Utility functions for the frontend application.
 
 import base64
 import io
-from PIL import Image
-import requests
+from PIL import ExifTags, Image, ImageOps
 from datetime import datetime
+from xml.sax.saxutils import escape
+
+from frontend.api_client import get_client
+from frontend.config import INGEST_MAX_SIDE, INGEST_JPEG_QUALITY
 
 
 def parse_image_content(content):
@@ -41,26 +44,146 @@ def get_image_details(decoded_data):
     return width, height, img_format, img_size
 
 
-def api_predict(image_data, api_url="http://localhost:5000/predict"):
+def inspect_image_content(content, header_bytes=64 * 1024):
+    """
+    Get image details from a base64 data URL without decoding all of it.
+    
+    Only a prefix of the data is decoded, which is enough for PIL to read
+    the dimensions and format from the file header. The prefix is enlarged
+    when the header does not fit, e.g. JPEGs with large EXIF blocks.
+    
+    Args:
+        content (str): Base64 data URL from dcc.Upload
+        header_bytes (int): Bytes decoded on the first attempt
+        
+    Returns:
+        tuple: (width, height, format, size_kb)
+    """
+    content_type, content_string = content.split(',', 1)
+    padding = len(content_string) - len(content_string.rstrip('='))
+    size_kb = (len(content_string) * 3 // 4 - padding) / 1024
+    
+    prefix_bytes = header_bytes
+    while True:
+        # Whole 4-character groups decode to whole 3-byte groups
+        prefix = content_string[:(prefix_bytes // 3) * 4]
+        try:
+            with Image.open(io.BytesIO(base64.b64decode(prefix))) as img:
+                width, height = img.size
+                return width, height, img.format, size_kb
+        except Exception:
+            if len(prefix) >= len(content_string):
+                raise
+            prefix_bytes *= 8
+
+
+def make_thumbnail(decoded_data, max_side=480, quality=80):
+    """make_thumbnail_bytes() as a base64 data URL for html.Img"""
+    thumbnail = make_thumbnail_bytes(decoded_data, max_side, quality)
+    return "data:image/jpeg;base64," + base64.b64encode(thumbnail).decode("ascii")
+
+
+def make_thumbnail_bytes(decoded_data, max_side=480, quality=80):
+    """
+    Create a small JPEG preview of an image.
+    
+    Args:
+        decoded_data (bytes): Decoded image data
+        max_side (int): Maximum width/height of the thumbnail in pixels
+        quality (int): JPEG quality
+        
+    Returns:
+        bytes: Encoded JPEG thumbnail
+    """
+    img = Image.open(io.BytesIO(decoded_data))
+    img.draft("RGB", (max_side, max_side))
+    img = ImageOps.exif_transpose(img).convert("RGB")
+    img.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+    
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def prepare_upload(decoded_data, max_side=INGEST_MAX_SIDE, quality=INGEST_JPEG_QUALITY):
+    """
+    Downscale and re-encode an image before sending it to the API.
+    
+    JPEGs are decoded at a reduced scale directly by the decoder and the
+    result is re-encoded as JPEG. The EXIF orientation is carried over rather
+    than applied, so the backend rotates every upload the same way. The original
+    bytes are kept when they are already small enough or re-encoding would
+    not make them smaller.
+    
+    Args:
+        decoded_data (bytes): Decoded image data
+        max_side (int): Maximum width/height in pixels (0 disables downscaling)
+        quality (int): JPEG quality for the re-encoded image
+        
+    Returns:
+        tuple: (upload_bytes, stats) where stats holds original_bytes,
+            upload_bytes, original_size and upload_size
+    """
+    stats = {
+        "original_bytes": len(decoded_data),
+        "upload_bytes": len(decoded_data),
+        "original_size": None,
+        "upload_size": None
+    }
+    
+    img = Image.open(io.BytesIO(decoded_data))
+    stats["original_size"] = stats["upload_size"] = img.size
+    if max_side <= 0 or (max(img.size) <= max_side and img.format == "JPEG"):
+        return decoded_data, stats
+    
+    # Only affects JPEGs: decode at the smallest 1/2, 1/4 or 1/8 scale that
+    # still covers max_side, which skips most of the decoding work
+    img.draft("RGB", (max_side, max_side))
+    exif = Image.Exif()
+    orientation = img.getexif().get(ExifTags.Base.Orientation)
+    if orientation:
+        exif[ExifTags.Base.Orientation] = orientation
+    img = img.convert("RGB")
+    img.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+    
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=quality, exif=exif)
+    upload_data = buffer.getvalue()
+    if len(upload_data) >= len(decoded_data):
+        return decoded_data, stats
+    
+    stats["upload_bytes"] = len(upload_data)
+    stats["upload_size"] = img.size
+    return upload_data, stats
+
+
+def format_bytes(num_bytes):
+    """
+    Format a byte count for display.
+    
+    Args:
+        num_bytes (int): Number of bytes
+        
+    Returns:
+        str: Human readable size, e.g. "8.4 MB"
+    """
+    if num_bytes >= 1024 * 1024:
+        return f"{num_bytes / (1024 * 1024):.1f} MB"
+    return f"{num_bytes / 1024:.0f} KB"
+
+
+def api_predict(image_data, api_url=None):
     """
     Send the image to the API for prediction.
     
     Args:
         image_data (bytes): Decoded image data
-        api_url (str): URL of the prediction API
+        api_url (str): URL of the prediction API (default: BACKEND_API_URL/predict)
         
     Returns:
         dict: API response as dictionary
     """
-    response = requests.post(
-        api_url,
-        files={"image": image_data}
-    )
-    
-    if response.status_code == 200:
-        return response.json()
-    else:
-        raise Exception(f"API request failed with status code {response.status_code}")
+    return get_client().predict(image_data, url=api_url)
 
 
 def get_current_timestamp():
@@ -154,4 +277,96 @@ def get_treatment_cost(disease):
         "Cassava Green Mottle (CGM)": "Low",
         "Cassava Mosaic Disease (CMD)": "Medium"
     }
-    return treatment_cost_map.get(disease, "Medium") 
\ No newline at end of file
+    return treatment_cost_map.get(disease, "Medium")
+
+
+def generate_batch_report(entries):
+    """
+    Build one PDF report covering a batch of analyzed images.
+    
+    Args:
+        entries (list): Dicts with file, disease, confidence, severity,
+            recommendation, status and thumbnail (JPEG bytes or None)
+        
+    Returns:
+        bytes: PDF data
+    """
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.units import inch
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image as RLImage
+    
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    styles = getSampleStyleSheet()
+    elements = [
+        Paragraph("Crop Disease Batch Analysis Report", styles["Title"]),
+        Paragraph(f"Generated: {get_current_timestamp()} · {len(entries)} images", styles["BodyText"]),
+        Spacer(1, 0.25 * inch)
+    ]
+    
+    analyzed = [e for e in entries if e.get("disease")]
+    counts = {}
+    for entry in analyzed:
+        counts[entry["disease"]] = counts.get(entry["disease"], 0) + 1
+    
+    elements.append(Paragraph("Summary", styles["Heading2"]))
+    summary = [["Disease", "Images", "Share"]] + [
+        [disease, str(count), f"{count / len(analyzed):.0%}"]
+        for disease, count in sorted(counts.items(), key=lambda item: -item[1])
+    ]
+    failed = len(entries) - len(analyzed)
+    if failed:
+        summary.append(["Not analyzed", str(failed), ""])
+    elements.append(_report_table(summary))
+    elements.append(Spacer(1, 0.25 * inch))
+    
+    elements.append(Paragraph("Images", styles["Heading2"]))
+    rows = [["Image", "File", "Disease", "Confidence", "Severity"]]
+    for entry in entries:
+        thumbnail = ""
+        if entry.get("thumbnail"):
+            with Image.open(io.BytesIO(entry["thumbnail"])) as img:
+                aspect = img.height / float(img.width)
+            thumbnail = RLImage(io.BytesIO(entry["thumbnail"]), width=inch, height=inch * aspect)
+        confidence = entry.get("confidence")
+        rows.append([
+            thumbnail,
+            # Paragraph parses its text as markup; file names and API text are not
+            Paragraph(escape(entry.get("file") or ""), styles["BodyText"]),
+            Paragraph(escape(entry.get("disease") or entry.get("status") or ""), styles["BodyText"]),
+            f"{confidence:.1f}%" if confidence is not None else "",
+            entry.get("severity") or ""
+        ])
+    col_widths = [1.2 * inch, 1.6 * inch, 2.2 * inch, 0.9 * inch, 0.8 * inch]
+    elements.append(_report_table(rows, col_widths=col_widths))
+    
+    recommendations = {}
+    for entry in analyzed:
+        if entry.get("recommendation"):
+            recommendations.setdefault(entry["disease"], entry["recommendation"])
+    if recommendations:
+        elements.append(Spacer(1, 0.25 * inch))
+        elements.append(Paragraph("Treatment Recommendations", styles["Heading2"]))
+        for disease, recommendation in recommendations.items():
+            elements.append(Paragraph(escape(disease), styles["Heading3"]))
+            for point in format_treatment_points(recommendation):
+                elements.append(Paragraph(f"• {escape(point)}", styles["BodyText"]))
+    
+    doc.build(elements)
+    return buffer.getvalue()
+
+
+def _report_table(rows, col_widths=None):
+    """Build a reportlab table with a highlighted header row"""
+    from reportlab.lib import colors
+    from reportlab.platypus import Table, TableStyle
+    
+    table = Table(rows, colWidths=col_widths, repeatRows=1)
+    table.setStyle(TableStyle([
+        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#2C8C40")),
+        ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
+        ("GRID", (0, 0), (-1, -1), 0.25, colors.lightgrey),
+        ("VALIGN", (0, 0), (-1, -1), "MIDDLE")
+    ]))
+    return table
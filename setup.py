@@ -5,7 +5,7 @@ setup(
     version="0.1",
     packages=find_packages(),
     install_requires=[
-        "flask",
+        "flask>=3.1",
         "flask-cors",
         "torch",
         "torchvision",
@@ -15,7 +15,8 @@ setup(
         "reportlab",
         "python-dotenv",
         "python-dateutil",
-        "dash",
+        "safetensors",
+        "dash[diskcache]",
         "dash-bootstrap-components",
         "requests"
     ],